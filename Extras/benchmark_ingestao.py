@@ -0,0 +1,381 @@
+# benchmark_ingestao.py
+# Benchmark da ingestão e da análise: gera um histórico sintético (com o gerador de dados),
+# reproduz as leituras em uma taxa configurável pelos mesmos caminhos usados em produção
+# e mede vazão, latência da chegada até a classificação e o pico de memória (RSS).
+#
+# Exemplos (a partir da raiz do projeto):
+#   python Extras/benchmark_ingestao.py --historico 1000000 --mensagens 20000
+#   python Extras/benchmark_ingestao.py --dispositivos 8 --entrada fila --taxa 2000 --json base.json
+#   python Extras/benchmark_ingestao.py --entrada mqtt --binario --amostras-por-quadro 32
+#   python Extras/benchmark_ingestao.py --broker localhost:1883 --mensagens 50000
+#   python Extras/benchmark_ingestao.py --comparar base.json --tolerancia 0.2
+
+import argparse
+import copy
+import json
+import logging
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from collections import deque
+from pathlib import Path
+
+import numpy as np
+
+RAIZ = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import backend  # noqa: E402
+from app_config import load_config  # noqa: E402
+from gerador_de_dados import gerar_historico, montar_quadro_binario  # noqa: E402
+
+# Métricas comparadas com --comparar: (nome, True se maior é melhor)
+METRICAS_COMPARADAS = [
+    ('vazao_msgs_s', True),
+    ('latencia_p50_ms', False),
+    ('latencia_p99_ms', False),
+    ('analise_media_s', False),
+    ('inicializacao_s', False),
+    ('pico_rss_mb', False),
+]
+
+
+def pico_rss_mb():
+    """Pico de memória residente do processo (MB); None se a plataforma não informar."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KB; macOS, em bytes
+    return pico / (1024 * 1024) if sys.platform == 'darwin' else pico / 1024
+
+
+def preparar_config(args, diretorio):
+    """Copia o config.yaml apontando arquivos, segmentos e checkpoints para o diretório temporário."""
+    config = copy.deepcopy(load_config(args.config))
+    config['files']['unified_csv'] = str(diretorio / 'dados_historicos_unificados.csv')
+    config.setdefault('storage', {})['directory'] = str(diretorio / 'dados_segmentos')
+    config.setdefault('checkpoint', {})['directory'] = str(diretorio / 'checkpoint')
+    config['mqtt']['topic'] = 'sentinela_benchmark/+/dados_csv'
+    if args.broker:
+        host, _, porta = args.broker.partition(':')
+        config['mqtt']['broker_address'] = host
+        config['mqtt']['port'] = int(porta or 1883)
+    ingestao = config.setdefault('ingestion', {})
+    # Com descarte, a correspondência envio -> gravação usada na latência se perderia
+    ingestao['overflow'] = 'block'
+    ingestao['block_timeout_seconds'] = 60
+    ingestao['stats_log_interval_seconds'] = 0
+    config.setdefault('devices', {})['ids'] = []
+    # Métricas ligadas como em produção, mas sem servidor HTTP nem log periódico
+    config['metrics'] = {'enabled': not args.sem_metricas, 'http': {'enabled': False}, 'log_interval_seconds': 0}
+    if not args.analise_em_segundo_plano:
+        # A análise é medida à parte, depois da reprodução
+        config['analysis'] = dict(config.get('analysis', {}), min_new_rows=10 ** 12, interval_seconds=10 ** 9)
+    return config
+
+
+def preencher_historico(config, dispositivos, n_linhas, semente, intervalo=10.0, lote=200_000):
+    """Grava `n_linhas` de histórico por dispositivo diretamente no armazenamento (antes da inicialização)."""
+    import pandas as pd
+    import storage
+    # O histórico termina agora; as leituras reproduzidas vêm depois dele
+    inicio_historico = pd.Timestamp.now().floor('s') - pd.Timedelta(seconds=n_linhas * intervalo)
+    for i, device_id in enumerate(dispositivos):
+        armazenamento = storage.create_storage(backend.device_config(config, device_id))
+        for parte in range(0, n_linhas, lote):
+            inicio = inicio_historico + pd.Timedelta(seconds=parte * intervalo)
+            df = gerar_historico(min(lote, n_linhas - parte), inicio=inicio, intervalo=intervalo,
+                                 semente=semente + i * 1000 + parte)
+            linhas = df.astype(object).where(df.notna(), None).to_dict('records')
+            armazenamento.append(linhas)
+        armazenamento.close()
+
+
+def gerar_mensagens(args, dispositivos):
+    """Mensagens a reproduzir, intercaladas entre os dispositivos: (tópico, payload, nº de linhas)."""
+    por_dispositivo = []
+    for i, device_id in enumerate(dispositivos):
+        topico = f'sentinela_benchmark/{device_id}/dados_csv'
+        df = gerar_historico(args.mensagens, inicio=None, intervalo=1.0, intervalo_api=0, semente=args.semente + i)
+        valores = df[['Temperatura_C', 'Umidade_Relativa_percent', 'Concentracao_Geral_PPM']].to_numpy()
+        if args.binario:
+            id_numerico = zlib.crc32(device_id.encode())
+            instantes = (df['Timestamp'].astype('int64') // 10 ** 6).to_numpy()
+            amostras = [(seq + 1, int(ts), *linha) for seq, (ts, linha) in enumerate(zip(instantes, valores))]
+            n = max(1, min(args.amostras_por_quadro, 255))
+            mensagens = [(topico, montar_quadro_binario(id_numerico, amostras[j:j + n]), len(amostras[j:j + n]))
+                         for j in range(0, len(amostras), n)]
+        else:
+            mensagens = [(topico, f"{t},{u},{g}", 1) for t, u, g in valores.tolist()]
+        por_dispositivo.append(mensagens)
+    intercaladas = []
+    for grupo in zip(*por_dispositivo):
+        intercaladas.extend(grupo)
+    return intercaladas
+
+
+class RegistroLatencias:
+    """Associa cada envio à gravação correspondente (ordem FIFO por tópico) e mede a latência."""
+    def __init__(self):
+        self.pendentes = {}
+        self.latencias = []
+        self.linhas = 0
+        self._lock = threading.Lock()
+
+    def enviado(self, topico, n_linhas):
+        with self._lock:
+            self.pendentes.setdefault(topico, deque()).append((time.perf_counter(), n_linhas))
+
+    def gravado(self, rows_by_topic):
+        """Chamado depois da gravação: classificação e previsão já foram atualizadas."""
+        fim = time.perf_counter()
+        with self._lock:
+            for topico, linhas in rows_by_topic.items():
+                restantes = len(linhas)
+                fila = self.pendentes.get(topico, deque())
+                while restantes > 0 and fila:
+                    enviado_em, n = fila.popleft()
+                    restantes -= n
+                    self.latencias.append(fim - enviado_em)
+                self.linhas += len(linhas)
+
+
+def instrumentar(hub, dispositivos, registro):
+    """
+    Mede a latência na gravação efetiva de cada dispositivo: as leituras podem
+    ficar retidas no buffer de reordenação depois que commit_batch retorna.
+    """
+    for device_id in dispositivos:
+        sentinela = hub.device(device_id)
+        topico = f'sentinela_benchmark/{device_id}/dados_csv'
+
+        def commit_medido(rows, original=sentinela._commit_rows, topico=topico):
+            original(rows)
+            registro.gravado({topico: rows})
+
+        sentinela._commit_rows = commit_medido
+
+
+def aguardar_gravacao(registro, esperadas, timeout):
+    """Espera até que todas as linhas enviadas tenham sido gravadas (ou o timeout)."""
+    limite = time.monotonic() + timeout
+    while registro.linhas < esperadas and time.monotonic() < limite:
+        time.sleep(0.01)
+    if registro.linhas < esperadas:
+        logging.warning(f"Apenas {registro.linhas} de {esperadas} linha(s) gravadas em {timeout}s.")
+
+
+def ritmo(taxa):
+    """Gerador que espera o necessário para manter `taxa` mensagens por segundo (0 = sem limite)."""
+    inicio = time.perf_counter()
+    i = 0
+    while True:
+        if taxa > 0:
+            espera = inicio + i / taxa - time.perf_counter()
+            if espera > 0:
+                time.sleep(espera)
+        yield
+        i += 1
+
+
+def reproduzir_fila(hub, config, mensagens, taxa, registro, timeout):
+    """Caminho de produção em processo: fila limitada -> consumidor em lotes -> DeviceHub."""
+    from ingestion import IngestionWorker
+    worker = IngestionWorker(config.get('ingestion', {}), hub.commit_batch)
+    worker.start()
+    inicio = time.perf_counter()
+    for (topico, payload, n), _ in zip(mensagens, ritmo(taxa)):
+        registro.enviado(topico, n)
+        worker.submit(topico, payload)
+    worker.stop()
+    aguardar_gravacao(registro, sum(n for _, _, n in mensagens), timeout)
+    return time.perf_counter() - inicio, worker.stats()
+
+
+def reproduzir_direto(hub, mensagens, taxa, entrada, registro, timeout):
+    """Chamadas síncronas a process_mqtt_message ou save_data_to_csv."""
+    inicio = time.perf_counter()
+    for (topico, payload, n), _ in zip(mensagens, ritmo(taxa)):
+        sentinela = hub.device(backend.device_id_from_topic(hub.topic, topico))
+        registro.enviado(topico, n)
+        if entrada == 'mqtt':
+            sentinela.process_mqtt_message(topico, payload)
+        else:
+            temperatura, umidade, gas = (float(v) for v in payload.split(','))
+            sentinela.save_data_to_csv({'Temperatura_C': temperatura, 'Umidade_Relativa_percent': umidade,
+                                        'Concentracao_Geral_PPM': gas})
+    aguardar_gravacao(registro, sum(n for _, _, n in mensagens), timeout)
+    return time.perf_counter() - inicio, {}
+
+
+def reproduzir_broker(hub, config, mensagens, taxa, registro, timeout):
+    """Publica em um broker local e recebe pelo MQTTClient do backend (inclui a rede e o paho)."""
+    import paho.mqtt.client as mqtt
+    assinante = backend.MQTTClient(config, hub)
+    assinante.start()
+    publicador = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1)
+    publicador.connect(config['mqtt']['broker_address'], config['mqtt']['port'], 60)
+    publicador.loop_start()
+    time.sleep(1.0)  # Tempo para a assinatura ser confirmada
+    qos = config['mqtt'].get('qos', 0)
+    esperadas = sum(n for _, _, n in mensagens)
+    inicio = time.perf_counter()
+    for (topico, payload, n), _ in zip(mensagens, ritmo(taxa)):
+        registro.enviado(topico, n)
+        publicador.publish(topico, payload, qos=qos)
+    aguardar_gravacao(registro, esperadas, timeout)
+    duracao = time.perf_counter() - inicio
+    publicador.loop_stop()
+    publicador.disconnect()
+    assinante.stop()
+    return duracao, assinante.ingestion.stats()
+
+
+def medir_analise(hub, repeticoes):
+    """Tempo de run_analysis (retreino completo) de cada dispositivo, em série."""
+    duracoes = []
+    for sentinela in hub.devices().values():
+        for _ in range(repeticoes):
+            sentinela.forecaster.is_trained = False  # Força o reajuste do Holt-Winters
+            sentinela.training_policy.last_trained_timestamp = None
+            inicio = time.perf_counter()
+            sentinela.run_analysis()
+            duracoes.append(time.perf_counter() - inicio)
+    return duracoes
+
+
+def executar(args):
+    diretorio = Path(args.diretorio) if args.diretorio else Path(tempfile.mkdtemp(prefix='sentinela_bench_'))
+    diretorio.mkdir(parents=True, exist_ok=True)
+    config = preparar_config(args, diretorio)
+    dispositivos = [f'bench{i:02d}' for i in range(args.dispositivos)]
+    resultado = {'parametros': {k: v for k, v in vars(args).items() if k not in ('json', 'comparar')}}
+    try:
+        if args.historico:
+            inicio = time.perf_counter()
+            preencher_historico(config, dispositivos, args.historico, args.semente)
+            resultado['preenchimento_s'] = time.perf_counter() - inicio
+            print(f"Histórico: {args.historico} linha(s) por dispositivo gravadas em {resultado['preenchimento_s']:.1f}s")
+
+        inicio = time.perf_counter()
+        hub = backend.DeviceHub(config)
+        for device_id in dispositivos:
+            hub.device(device_id)
+        resultado['inicializacao_s'] = time.perf_counter() - inicio
+
+        mensagens = gerar_mensagens(args, dispositivos)
+        registro = RegistroLatencias()
+        instrumentar(hub, dispositivos, registro)
+        if args.broker:
+            duracao, estatisticas = reproduzir_broker(hub, config, mensagens, args.taxa, registro, args.timeout)
+        elif args.entrada == 'fila':
+            duracao, estatisticas = reproduzir_fila(hub, config, mensagens, args.taxa, registro, args.timeout)
+        else:
+            duracao, estatisticas = reproduzir_direto(hub, mensagens, args.taxa, args.entrada, registro, args.timeout)
+
+        latencias = np.array(registro.latencias) * 1000
+        resultado.update({
+            'mensagens': len(mensagens),
+            'linhas': registro.linhas,
+            'duracao_s': duracao,
+            'vazao_msgs_s': len(mensagens) / duracao if duracao > 0 else None,
+            'vazao_linhas_s': registro.linhas / duracao if duracao > 0 else None,
+            'latencia_p50_ms': float(np.percentile(latencias, 50)) if latencias.size else None,
+            'latencia_p99_ms': float(np.percentile(latencias, 99)) if latencias.size else None,
+            'latencia_max_ms': float(latencias.max()) if latencias.size else None,
+            'ingestao': estatisticas,
+        })
+        if estatisticas.get('descartadas'):
+            logging.warning("Houve descartes na fila: as latências medidas não são confiáveis.")
+
+        if args.repeticoes_analise:
+            duracoes = medir_analise(hub, args.repeticoes_analise)
+            resultado['analise_media_s'] = float(np.mean(duracoes))
+            resultado['analise_max_s'] = float(np.max(duracoes))
+        resultado['pico_rss_mb'] = pico_rss_mb()
+        hub.shutdown()
+    finally:
+        if not args.manter and not args.diretorio:
+            shutil.rmtree(diretorio, ignore_errors=True)
+    return resultado
+
+
+def imprimir(resultado):
+    print("--- Resultado do benchmark ---")
+    for chave in ('inicializacao_s', 'mensagens', 'linhas', 'duracao_s', 'vazao_msgs_s', 'vazao_linhas_s',
+                  'latencia_p50_ms', 'latencia_p99_ms', 'latencia_max_ms', 'analise_media_s', 'analise_max_s',
+                  'pico_rss_mb'):
+        valor = resultado.get(chave)
+        if valor is not None:
+            print(f"{chave:>18}: {valor:.3f}" if isinstance(valor, float) else f"{chave:>18}: {valor}")
+    if resultado.get('ingestao'):
+        print(f"{'ingestao':>18}: {resultado['ingestao']}")
+
+
+def comparar(resultado, referencia, tolerancia):
+    """Lista as métricas que pioraram mais que `tolerancia` (fração) em relação à referência."""
+    regressoes = []
+    for nome, maior_melhor in METRICAS_COMPARADAS:
+        atual, base = resultado.get(nome), referencia.get(nome)
+        if atual is None or not base:
+            continue
+        variacao = (atual - base) / base
+        if (variacao < -tolerancia) if maior_melhor else (variacao > tolerancia):
+            regressoes.append(f"{nome}: {base:.3f} -> {atual:.3f} ({variacao:+.0%})")
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de ingestão e análise do Sentinela Verde.")
+    parser.add_argument('--config', default=str(RAIZ / 'config.yaml'))
+    parser.add_argument('--historico', type=int, default=0,
+                        help="Linhas de histórico por dispositivo gravadas antes da inicialização (ex.: 10000 a 10000000).")
+    parser.add_argument('--mensagens', type=int, default=10000, help="Leituras reproduzidas por dispositivo.")
+    parser.add_argument('--dispositivos', type=int, default=1)
+    parser.add_argument('--taxa', type=float, default=0, help="Mensagens por segundo (0 = o mais rápido possível).")
+    parser.add_argument('--entrada', choices=('fila', 'mqtt', 'csv'), default='fila',
+                        help="fila: IngestionWorker + DeviceHub; mqtt: process_mqtt_message; csv: save_data_to_csv.")
+    parser.add_argument('--broker', help="HOST[:PORTA] de um broker local; usa o MQTTClient do backend.")
+    parser.add_argument('--timeout', type=float, default=120, help="Espera máxima pela gravação das mensagens.")
+    parser.add_argument('--binario', action='store_true', help="Envia quadros binários em vez de texto.")
+    parser.add_argument('--amostras-por-quadro', type=int, default=1)
+    parser.add_argument('--repeticoes-analise', type=int, default=1,
+                        help="Execuções de run_analysis por dispositivo após a reprodução (0 = não mede).")
+    parser.add_argument('--analise-em-segundo-plano', action='store_true',
+                        help="Mantém o agendador de retreinamento ativo durante a reprodução.")
+    parser.add_argument('--sem-metricas', action='store_true',
+                        help="Desliga a instrumentação (para medir o custo das métricas).")
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--diretorio', help="Diretório de trabalho (padrão: temporário, removido ao final).")
+    parser.add_argument('--manter', action='store_true', help="Não remove o diretório temporário.")
+    parser.add_argument('--json', help="Grava o resultado neste arquivo.")
+    parser.add_argument('--comparar', help="Resultado JSON de referência; sai com código 1 se houver regressão.")
+    parser.add_argument('--tolerancia', type=float, default=0.2)
+    parser.add_argument('--log', default='WARNING', help="Nível de log durante o benchmark.")
+    args = parser.parse_args()
+    if args.entrada == 'csv' and args.binario:
+        parser.error("--binario não se aplica à entrada csv.")
+
+    logging.basicConfig(level=args.log.upper(), format='%(asctime)s - %(levelname)s - %(name)s - %(message)s')
+    resultado = executar(args)
+    imprimir(resultado)
+    if args.json:
+        Path(args.json).write_text(json.dumps(resultado, indent=2, default=str), encoding='utf-8')
+    if args.comparar:
+        regressoes = comparar(resultado, json.loads(Path(args.comparar).read_text(encoding='utf-8')), args.tolerancia)
+        if regressoes:
+            print("Regressões em relação à referência:")
+            for linha in regressoes:
+                print(f"  {linha}")
+            sys.exit(1)
+        print("Nenhuma regressão acima da tolerância.")
+
+
+if __name__ == "__main__":
+    main()
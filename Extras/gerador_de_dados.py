@@ -3,11 +3,19 @@
 # É útil para testar o backend e o frontend sem precisar do dispositivo físico.
 
 import paho.mqtt.client as mqtt
+import argparse
+import struct
 import time
 import random
 import yaml
+import zlib
 from pathlib import Path
 
+# Quadro binário v2 (mesmo layout de ingestion.py): cabeçalho "SV" | versão | nº de amostras | id do
+# dispositivo, seguido de amostras seq | timestamp em ms | temperatura | umidade | gás (little-endian).
+FORMATO_CABECALHO = '<2sBBI'
+FORMATO_AMOSTRA = '<IQfff'
+
 def load_mqtt_config():
     """Carrega as configurações do MQTT do arquivo config.yaml."""
     config_path = Path('config.yaml')
@@ -30,10 +38,56 @@ def connect_mqtt(config):
         print(f"ERRO: Não foi possível conectar ao broker MQTT em {config['broker_address']}:{config['port']}. Verifique sua conexão. Erro: {e}")
         return None
 
+def montar_quadro_binario(device_id, amostras):
+    """Empacota as amostras (seq, timestamp em ms, temp, umid, gás) em um quadro binário."""
+    cabecalho = struct.pack(FORMATO_CABECALHO, b'SV', 2, len(amostras), device_id)
+    return cabecalho + b''.join(struct.pack(FORMATO_AMOSTRA, *amostra) for amostra in amostras)
+
+def gerar_historico(n_linhas, inicio=None, intervalo=10.0, intervalo_api=900.0, semente=None):
+    """
+    Gera `n_linhas` leituras sintéticas de uma vez (vetorizado), com as mesmas faixas
+    do simulador: temperatura 20-35°C, umidade 40-70% e gás com 10% de picos ruins.
+    A cada `intervalo_api` segundos a linha também traz PM2.5/PM10, como os dados do
+    WAQI. Usado pelo benchmark (Extras/benchmark_ingestao.py) para montar históricos
+    de 10 mil a 10 milhões de linhas.
+    """
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(semente)
+    inicio = pd.Timestamp(inicio) if inicio is not None else pd.Timestamp.now().floor('s') - pd.Timedelta(seconds=n_linhas * intervalo)
+    segundos = np.arange(n_linhas) * intervalo
+    # Ciclo diário suave somado ao ruído, para que as médias horárias tenham sazonalidade
+    fase = 2 * np.pi * segundos / 86400.0
+    temperatura = np.clip(27.5 + 6.0 * np.sin(fase) + rng.normal(0, 1.0, n_linhas), 20.0, 35.0)
+    umidade = np.clip(55.0 - 12.0 * np.sin(fase) + rng.normal(0, 2.0, n_linhas), 40.0, 70.0)
+    ruim = rng.random(n_linhas) < 0.1
+    concentracao = np.where(ruim, rng.uniform(350.0, 800.0, n_linhas), rng.uniform(50.0, 250.0, n_linhas))
+    df = pd.DataFrame({
+        'Timestamp': inicio + pd.to_timedelta(segundos, unit='s'),
+        'Concentracao_Geral_PPM': concentracao.round(2),
+        'Temperatura_C': temperatura.round(2),
+        'Umidade_Relativa_percent': umidade.round(2),
+    })
+    if intervalo_api:
+        com_api = (segundos % intervalo_api) < intervalo
+        df['PM2.5_ug_m3'] = np.where(com_api, rng.gamma(4.0, 4.0, n_linhas).round(1), np.nan)
+        df['PM10_ug_m3'] = np.where(com_api, rng.gamma(4.0, 8.0, n_linhas).round(1), np.nan)
+    return df
+
 def generate_and_publish_data():
     """
     Gera dados simulados de sensores e os publica no tópico MQTT.
     """
+    parser = argparse.ArgumentParser(description="Simulador do Sentinela Verde.")
+    # Com um tópico coringa (ex.: "sentinela/+/dados_csv"), o '+' é substituído pelo ID do dispositivo
+    parser.add_argument('dispositivo', nargs='?', default='esp01', help="ID do dispositivo simulado.")
+    parser.add_argument('--binario', action='store_true', help="Envia quadros binários em vez de texto.")
+    parser.add_argument('--amostras-por-quadro', type=int, default=1,
+                        help="No modo binário, acumula N leituras antes de publicar (máx. 255).")
+    parser.add_argument('--intervalo', type=float, default=10, help="Segundos entre leituras.")
+    args = parser.parse_args()
+
     mqtt_config = load_mqtt_config()
     client = connect_mqtt(mqtt_config)
     
@@ -42,8 +96,13 @@ def generate_and_publish_data():
 
     client.loop_start()
     
+    topic = mqtt_config['topic'].replace('+', args.dispositivo)
+    id_numerico = zlib.crc32(args.dispositivo.encode())
+    seq = 0
+    acumuladas = []
+
     print("--- Iniciando o Gerador de Dados para Teste ---")
-    print(f"Enviando dados para o tópico: '{mqtt_config['topic']}'")
+    print(f"Enviando dados para o tópico: '{topic}'")
     print("Pressione CTRL+C para parar.")
 
     try:
@@ -60,20 +119,31 @@ def generate_and_publish_data():
             else:
                  concentracao = round(random.uniform(50.0, 250.0), 2) # Qualidade boa
 
-            # Formata a mensagem no mesmo padrão do Arduino: "temp,umid,gas"
-            payload = f"{temperatura},{umidade},{concentracao}"
+            if args.binario:
+                seq += 1
+                acumuladas.append((seq, int(time.time() * 1000), temperatura, umidade, concentracao))
+                if len(acumuladas) < min(args.amostras_por_quadro, 255):
+                    time.sleep(args.intervalo)
+                    continue
+                payload = montar_quadro_binario(id_numerico, acumuladas)
+                descricao = f"quadro binário com {len(acumuladas)} leitura(s), {len(payload)} bytes"
+                acumuladas = []
+            else:
+                # Formata a mensagem no mesmo padrão do Arduino: "temp,umid,gas,timestamp"
+                payload = f"{temperatura},{umidade},{concentracao},{time.time():.3f}"
+                descricao = f"temp={temperatura}°C, umid={umidade}%, gas_ppm={concentracao}"
 
             # Publica a mensagem
-            result = client.publish(mqtt_config['topic'], payload)
+            result = client.publish(topic, payload)
             
             # Verifica se a publicação foi bem-sucedida
             if result.rc == mqtt.MQTT_ERR_SUCCESS:
-                print(f"-> Dados enviados: temp={temperatura}°C, umid={umidade}%, gas_ppm={concentracao}")
+                print(f"-> Dados enviados: {descricao}")
             else:
                 print(f"Falha ao enviar dados. Código de erro: {result.rc}")
 
-            # Espera 10 segundos antes de enviar o próximo dado
-            time.sleep(10)
+            # Espera antes de enviar o próximo dado (10 segundos por padrão)
+            time.sleep(args.intervalo)
 
     except KeyboardInterrupt:
         print("\n--- Gerador de Dados encerrado ---")
@@ -1,52 +1,219 @@
-# api_client.py (versão que usa token passado como argumento)
+# api_client.py (cliente compartilhado da API do WAQI)
 # -*- coding: utf-8 -*-
 
-import requests
-import pandas as pd
-from datetime import datetime
-import os
 import logging
-from pathlib import Path
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Optional
+from urllib.parse import quote
 
+import metrics
 
 # A configuração de logging agora será feita pelo backend.
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = "https://api.waqi.info"
+DEFAULT_TOKEN = os.getenv("WAQI_API_TOKEN", "845535b9a4be3918e97e326f4c550afad64b21d5")
+
 
-def fetch_air_quality_data(cidade: str, token: str) -> dict:
+class WAQIError(Exception):
+    """A API respondeu, mas com status diferente de "ok" (ex.: cidade desconhecida)."""
+
+
+class WAQIClient:
     """
-    Busca os dados de qualidade do ar (PM2.5, PM10) para uma cidade, usando o token fornecido.
+    Cliente único da API do WAQI.
+
+    - Uma `requests.Session` com pool de conexões reaproveita as conexões HTTP;
+    - O feed de cada cidade fica em cache por `cache_ttl` segundos;
+    - Falhas de rede, 429 e 5xx são repetidas até `retries` vezes com espera
+      exponencial e jitter (`backoff * 2**tentativa`, sorteada entre 0 e esse valor);
+    - `fetch_many` consulta várias cidades em paralelo em um pool de threads.
+
+    `base_url` pode apontar para um servidor local de testes.
     """
-    logging.info(f"Buscando dados de PM2.5 e PM10 para a cidade: {cidade}...")
-    url = f"https://api.waqi.info/feed/{cidade}/?token={token}"
+    RETRY_STATUS = (429, 500, 502, 503, 504)
 
-    try:
-        response = requests.get(url, timeout=1)
-        response.raise_for_status()
-        data = response.json()
+    def __init__(self, token: str = DEFAULT_TOKEN, base_url: str = DEFAULT_BASE_URL, timeout: float = 5.0,
+                 cache_ttl: float = 300.0, retries: int = 3, backoff: float = 0.5, max_workers: int = 8):
+        self.token = token
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        self.retries = retries
+        self.backoff = backoff
+        self.max_workers = max_workers
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._cache: Dict[str, tuple] = {}
+        self._cache_lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
 
+    @classmethod
+    def from_config(cls, api_conf: dict) -> 'WAQIClient':
+        return cls(
+            token=api_conf.get('token') or DEFAULT_TOKEN,
+            base_url=api_conf.get('base_url', DEFAULT_BASE_URL),
+            timeout=api_conf.get('timeout_seconds', 5.0),
+            cache_ttl=api_conf.get('cache_ttl_seconds', 300.0),
+            retries=api_conf.get('retries', 3),
+            backoff=api_conf.get('backoff_seconds', 0.5),
+            max_workers=api_conf.get('max_workers', 8),
+        )
+
+    @property
+    def session(self):
+        # requests é importado sob demanda para não pesar na inicialização
+        with self._session_lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                self._session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=self.max_workers)
+                self._session.mount('http://', adapter)
+                self._session.mount('https://', adapter)
+            return self._session
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        with self._session_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="WAQI")
+            return self._executor
+
+    def _get_json(self, url: str) -> dict:
+        import requests
+        tentativa = 0
+        while True:
+            try:
+                with metrics.span('waqi_fetch'):
+                    response = self.session.get(url, params={'token': self.token}, timeout=self.timeout)
+                if response.status_code in self.RETRY_STATUS and tentativa < self.retries:
+                    raise requests.exceptions.HTTPError(f"HTTP {response.status_code}", response=response)
+                response.raise_for_status()
+                return response.json()
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                    requests.exceptions.HTTPError) as e:
+                status = e.response.status_code if e.response is not None else None
+                if tentativa >= self.retries or (status is not None and status not in self.RETRY_STATUS):
+                    metrics.incr('waqi_errors')
+                    raise
+                espera = random.uniform(0, self.backoff * 2 ** tentativa)
+                tentativa += 1
+                metrics.incr('waqi_retries')
+                logger.warning(f"WAQI: falha na requisição ({e}); tentativa {tentativa}/{self.retries} "
+                               f"em {espera:.2f}s.")
+                time.sleep(espera)
+
+    def fetch_feed(self, city: str) -> dict:
+        """Retorna o campo `data` do feed da cidade (do cache, se ainda válido)."""
+        chave = city.strip().lower()
+        agora = time.monotonic()
+        with self._cache_lock:
+            entrada = self._cache.get(chave)
+            if entrada is not None and agora - entrada[0] < self.cache_ttl:
+                metrics.incr('waqi_cache_hits')
+                return entrada[1]
+        metrics.incr('waqi_cache_misses')
+        data = self._get_json(f"{self.base_url}/feed/{quote(chave)}/")
         if data.get("status") != "ok":
-            logging.error(f"API retornou um erro: {data.get('data', 'Erro desconhecido')}")
+            raise WAQIError(data.get('data', 'Erro desconhecido'))
+        with self._cache_lock:
+            self._cache[chave] = (time.monotonic(), data["data"])
+        return data["data"]
+
+    def fetch_feed_async(self, city: str) -> Future:
+        """Consulta o feed no pool de threads do cliente, sem bloquear quem chama."""
+        return self.executor.submit(self.fetch_feed, city)
+
+    def fetch_air_quality_data(self, city: str) -> Dict[str, Any]:
+        """Retorna os poluentes disponíveis ({'PM2.5_ug_m3': ..., 'PM10_ug_m3': ...}); {} em caso de erro."""
+        logger.info(f"Buscando dados de PM2.5 e PM10 para a cidade: {city}...")
+        try:
+            feed = self.fetch_feed(city)
+        except WAQIError as e:
+            logger.error(f"API retornou um erro: {e}")
+            return {}
+        except Exception as e:
+            logger.error(f"Erro de conexão ao tentar acessar a API: {e}")
             return {}
+        return _poluentes(feed, city)
 
-        iaqi = data["data"].get("iaqi", {})
-        dados_poluentes = {
-            'PM2.5_ug_m3': iaqi.get('pm25', {}).get('v'),
-            'PM10_ug_m3': iaqi.get('pm10', {}).get('v'),
-        }
-
-        dados_validos = {k: v for k, v in dados_poluentes.items() if v is not None}
-        if dados_validos:
-            logging.info(f"Dados da API externa recebidos com sucesso: {dados_validos}")
-        else:
-            logging.warning("A API não retornou dados de PM2.5 ou PM10 para a cidade.")
-
-        return dados_validos
-
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Erro de conexão ao tentar acessar a API: {e}")
-        return {}
-    except Exception as e:
-        logging.error(f"Ocorreu um erro inesperado ao processar os dados da API: {e}")
-        return {}
-
-# A função de salvar no CSV foi movida para o backend para centralizar o controle.
-# O bloco if __name__ == "__main__": foi removido, pois este script agora é apenas um módulo.
+    def fetch_many(self, cities: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Consulta várias cidades em paralelo; retorna {cidade: poluentes}."""
+        cidades = list(dict.fromkeys(cities))
+        futuros = {cidade: self.executor.submit(self.fetch_air_quality_data, cidade) for cidade in cidades}
+        return {cidade: futuro.result() for cidade, futuro in futuros.items()}
+
+    def clear_cache(self):
+        with self._cache_lock:
+            self._cache.clear()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        if self._session is not None:
+            self._session.close()
+
+
+def _poluentes(feed: dict, city: str) -> Dict[str, Any]:
+    iaqi = feed.get("iaqi", {})
+    dados_poluentes = {
+        'PM2.5_ug_m3': iaqi.get('pm25', {}).get('v'),
+        'PM10_ug_m3': iaqi.get('pm10', {}).get('v'),
+    }
+    dados_validos = {k: v for k, v in dados_poluentes.items() if v is not None}
+    if dados_validos:
+        logger.info(f"Dados da API externa recebidos com sucesso ({city}): {dados_validos}")
+    else:
+        logger.warning(f"A API não retornou dados de PM2.5 ou PM10 para a cidade {city}.")
+    return dados_validos
+
+
+_shared_client: Optional[WAQIClient] = None
+# Clientes para tokens diferentes do compartilhado, reaproveitados entre as chamadas
+_token_clients: Dict[str, WAQIClient] = {}
+_shared_lock = threading.Lock()
+
+
+def configure(api_conf: dict) -> WAQIClient:
+    """Cria o cliente compartilhado a partir da seção `api` do config."""
+    global _shared_client
+    with _shared_lock:
+        if _shared_client is not None:
+            _shared_client.close()
+        for client in _token_clients.values():
+            client.close()
+        _token_clients.clear()
+        _shared_client = WAQIClient.from_config(api_conf)
+        return _shared_client
+
+
+def get_client() -> WAQIClient:
+    """Retorna o cliente compartilhado (com os valores padrão, se `configure` não foi chamado)."""
+    global _shared_client
+    with _shared_lock:
+        if _shared_client is None:
+            _shared_client = WAQIClient()
+        return _shared_client
+
+
+def fetch_air_quality_data(cidade: str, token: Optional[str] = None) -> dict:
+    """
+    Busca os dados de qualidade do ar (PM2.5, PM10) para uma cidade com o cliente compartilhado.
+    """
+    client = get_client()
+    if token and token != client.token:
+        # Um cliente por token: sessão, pool e cache são reaproveitados, não recriados a cada chamada
+        with _shared_lock:
+            client = _token_clients.get(token)
+            if client is None:
+                base = _shared_client
+                client = WAQIClient(token=token, base_url=base.base_url, timeout=base.timeout,
+                                    cache_ttl=base.cache_ttl, retries=base.retries, backoff=base.backoff,
+                                    max_workers=base.max_workers)
+                _token_clients[token] = client
+    return client.fetch_air_quality_data(cidade)
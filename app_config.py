@@ -0,0 +1,40 @@
+# app_config.py (carregamento da configuração e do logging, sem dependências da interface)
+# -*- coding: utf-8 -*-
+
+import logging
+import sys
+from pathlib import Path
+
+import yaml
+
+
+def load_config(config_path='config.yaml') -> dict:
+    """
+    Carrega o arquivo de configuração YAML.
+    Encerra a aplicação se o arquivo não for encontrado.
+    """
+    path = Path(config_path)
+    if not path.exists():
+        print(f"ERRO CRÍTICO: Arquivo de configuração '{config_path}' não encontrado.")
+        print("Por favor, crie o arquivo 'config.yaml' e execute novamente.")
+        sys.exit(1)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return yaml.safe_load(f)
+    except Exception as e:
+        print(f"ERRO CRÍTICO: Falha ao ler o arquivo de configuração '{config_path}': {e}")
+        sys.exit(1)
+
+def setup_logging(config: dict):
+    """
+    Configura o sistema de logging com base no arquivo de configuração.
+    """
+    log_file = config.get('files', {}).get('log_file', 'sentinela_verde.log')
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - [%(levelname)s] - (%(threadName)-10s) - %(message)s',
+        handlers=[
+            logging.FileHandler(log_file, mode='w', encoding='utf-8'),
+            logging.StreamHandler(sys.stdout)
+        ]
+    )
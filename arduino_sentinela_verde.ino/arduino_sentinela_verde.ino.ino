@@ -4,6 +4,7 @@
 #include <WiFi.h>          // Biblioteca para funcionalidades Wi-Fi do ESP32.
 #include <PubSubClient.h>  // Biblioteca para comunicação via protocolo MQTT.
 #include <DHT.h>           // Biblioteca para o sensor de temperatura e umidade DHT.
+#include <sys/time.h>      // gettimeofday: horário com milissegundos (após o ajuste por NTP).
 
 // ==============================================================================
 // 2. CONFIGURAÇÕES - EDITE ESTAS LINHAS CONFORME NECESSÁRIO
@@ -13,6 +14,11 @@ const char* password = "ArduinoTeste";  // <-- COLOQUE AQUI A SENHA DA SUA REDE
 const char* mqtt_server = "test.mosquitto.org"; // Broker MQTT público para testes.
 const char* mqtt_topic = "sentinela/dados_csv";   // Tópico ÚNICO para enviar todos os dados.
 
+// --- Formato do Payload ---
+// 0 = texto "temp,umid,gas[,timestamp]" (padrão); 1 = quadro binário compacto (ver ingestion.py no backend).
+#define USE_BINARY_PAYLOAD 0
+const uint32_t device_numeric_id = 1; // Identificador numérico gravado no cabeçalho do quadro binário.
+
 // --- Pinos dos Sensores ---
 #define DHT_PIN 13          // Pino digital onde o sensor DHT11 está conectado.
 #define DHT_TYPE DHT11      // Define o tipo do sensor DHT (pode ser DHT22, etc.).
@@ -27,6 +33,22 @@ DHT dht(DHT_PIN, DHT_TYPE);     // Inicializa o objeto do sensor DHT.
 
 unsigned long lastMsg = 0; // Variável para armazenar o tempo da última mensagem enviada.
                            // Usada para criar um intervalo não-bloqueante (sem usar delay()).
+uint32_t sequencia = 0;    // Número de sequência das leituras (usado pelo backend para descartar repetições).
+
+// Layout do quadro binário (little-endian, sem preenchimento): cabeçalho + N amostras.
+struct __attribute__((packed)) CabecalhoQuadro {
+  char magic[2];      // "SV"
+  uint8_t versao;     // 2
+  uint8_t amostras;   // Número de amostras no quadro
+  uint32_t device_id;
+};
+struct __attribute__((packed)) AmostraQuadro {
+  uint32_t seq;
+  uint64_t timestamp_ms; // Milissegundos desde 1970 (0 = sem relógio; o backend usa a hora de chegada)
+  float temperatura;
+  float umidade;
+  float gas_ppm;
+};
 
 // ==============================================================================
 // 4. FUNÇÃO SETUP - EXECUTADA UMA ÚNICA VEZ QUANDO O ESP32 LIGA
@@ -37,6 +59,9 @@ void setup() {
   
   // Chama a função para configurar e conectar ao Wi-Fi.
   setup_wifi();
+
+  // Sincroniza o relógio por NTP (UTC) para enviar o horário de cada leitura.
+  configTime(0, 0, "pool.ntp.org");
   
   // Configura o cliente MQTT com o endereço e porta do broker.
   client.setServer(mqtt_server, 1883);
@@ -77,10 +102,36 @@ void loop() {
     // Esta é uma conversão SIMPLES e LINEAR. Para precisão, uma calibração é necessária.
     float concentracao_geral_ppm = map(gas_analog, 0, 4095, 10, 1000);
 
+    // --- Horário da leitura ---
+    // Só é enviado com o relógio já ajustado; sem ele, o backend usa a hora de chegada.
+    struct timeval tv;
+    gettimeofday(&tv, nullptr);
+    bool relogio_valido = tv.tv_sec > 1600000000;
+    uint64_t agora_ms = (uint64_t)tv.tv_sec * 1000 + tv.tv_usec / 1000;
+
+#if USE_BINARY_PAYLOAD
+    // --- Quadro binário com uma amostra (24 bytes de dados + 8 de cabeçalho) ---
+    uint8_t quadro[sizeof(CabecalhoQuadro) + sizeof(AmostraQuadro)];
+    CabecalhoQuadro cabecalho = {{'S', 'V'}, 2, 1, device_numeric_id};
+    AmostraQuadro amostra = {++sequencia, relogio_valido ? agora_ms : 0,
+                             temp, humid, concentracao_geral_ppm};
+    memcpy(quadro, &cabecalho, sizeof(cabecalho));
+    memcpy(quadro + sizeof(cabecalho), &amostra, sizeof(amostra));
+    if (!client.publish(mqtt_topic, quadro, sizeof(quadro))) {
+        Serial.println("Falha ao publicar mensagem MQTT.");
+    }
+    return;
+#endif
+
     // --- Criação do Payload (Carga de Dados) ---
     // Concatena todos os valores em uma única String, separados por vírgula.
-    // Exemplo de resultado: "25.50,60.80,450.00"
+    // Exemplo de resultado: "25.50,60.80,450.00,1735689600.123" (o horário vai só com o relógio ajustado)
     String payload = String(temp) + "," + String(humid) + "," + String(concentracao_geral_ppm);
+    if (relogio_valido) {
+      char horario[24];
+      snprintf(horario, sizeof(horario), ",%ld.%03ld", (long)tv.tv_sec, (long)(tv.tv_usec / 1000));
+      payload += horario;
+    }
     
     // --- Publicação no Tópico MQTT ---
     // Publica a String 'payload' no tópico definido. O '.c_str()' converte a String do Arduino para o formato C.
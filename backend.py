@@ -7,31 +7,78 @@ from datetime import datetime
 import logging
 import warnings
 from pathlib import Path
-from typing import Dict, Optional, Any, Callable
+from typing import Dict, List, Optional, Any, Callable
 import sys
-import paho.mqtt.client as mqtt
 import threading
 import time
 import yaml
+import copy
+import re
+from concurrent.futures import Executor, ThreadPoolExecutor
 
 # Módulos do projeto e de terceiros
 import api_client
-from sklearn.tree import DecisionTreeClassifier
-from sklearn.preprocessing import LabelEncoder
-from statsmodels.tsa.holtwinters import ExponentialSmoothing
-import matplotlib.pyplot as plt
-import matplotlib
-matplotlib.use('Agg')
+import metrics
+import storage
+from scheduler import AnalysisScheduler
+from timeseries import TimeSeriesStore
+from cache import VersionedCache
+from holtwinters import BatchHoltWinters, OnlineHoltWinters, forecast_frame
+from model_selection import NON_SEASONAL, HoltWintersConfig, ModelSelector, fit_holt_winters
+from tree_inference import CompiledTree
+from training import TrainingPolicy
+from checkpoint import Checkpoint
+from changefeed import ChangeFeed, DashboardSnapshot, ForecastQuality, freeze
+from summary import RollingSummary, format_summary
+from ingestion import (IngestionWorker, ReorderBuffer, decode_sensor_frame, frame_to_rows, is_binary_frame,
+                       parse_sensor_payload)
+# scikit-learn, statsmodels e paho-mqtt são importados sob demanda (no primeiro treino
+# ou na criação do cliente MQTT) para acelerar a inicialização do serviço.
 
 warnings.filterwarnings('ignore', category=FutureWarning)
 logger = logging.getLogger(__name__)
 
+# Dispositivo usado quando o tópico MQTT não identifica o sensor (tópico sem '+')
+DEFAULT_DEVICE = 'default'
+_DEVICE_ID_RE = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+def device_id_from_topic(pattern: str, topic: str) -> Optional[str]:
+    """
+    Extrai o ID do dispositivo do nível `+` do padrão de assinatura
+    (ex.: `sentinela/+/dados_csv` e `sentinela/esp01/dados_csv` -> `esp01`).
+    Retorna `DEFAULT_DEVICE` para padrões sem `+` e None para IDs inválidos.
+    """
+    niveis_padrao = pattern.split('/')
+    if '+' not in niveis_padrao:
+        return DEFAULT_DEVICE
+    niveis = topic.split('/')
+    if len(niveis) != len(niveis_padrao):
+        return None
+    device_id = niveis[niveis_padrao.index('+')]
+    return device_id if _DEVICE_ID_RE.match(device_id) else None
+
+
+def device_config(config: dict, device_id: str) -> dict:
+    """Cópia do config com armazenamento, CSV e checkpoint particionados pelo dispositivo."""
+    if device_id == DEFAULT_DEVICE:
+        return config
+    conf = copy.deepcopy(config)
+    csv_path = Path(conf['files']['unified_csv'])
+    conf['files']['unified_csv'] = str(csv_path.with_name(f"{csv_path.stem}_{device_id}{csv_path.suffix}"))
+    storage_conf = conf.setdefault('storage', {})
+    storage_conf['directory'] = str(Path(storage_conf.get('directory', 'dados_segmentos')) / device_id)
+    checkpoint_conf = conf.setdefault('checkpoint', {})
+    checkpoint_conf['directory'] = str(Path(checkpoint_conf.get('directory', 'checkpoint')) / device_id)
+    return conf
+
 class DecisionTreePipeline:
     """Gerencia o treinamento e a predição do modelo de Árvore de Decisão."""
     def __init__(self, config: dict):
         self.config = config
-        self.model = DecisionTreeClassifier(max_depth=5, min_samples_leaf=3)
-        self.encoder = LabelEncoder()
+        self.model = None
+        self.encoder = None
+        self.compiled: Optional[CompiledTree] = None
         self.is_trained = False
 
     def train(self, df: pd.DataFrame) -> bool:
@@ -46,106 +93,346 @@ class DecisionTreePipeline:
             self.is_trained = False
             return False
 
+        from sklearn.tree import DecisionTreeClassifier
+        from sklearn.preprocessing import LabelEncoder
+        self.model = DecisionTreeClassifier(max_depth=5, min_samples_leaf=3)
+        self.encoder = LabelEncoder()
+
         X = df_train[features_cols]
         y_encoded = self.encoder.fit_transform(df_train[target_col])
         
         self.model.fit(X, y_encoded)
+        # Exporta a árvore para arrays planos usados na inferência em tempo real
+        self.compiled = CompiledTree.from_sklearn(self.model, self.encoder)
         self.is_trained = True
         logger.info("IA - Árvore de Decisão: Modelo treinado com sucesso.")
         return True
 
-    def predict(self, features: pd.DataFrame) -> Optional[str]:
-        """Faz uma predição para um novo conjunto de dados."""
+    def restore(self, compiled: CompiledTree):
+        """Restaura uma árvore compilada (ex.: de um checkpoint); a predição não depende do scikit-learn."""
+        self.compiled = compiled
+        self.is_trained = True
+
+    def predict(self, features: Any) -> Optional[str]:
+        """Faz uma predição para uma linha (DataFrame, array ou sequência na ordem de `feature_columns`)."""
         if not self.is_trained:
             return "IA não treinada"
-        
-        prediction_encoded = self.model.predict(features)
-        return self.encoder.inverse_transform(prediction_encoded)[0]
+
+        if isinstance(features, pd.DataFrame):
+            features = features.to_numpy(dtype=np.float64)[-1]
+        return self.compiled.predict_row(features)
+
+    def predict_batch(self, X: np.ndarray) -> np.ndarray:
+        """Classifica um lote de linhas (n, n_features) de uma só vez."""
+        if not self.is_trained:
+            return np.full(len(X), "IA não treinada", dtype=object)
+        return self.compiled.predict_batch(X)
 
 class Forecaster:
     """Gerencia o treinamento e a previsão de séries temporais."""
     def __init__(self, config: dict):
         self.config = config
         self.models: Dict[str, Any] = {}
+        # Estado incremental (nível, tendência, sazonalidade) de cada modelo ajustado
+        self.states: Dict[str, OnlineHoltWinters] = {}
         self.is_trained = False
 
-    def train(self, df: pd.DataFrame):
-        """Treina um modelo para cada coluna alvo, com fallback para modelo não-sazonal."""
+    def train(self, df: pd.DataFrame, configs: Optional[Dict[str, HoltWintersConfig]] = None):
+        """
+        Treina um modelo para cada coluna alvo, com fallback para modelo não-sazonal.
+
+        `configs` traz a estrutura escolhida pelo `ModelSelector` para cada coluna;
+        colunas sem escolha usam sazonalidade aditiva de `seasonal_periods` horas.
+        """
+        if self.config.get('engine', 'statsmodels') == 'vectorized':
+            self._train_vectorized(df)
+            return
+        padrao = HoltWintersConfig(seasonal='add', seasonal_periods=self.config.get('seasonal_periods', 12))
+        configs = configs or {}
         target_cols = self.config['target_columns']
         trained_models = 0
         for col in target_cols:
             series = df[col].dropna()
             if len(series) > 10:
+                config = configs.get(col, padrao)
                 try:
-                    # --- INÍCIO DA CORREÇÃO ---
-                    # Tenta primeiro o modelo completo com sazonalidade
-                    model = ExponentialSmoothing(
-                        series, 
-                        trend='add', 
-                        seasonal='add', 
-                        seasonal_periods=12
-                    ).fit()
+                    model = fit_holt_winters(series, config)
                     self.models[col] = model
+                    self.states[col] = OnlineHoltWinters.from_results(model)
                     trained_models += 1
-                    logger.info(f"IA - Previsão: Modelo SAZONAL treinado para '{col}'.")
+                    logger.info(f"IA - Previsão: Modelo treinado para '{col}' ({config.describe()}).")
                 except ValueError:
                     # Se falhar (ex: por falta de dados), tenta um modelo mais simples sem sazonalidade
                     logger.warning(f"IA - Previsão: Modelo sazonal falhou para '{col}'. Tentando modelo não-sazonal mais simples.")
                     try:
-                        model = ExponentialSmoothing(
-                            series, 
-                            trend='add', 
-                            seasonal=None # Remove a sazonalidade
-                        ).fit()
+                        model = fit_holt_winters(series, NON_SEASONAL)
                         self.models[col] = model
+                        self.states[col] = OnlineHoltWinters.from_results(model)
                         trained_models += 1
                         logger.info(f"IA - Previsão: Modelo NÃO-SAZONAL treinado para '{col}'.")
                     except Exception as e_simple:
                         logger.error(f"IA - Previsão: Falha ao treinar até mesmo o modelo simples para '{col}'. Erro: {e_simple}")
                 except Exception as e:
                     logger.error(f"IA - Previsão: Erro inesperado ao treinar modelo para '{col}'. Erro: {e}")
-                    # --- FIM DA CORREÇÃO ---
-        
+
         if trained_models > 0:
             self.is_trained = True
             logger.info(f"IA - Previsão: {trained_models} modelo(s) de série temporal treinado(s).")
         else:
             logger.warning("IA - Previsão: Nenhum modelo de previsão foi treinado.")
 
+    def _train_vectorized(self, df: pd.DataFrame):
+        """Ajusta todas as colunas alvo de uma só vez com o BatchHoltWinters."""
+        target_cols = [col for col in self.config['target_columns'] if df[col].count() > 10]
+        if not target_cols:
+            logger.warning("IA - Previsão: Nenhum modelo de previsão foi treinado.")
+            return
+        engine = BatchHoltWinters(
+            seasonal_periods=self.config.get('seasonal_periods', 12),
+            grid_size=self.config.get('grid_size', 8),
+            n_jobs=self.config.get('n_jobs', 1),
+        )
+        # Descarta as horas iniciais em que alguma série ainda não tinha observações
+        df_series = df[target_cols].loc[df[target_cols].notna().all(axis=1).idxmax():]
+        self.states = engine.fit(df_series)
+        self.is_trained = True
+        logger.info(f"IA - Previsão: {len(self.states)} modelo(s) ajustado(s) pelo motor vetorizado.")
+
+    def update(self, df: pd.DataFrame) -> int:
+        """Atualiza o estado dos modelos com as horas posteriores ao último ajuste, sem reajustá-los."""
+        updates = 0
+        for col, state in self.states.items():
+            novas = df[col][df.index > state.last_timestamp].dropna()
+            for timestamp, valor in novas.items():
+                state.update(float(valor), timestamp)
+                updates += 1
+        return updates
+
+    def needs_refit(self) -> bool:
+        """Indica se é hora de um ajuste completo (periódico ou por desvio dos resíduos)."""
+        if not self.is_trained:
+            return True
+        refit_hours = self.config.get('refit_interval_hours', 24)
+        drift_factor = self.config.get('residual_drift_factor', 4.0)
+        return any(
+            state.updates_since_fit >= refit_hours or state.is_drifting(drift_factor)
+            for state in self.states.values()
+        )
 
     def forecast(self) -> Optional[pd.DataFrame]:
         """Gera previsões para o horizonte definido."""
         if not self.is_trained:
             return None
         
-        horizon = self.config['prediction_horizon_hours']
-        forecast_data = {}
-        # Adiciona um timestamp inicial para o índice da previsão
-        last_known_timestamp = self.models[next(iter(self.models))].series.index[-1]
-        forecast_index = pd.date_range(start=last_known_timestamp, periods=horizon + 1, freq='H')[1:]
-
-        for col, model in self.models.items():
-            forecast_values = model.forecast(horizon)
-            # Garante que os valores tenham o índice correto
-            forecast_data[col] = pd.Series(forecast_values, index=forecast_index)
-
-        return pd.DataFrame(forecast_data)
+        return forecast_frame(self.states, self.config['prediction_horizon_hours'])
+
+
+def assess_forecast(forecast: Optional[pd.DataFrame], limits: Dict[str, float],
+                    decision_tree: Optional[DecisionTreePipeline] = None,
+                    latest: Optional[Dict[str, float]] = None,
+                    feature_columns: Optional[List[str]] = None) -> ForecastQuality:
+    """
+    Classifica todo o horizonte da previsão de uma só vez.
+
+    Uma hora é 'Ruim' se alguma coluna prevista ultrapassar o seu limite em
+    `air_quality_limits` ou se a árvore treinada a classificar como 'Ruim'. As
+    features que não são previstas (temperatura, umidade) usam o último valor
+    observado.
+    """
+    if forecast is None or forecast.empty:
+        return ForecastQuality('Insuficiente')
+    colunas = [col for col in forecast.columns if col in limits]
+    horas = len(forecast)
+    razoes = forecast[colunas].to_numpy(dtype=np.float64) / np.array([limits[col] for col in colunas])
+    razoes = np.where(np.isnan(razoes), -np.inf, razoes).max(axis=1) if colunas else np.full(horas, -np.inf)
+    avaliadas = np.isfinite(razoes)
+    ruins = razoes > 1.0
+
+    if decision_tree is not None and decision_tree.is_trained and feature_columns:
+        latest = latest or {}
+        X = np.column_stack([
+            forecast[col].to_numpy(dtype=np.float64) if col in forecast.columns
+            else np.full(horas, latest.get(col, np.nan))
+            for col in feature_columns
+        ])
+        validas = ~np.isnan(X).any(axis=1)
+        if validas.any():
+            rotulos = decision_tree.predict_batch(X[validas])
+            ruins[np.flatnonzero(validas)[rotulos == 'Ruim']] = True
+            avaliadas |= validas
+
+    if not avaliadas.any():
+        return ForecastQuality('Insuficiente')
+    pior = int(np.argmax(razoes)) if np.isfinite(razoes).any() else None
+    return ForecastQuality(
+        label='Ruim' if ruins.any() else 'Bom',
+        worst_hour=forecast.index[pior] if pior is not None else None,
+        worst_ratio=float(razoes[pior]) if pior is not None else None,
+        first_exceedance=forecast.index[int(np.argmax(ruins))] if ruins.any() else None,
+        hours_exceeding=int(ruins.sum()),
+    )
 
 class SentinelaVerde:
-    """Classe principal que orquestra todo o fluxo de trabalho do backend."""
-    def __init__(self, config: dict):
+    """Classe principal que orquestra todo o fluxo de trabalho do backend de um dispositivo."""
+    def __init__(self, config: dict, device_id: str = DEFAULT_DEVICE, executor: Optional[Executor] = None):
         self.config = config
+        self.device_id = device_id
         self.lock = threading.Lock()
+        self._analysis_lock = threading.Lock()
         self.decision_tree = DecisionTreePipeline(self.config['models']['decision_tree'])
+        tree_conf = self.config['models']['decision_tree']
+        self.training_policy = TrainingPolicy(
+            tree_conf.get('training', {}), tree_conf['feature_columns'], tree_conf['target_column']
+        )
         self.forecaster = Forecaster(self.config['models']['forecasting'])
+        # Estrutura do Holt-Winters de cada coluna, escolhida por validação cruzada em agenda lenta
+        self.model_selector = ModelSelector.from_config(self.config['models']['forecasting'])
+        self._selection_changed = False
+        self._selection_thread: Optional[threading.Thread] = None
         self.df_data: Optional[pd.DataFrame] = None
         self.latest_classification: Optional[str] = "Aguardando..."
-        self.future_forecast: Optional[pd.DataFrame] = None
+        # Versão da previsão: incrementada a cada troca de modelo ou hora aplicada ao estado
+        self.forecast_version = 0
+        # Versão da árvore em uso: a classificação do horizonte depende da previsão e dela
+        self.tree_version = 0
+        self.forecast_cache = VersionedCache()
+        self._forecast_hour_version = -1
         self.last_timestamp: Optional[datetime] = None
-        self.page_update_callback: Optional[Callable[[], None]] = None
+        # Alterações de estado são publicadas como snapshots imutáveis para a interface
+        self.changes = ChangeFeed()
+        self.analysis_version = 0
+        # Instante (epoch) do último ajuste de cada modelo, exposto como idade nas métricas
+        self.trained_at: Dict[str, Optional[float]] = {'arvore': None, 'holt_winters': None}
+        self.storage = storage.create_storage(self.config)
+        self.storage.start()
+        # Histórico residente em memória: o disco só é lido uma vez, na inicialização
+        self.store = TimeSeriesStore(
+            self.config['models']['decision_tree']['feature_columns'],
+            **self.config.get('timeseries', {})
+        )
+        # O retreinamento é agendado em segundo plano; a ingestão apenas notifica o agendador.
+        self.analysis_scheduler = AnalysisScheduler(
+            self.config.get('analysis', {}), self.run_analysis, executor=executor,
+            name="AnalysisWorker" if device_id == DEFAULT_DEVICE else f"Analise-{device_id}"
+        )
+        checkpoint_conf = self.config.get('checkpoint', {})
+        self.checkpoint = Checkpoint(Path(checkpoint_conf.get('directory', 'checkpoint'))) \
+            if checkpoint_conf.get('enabled', True) else None
+        self._last_checkpoint: Optional[float] = None
+        # Leituras fora de ordem são reordenadas em um buffer limitado antes da gravação,
+        # e os dados do WAQI são mesclados à próxima leitura do sensor
+        ingestion_conf = self.config.get('ingestion', {})
+        self.reorder = ReorderBuffer(
+            delay=ingestion_conf.get('reorder_delay_seconds', 0.2),
+            merge_window=ingestion_conf.get('merge_window_seconds', 60.0),
+            max_rows=ingestion_conf.get('reorder_max_rows', 10000),
+        )
+        self._commit_lock = threading.Lock()
+        self._reorder_wake = threading.Event()
+        self._reorder_stop = threading.Event()
+        self._reorder_thread: Optional[threading.Thread] = None
+        if not self.restore_checkpoint():
+            # Horas e dias já rebaixados pela retenção vêm antes das amostras brutas
+            self.store.load_tiers(self.storage.read_tier('hourly'), self.storage.read_tier('daily'))
+            self.store.extend(self.storage.read_frame())
+        # Resumo móvel (1 h/24 h/7 d): recriado das amostras brutas em memória e
+        # atualizado a cada nova amostra aceita pelo TimeSeriesStore
+        self.summary = RollingSummary(
+            self.store.columns, self.config.get('air_quality_limits', {}), **self.config.get('summary', {})
+        )
+        self.summary.load(*self.store.raw_arrays())
+        self.store.add_listener(self.summary)
+        self._register_gauges()
+        self.publish_snapshot()
+        self.analysis_scheduler.start()
+        self._start_reorder_thread()
         # O agendador da API agora é iniciado pelo main_app para garantir que o loop de eventos Flet esteja rodando
         # self.start_api_scheduler() # REMOVIDO DAQUI
 
+    def restore_checkpoint(self) -> bool:
+        """Recarrega modelos e séries do último checkpoint e lê do armazenamento apenas as linhas novas."""
+        if self.checkpoint is None:
+            return False
+        inicio = time.perf_counter()
+        # Somente as séries (os maiores arrays) vêm em memory-map; são copiadas para os anéis
+        sections = self.checkpoint.load(mmap_sections=('series',))
+        if not sections or 'series' not in sections:
+            return False
+        if sections['series']['meta'].get('columns') != self.store.columns:
+            logger.warning("Checkpoint ignorado: as colunas diferem das configuradas.")
+            return False
+
+        rollups_restored = self.store.restore(sections['series']['arrays'])
+        self.trained_at.update(sections['series']['meta'].get('trained_at') or {})
+        tree_section = sections.get('decision_tree')
+        if tree_section:
+            self.decision_tree.restore(CompiledTree.from_state(tree_section['arrays'], tree_section['meta']))
+            self.tree_version += 1
+            last_trained = tree_section['meta'].get('last_trained_timestamp')
+            self.training_policy.last_trained_timestamp = pd.Timestamp(last_trained) if last_trained else None
+        for secao, conteudo in sections.items():
+            if secao.startswith('forecast.'):
+                col = secao[len('forecast.'):]
+                self.forecaster.states[col] = OnlineHoltWinters.from_state(conteudo['arrays'], conteudo['meta'])
+        self.forecaster.is_trained = bool(self.forecaster.states)
+        self.forecast_version += 1
+        if 'model_selection' in sections:
+            self.model_selector.restore(sections['model_selection']['meta'])
+
+        # Recupera o atraso: somente as linhas gravadas depois do checkpoint são lidas
+        latest_timestamp = self.store.latest_timestamp()
+        df_novas = self.storage.read_since(latest_timestamp) if latest_timestamp is not None else self.storage.read_frame()
+        self.store.extend(df_novas)
+        if not rollups_restored:
+            # Checkpoint anterior aos agregados do histórico: recalcula a partir do armazenamento
+            self.store.rebuild_rollups(self.storage.read_frame(), self.storage.read_tier('hourly'),
+                                       self.storage.read_tier('daily'))
+        self.update_forecast_online()
+        self.classify_latest()
+        self._last_checkpoint = time.monotonic()
+        logger.info(f"Checkpoint restaurado em {(time.perf_counter() - inicio) * 1000:.1f} ms "
+                    f"({len(df_novas)} linha(s) nova(s) lida(s) do armazenamento).")
+        return True
+
+    def save_checkpoint(self):
+        """Grava os modelos atuais e as séries em memória no checkpoint."""
+        if self.checkpoint is None:
+            return
+        with self.lock:
+            decision_tree, forecaster = self.decision_tree, self.forecaster
+            sections = {'series': {'arrays': self.store.snapshot(),
+                                   'meta': {'columns': self.store.columns, 'trained_at': dict(self.trained_at)}}}
+            if decision_tree.is_trained:
+                arrays, meta = decision_tree.compiled.to_state()
+                last_trained = self.training_policy.last_trained_timestamp
+                meta['last_trained_timestamp'] = last_trained.isoformat() if last_trained is not None else None
+                sections['decision_tree'] = {'arrays': arrays, 'meta': meta}
+            for col, state in forecaster.states.items():
+                arrays, meta = state.to_state()
+                sections[f'forecast.{col}'] = {'arrays': {k: np.array(v) for k, v in arrays.items()}, 'meta': meta}
+            if self.model_selector.last_attempt is not None:
+                sections['model_selection'] = {'meta': self.model_selector.to_state()}
+        self.checkpoint.save(sections)
+        self._last_checkpoint = time.monotonic()
+        logger.info(f"Checkpoint gravado em {self.checkpoint.directory}.")
+
+    def shutdown(self):
+        """Grava as leituras retidas, para o agendador, grava o checkpoint final e fecha o armazenamento."""
+        self._reorder_stop.set()
+        self._reorder_wake.set()
+        if self._reorder_thread:
+            self._reorder_thread.join(timeout=5)
+        self._release_rows(flush=True)
+        self.analysis_scheduler.stop()
+        self.model_selector.cancel()
+        if self._selection_thread:
+            self._selection_thread.join(timeout=5)
+        try:
+            self.save_checkpoint()
+        except Exception as e:
+            logger.error(f"Falha ao gravar o checkpoint final: {e}")
+        self.storage.close()
+
     def start_api_scheduler(self):
         """Inicia um agendador em background para buscar dados da API."""
         def run_scheduler():
@@ -161,75 +448,159 @@ class SentinelaVerde:
     def fetch_api_data_and_merge(self):
         """Busca dados da API e os salva."""
         try:
-            api_conf = self.config['api']
-            api_data = api_client.fetch_air_quality_data(api_conf['city'], api_conf['token'])
+            api_data = api_client.get_client().fetch_air_quality_data(self.config['api']['city'])
             if api_data:
-                self.save_data_to_csv(api_data)
+                self.save_api_data(api_data)
         except Exception as e:
             logger.error(f"Erro no agendador da API: {e}")
 
-    def process_mqtt_message(self, topic: str, payload: str):
-        try:
-            parts = payload.split(',')
-            if len(parts) != 3: return
-            sensor_data = {
-                'Temperatura_C': float(parts[0]),
-                'Umidade_Relativa_percent': float(parts[1]),
-                'Concentracao_Geral_PPM': float(parts[2]),
-            }
-            self.save_data_to_csv(sensor_data)
-        except (ValueError, IndexError) as e:
-            logger.error(f"Erro ao processar mensagem MQTT: {e}. Payload: '{payload}'")
+    def process_mqtt_message(self, topic: str, payload: Any):
+        """Processa uma mensagem de forma síncrona (texto `temp,umid,gas` ou quadro binário)."""
+        if isinstance(payload, (bytes, bytearray)):
+            if is_binary_frame(payload):
+                try:
+                    _, amostras = decode_sensor_frame(payload)
+                except ValueError as e:
+                    logger.error(f"Erro ao processar quadro binário MQTT: {e}")
+                    return
+                self.save_data_batch(frame_to_rows(amostras, time.time())[0])
+                return
+            payload = payload.decode(errors='replace')
+        sensor_data = parse_sensor_payload(payload)
+        if sensor_data is None:
+            logger.error(f"Erro ao processar mensagem MQTT. Payload: '{payload}'")
+            return
+        # O horário do dispositivo (4º campo do payload), se enviado, prevalece
+        sensor_data.setdefault('Timestamp', datetime.now())
+        self.save_data_batch([sensor_data])
 
     def save_data_to_csv(self, data_dict: Dict[str, Any]):
         """Salva um novo dicionário de dados no CSV, garantindo a ordem das colunas."""
+        data_dict['Timestamp'] = datetime.now()
+        self.save_data_batch([data_dict])
+
+    def save_api_data(self, data_dict: Dict[str, Any]):
+        """
+        Registra os poluentes do WAQI para serem mesclados à próxima leitura do sensor
+        (até `ingestion.merge_window_seconds`), em vez de gravar uma linha à parte.
+        """
+        self.reorder.push_enrichment(datetime.now(), data_dict)
+        self._reorder_wake.set()
+
+    def save_data_batch(self, rows: List[Dict[str, Any]]):
+        """
+        Entrega um lote de leituras (cada uma com o seu `Timestamp`) ao buffer de
+        reordenação e grava as que já venceram o prazo de espera.
+        """
+        if not rows:
+            return
+        for row in rows:
+            if isinstance(row['Timestamp'], str):
+                row['Timestamp'] = pd.Timestamp(row['Timestamp'])
+        self.reorder.push(rows)
+        self._release_rows()
+        self._reorder_wake.set()
+
+    def _start_reorder_thread(self):
+        """Libera as leituras retidas quando o prazo vence, mesmo sem novas mensagens."""
+        def run():
+            while not self._reorder_stop.is_set():
+                prazo = self.reorder.next_deadline()
+                self._reorder_wake.wait(None if prazo is None else max(prazo - time.monotonic(), 0.0))
+                self._reorder_wake.clear()
+                try:
+                    self._release_rows()
+                except Exception as e:
+                    logger.error(f"Erro ao gravar leituras reordenadas: {e}")
+
+        nome = "Reordenacao" if self.device_id == DEFAULT_DEVICE else f"Reordenacao-{self.device_id}"
+        self._reorder_thread = threading.Thread(target=run, daemon=True, name=nome)
+        self._reorder_thread.start()
+
+    def _release_rows(self, flush: bool = False):
+        # Liberar e gravar sob a mesma trava mantém a ordem entre a ingestão e a thread de reordenação
+        with self._commit_lock:
+            rows, tardias = self.reorder.pop_ready(flush=flush)
+            if tardias:
+                # Anteriores ao que já foi gravado: vão só para o armazenamento, onde a
+                # compactação as põe na posição certa; as séries em memória não as aceitam
+                self.storage.append(tardias)
+                metrics.incr('late_rows', len(tardias), device=self.device_id)
+                logger.warning(f"{len(tardias)} leitura(s) tardia(s) gravada(s) apenas no armazenamento.")
+            if rows:
+                self._commit_rows(rows)
+
+    def _commit_rows(self, rows: List[Dict[str, Any]]):
+        """
+        Grava leituras já ordenadas com uma única anexação ao armazenamento e
+        atualiza classificação e previsão uma vez por lote.
+        """
+        with self.lock:
+            # Anexação O(1): a deduplicação, a ordenação e a exportação do CSV
+            # unificado são feitas pela compactação em segundo plano.
+            with metrics.span('persist', device=self.device_id):
+                self.storage.append(rows)
+            for row in rows:
+                self.store.append(row['Timestamp'], row)
+        if len(rows) == 1:
+            logger.info(f"Dados anexados ao armazenamento. Nova linha: {rows[0]}")
+        else:
+            logger.info(f"Lote de {len(rows)} linha(s) anexado ao armazenamento.")
+        with metrics.span('classify', device=self.device_id):
+            self.classify_latest()
+        if self.store.version != self._forecast_hour_version:
+            with metrics.span('forecast_update', device=self.device_id):
+                self.update_forecast_online()
+        metrics.incr('persisted_rows', len(rows), device=self.device_id)
+        for row in rows:
+            self.analysis_scheduler.notify(row)
+        self.publish_snapshot()
+
+    def update_forecast_online(self):
+        """Aplica as horas recém-fechadas ao estado do Holt-Winters, sem refazer o ajuste."""
         with self.lock:
-            filepath = Path(self.config['files']['unified_csv'])
-            
-            df_historico = pd.read_csv(filepath) if filepath.exists() and filepath.stat().st_size > 0 else pd.DataFrame()
-
-            data_dict['Timestamp'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            df_new_row = pd.DataFrame([data_dict])
-
-            df_final = pd.concat([df_historico, df_new_row], ignore_index=True)
-            
-            canonical_columns = ['Timestamp'] + self.config['models']['decision_tree']['feature_columns']
-            df_final['Timestamp'] = pd.to_datetime(df_final['Timestamp'])
-            
-            # Remove linhas duplicadas com base no timestamp, mantendo a última ocorrência
-            df_final.drop_duplicates(subset=['Timestamp'], keep='last', inplace=True)
-            df_final.sort_values(by='Timestamp', inplace=True)
-            
-            df_to_save = df_final.reindex(columns=canonical_columns)
-            
-            df_to_save.to_csv(filepath, index=False)
-            
-            logger.info(f"Dados salvos em {filepath}. Nova linha: {data_dict}")
-            self.run_analysis()
+            self._forecast_hour_version = self.store.version
+            forecaster = self.forecaster
+            if not forecaster.is_trained:
+                return
+            if forecaster.update(self.store.hourly_frame(include_open=False)):
+                self.forecast_version += 1
+        if forecaster.needs_refit():
+            self.analysis_scheduler.request_run()
+
+    def classify_latest(self):
+        """Classifica imediatamente a leitura mais recente com o modelo atual."""
+        decision_tree = self.decision_tree
+        if not decision_tree.is_trained:
+            return
+        feature_cols = self.config['models']['decision_tree']['feature_columns']
+        # Valores ausentes na leitura (ex.: PM2.5 vindo só da API) usam a última observação conhecida
+        latest = self.store.latest()
+        if any(col not in latest for col in feature_cols):
+            return
+        latest_features = [latest[col] for col in feature_cols]
+        self.latest_classification = decision_tree.predict(latest_features)
 
 
     def load_data(self) -> bool:
+        """Obtém a visão horária mantida incrementalmente pelo TimeSeriesStore."""
         with self.lock:
-            filepath = Path(self.config['files']['unified_csv'])
-            if not filepath.exists() or filepath.stat().st_size < 10: return False
-            
-            # Define a frequência dos dados como horária ('H')
-            self.df_data = pd.read_csv(filepath, parse_dates=['Timestamp'], index_col='Timestamp')
-            if self.df_data.empty: return False
-            
-            self.df_data = self.df_data.asfreq('H') # Força uma frequência horária
-
-            all_cols = self.config['models']['decision_tree']['feature_columns']
-            for col in all_cols:
-                if col not in self.df_data.columns: self.df_data[col] = np.nan
-            
-            self.df_data[all_cols] = self.df_data[all_cols].interpolate(method='linear').ffill().bfill()
-            
-            if self.df_data.empty: return False
+            if len(self.store) == 0: return False
+
+            # Série horária já reamostrada e preenchida a cada amostra recebida
+            with metrics.span('resample', device=self.device_id):
+                self.df_data = self.store.hourly_frame(copy=True)
             self.last_timestamp = self.df_data.index[-1].to_pydatetime()
             return True
 
     def run_analysis(self):
+        """Retreina os modelos em novas instâncias e as publica de forma atômica."""
+        with self._analysis_lock, metrics.span('analysis', device=self.device_id):
+            self._run_analysis()
+        # A seleção da estrutura é um trabalho à parte, fora do lock e da métrica da análise
+        self._start_model_selection()
+
+    def _run_analysis(self):
         if not self.load_data():
             logger.warning("Análise abortada: dados insuficientes ou arquivo vazio.")
             return
@@ -238,33 +609,289 @@ class SentinelaVerde:
         limit = self.config['air_quality_limits']['Concentracao_Geral_PPM']
         df_copy['Qualidade_Ar_Calculada'] = np.where(df_copy['Concentracao_Geral_PPM'] > limit, 'Ruim', 'Bom')
 
-        self.decision_tree.train(df_copy)
-        self.forecaster.train(df_copy)
+        feature_cols = self.config['models']['decision_tree']['feature_columns']
+        # A árvore só é retreinada quando a política indica (linhas novas ou queda de acurácia)
+        decision_tree = self.decision_tree
+        retrain, reason = self.training_policy.should_retrain(df_copy, decision_tree)
+        if retrain:
+            decision_tree = DecisionTreePipeline(self.config['models']['decision_tree'])
+            with metrics.span('train', device=self.device_id, model='arvore'):
+                self.training_policy.fit(decision_tree, df_copy, reason)
+
+        # O Holt-Winters só é reajustado periodicamente ou quando os resíduos se desviam;
+        # entre os ajustes, o estado é atualizado a cada hora fechada (update_forecast_online).
+        forecaster = self.forecaster
+        refit = forecaster.needs_refit() or self._selection_changed
+        if refit:
+            novo = Forecaster(self.config['models']['forecasting'])
+            with metrics.span('train', device=self.device_id, model='holt_winters'):
+                novo.train(self.store.hourly_frame(include_open=False, copy=True), self.model_selector.selected)
+            # Um ajuste que falhou não substitui o estado em uso, que continua prevendo
+            if novo.is_trained:
+                forecaster = novo
+                self._selection_changed = False
+            else:
+                refit = False
+                if forecaster.is_trained:
+                    logger.warning("IA - Previsão: Reajuste falhou; mantendo o modelo em uso.")
+
+        latest_features = df_copy[feature_cols].iloc[-1:]
+        latest_classification = decision_tree.predict(latest_features)
+
+        # Troca atômica: leitores sempre enxergam um conjunto consistente de modelos
+        with self.lock:
+            # Horas fechadas durante o ajuste são aplicadas antes da publicação
+            atualizadas = forecaster.update(self.store.hourly_frame(include_open=False))
+            # A previsão (e o gráfico) só muda com um novo ajuste ou horas aplicadas ao estado;
+            # uma árvore nova invalida apenas a classificação do horizonte
+            if forecaster is not self.forecaster or atualizadas:
+                self.forecast_version += 1
+            if decision_tree is not self.decision_tree:
+                self.tree_version += 1
+            self.decision_tree = decision_tree
+            self.forecaster = forecaster
+            self.latest_classification = latest_classification
+            self._forecast_hour_version = self.store.version
+            agora = time.time()
+            if retrain and decision_tree.is_trained:
+                self.trained_at['arvore'] = agora
+            if refit and forecaster.is_trained:
+                self.trained_at['holt_winters'] = agora
+        self.analysis_scheduler.set_reference(
+            {col: (df_copy[col].mean(), df_copy[col].std()) for col in feature_cols}
+        )
+        self.classify_latest()
+
+        save_interval = self.config.get('checkpoint', {}).get('save_interval_seconds', 300)
+        if self._last_checkpoint is None or time.monotonic() - self._last_checkpoint >= save_interval:
+            try:
+                self.save_checkpoint()
+            except Exception as e:
+                logger.error(f"Falha ao gravar o checkpoint: {e}")
 
-        latest_features = df_copy[self.config['models']['decision_tree']['feature_columns']].iloc[-1:]
-        self.latest_classification = self.decision_tree.predict(latest_features)
-        self.future_forecast = self.forecaster.forecast()
-        
+        with self.lock:
+            self.analysis_version += 1
         logger.info(f"Análise concluída. Qualidade do ar atual: {self.latest_classification}")
-        if self.page_update_callback: 
-            self.page_update_callback()
+        self.publish_snapshot()
+
+    def _start_model_selection(self):
+        """
+        Refaz a seleção da estrutura do Holt-Winters, quando vencida, em uma thread
+        própria: a análise e o pool compartilhado entre dispositivos não ficam presos
+        durante a validação cruzada. Se a escolha mudar, um reajuste é agendado.
+        """
+        if self._selection_thread is not None and self._selection_thread.is_alive():
+            return
+        if not self.model_selector.is_due(len(self.store)):
+            return
+        nome = "SelecaoModelo" if self.device_id == DEFAULT_DEVICE else f"SelecaoModelo-{self.device_id}"
+        self._selection_thread = threading.Thread(target=self._run_model_selection, daemon=True, name=nome)
+        self._selection_thread.start()
+
+    def _run_model_selection(self):
+        try:
+            anteriores = dict(self.model_selector.selected)
+            with metrics.span('model_selection', device=self.device_id):
+                selecionadas = self.model_selector.select(self.store.hourly_frame(include_open=False, copy=True))
+        except Exception as e:
+            logger.error(f"IA - Seleção: erro durante a seleção dos modelos: {e}")
+            return
+        if selecionadas != anteriores:
+            self._selection_changed = True
+            self.analysis_scheduler.request_run()
+
+    @property
+    def future_forecast(self) -> Optional[pd.DataFrame]:
+        """Previsão atual; recalculada apenas quando `forecast_version` muda."""
+        with self.lock:
+            forecaster, version = self.forecaster, self.forecast_version
+        def compute():
+            with metrics.span('forecast', device=self.device_id):
+                return forecaster.forecast()
+        return self.forecast_cache.get('previsao', version, compute)
+
+    def get_forecast_derived(self, key: Any, compute: Callable[[], Any]) -> Any:
+        """Memoiza um resultado derivado da previsão (gráfico, rótulo de qualidade...) por versão."""
+        return self.forecast_cache.get(key, self.forecast_version, compute)
+
+    @property
+    def forecast_quality(self) -> ForecastQuality:
+        """Qualidade prevista para o horizonte; recalculada apenas quando a previsão ou a árvore muda."""
+        with self.lock:
+            decision_tree, version = self.decision_tree, (self.forecast_version, self.tree_version)
+        def compute():
+            return assess_forecast(
+                self.future_forecast, self.config.get('air_quality_limits', {}), decision_tree,
+                self.store.latest(), self.config['models']['decision_tree']['feature_columns']
+            )
+        return self.forecast_cache.get('qualidade_previsao', version, compute)
+
+    def _register_gauges(self):
+        """Profundidade da fila de retreino, idade dos modelos e acertos do cache da previsão."""
+        device = self.device_id
+        metrics.gauge('analysis_pending_rows', lambda: self.analysis_scheduler.pending_rows, device=device)
+        for modelo in self.trained_at:
+            metrics.gauge('model_age_seconds',
+                          lambda modelo=modelo: time.time() - self.trained_at[modelo] if self.trained_at[modelo] else None,
+                          device=device, model=modelo)
+        metrics.gauge('forecast_cache_hits', lambda: self.forecast_cache.hits, device=device)
+        metrics.gauge('forecast_cache_misses', lambda: self.forecast_cache.misses, device=device)
+        metrics.gauge('history_hours', lambda: len(self.store), device=device)
+        metrics.gauge('model_selection_age_seconds',
+                      lambda: time.time() - self.model_selector.selected_at if self.model_selector.selected_at else None,
+                      device=device)
+        metrics.gauge('reorder_pending', lambda: len(self.reorder), device=device)
+        metrics.gauge('reorder_reordered', lambda: self.reorder.reordered, device=device)
+        metrics.gauge('reorder_merged', lambda: self.reorder.merged, device=device)
+
+    def snapshot(self) -> DashboardSnapshot:
+        """Monta um snapshot imutável do estado atual (leituras, classificação e versões)."""
+        version = self.changes.next_version()
+        latest = self.store.latest()
+        latest_timestamp = self.store.latest_timestamp()
+        with self.lock:
+            qualidade_ar, forecast_version = self.latest_classification, self.forecast_version
+            analysis_version = self.analysis_version
+        previsao = self.forecast_quality
+        return DashboardSnapshot(
+            version=version,
+            timestamp=latest_timestamp.strftime('%d/%m/%Y %H:%M') if latest_timestamp else None,
+            leituras=freeze(latest),
+            qualidade_ar=qualidade_ar,
+            qualidade_previsao=previsao.label,
+            forecast_version=forecast_version,
+            analysis_version=analysis_version,
+            previsao=previsao,
+        )
+
+    def publish_snapshot(self):
+        """Publica o estado atual para os assinantes (sem bloquear a thread chamadora)."""
+        self.changes.publish(self.snapshot())
+
+    def query_range(self, start: Any, end: Any = None, pixels: int = 800,
+                    columns: Optional[List[str]] = None, mode: str = 'minmax') -> pd.DataFrame:
+        """
+        Histórico reamostrado para exibição: até `pixels` pontos entre `start` e `end`
+        (padrão: agora), calculados a partir dos agregados por minuto/hora/dia.
+        """
+        end = pd.Timestamp(end) if end is not None else pd.Timestamp.now()
+        return self.store.range_query(start, end, pixels, columns, mode)
+
+    def get_formatted_summary(self) -> str:
+        """Texto do resumo da aba Relatórios, montado a partir das estatísticas móveis."""
+        return format_summary(self.summary)
 
     def get_latest_data_summary(self) -> Dict[str, Any]:
-        if self.df_data is None or self.df_data.empty: return {}
-        latest = self.df_data.iloc[-1]
+        latest = self.store.latest()
+        if not latest: return {}
+        latest_timestamp = self.store.latest_timestamp()
         return {
-            'timestamp': self.last_timestamp.strftime('%d/%m/%Y %H:%M') if self.last_timestamp else 'N/A',
+            'timestamp': latest_timestamp.strftime('%d/%m/%Y %H:%M') if latest_timestamp else 'N/A',
             'Concentracao_Geral_PPM': latest.get('Concentracao_Geral_PPM'),
             'PM2.5_ug_m3': latest.get('PM2.5_ug_m3'), 'PM10_ug_m3': latest.get('PM10_ug_m3'),
             'Temperatura_C': latest.get('Temperatura_C'), 'Umidade_Relativa_percent': latest.get('Umidade_Relativa_percent'),
-            'qualidade_ar': self.latest_classification, 'previsoes': self.future_forecast
+            'qualidade_ar': self.latest_classification, 'previsoes': self.future_forecast,
+            'qualidade_previsao': self.forecast_quality.label
         }
 
+class DeviceHub:
+    """
+    Mantém um `SentinelaVerde` por dispositivo, criado na primeira mensagem do
+    dispositivo (ou na inicialização, para os IDs listados em `devices.ids`).
+
+    Cada dispositivo tem armazenamento, modelos e previsões próprios. Os lotes
+    de ingestão de dispositivos diferentes e os retreinamentos são executados
+    em paralelo em um pool de `devices.workers` threads.
+    """
+    def __init__(self, config: dict):
+        self.config = config
+        devices_conf = config.get('devices', {})
+        self.topic = config['mqtt']['topic']
+        self.api_client = api_client.configure(config['api'])
+        # Cidade consultada no WAQI por dispositivo (padrão: api.city)
+        self.cities: Dict[str, str] = devices_conf.get('cities') or {}
+        self.executor = ThreadPoolExecutor(max_workers=devices_conf.get('workers', 4),
+                                           thread_name_prefix="Dispositivos")
+        self._devices: Dict[str, SentinelaVerde] = {}
+        self._lock = threading.Lock()
+        self.metrics = metrics.MetricsService(config.get('metrics', {}))
+        metrics.gauge('devices', lambda: len(self._devices))
+        ids = devices_conf.get('ids') or []
+        self.default_device = devices_conf.get('default', ids[0] if ids else DEFAULT_DEVICE)
+        for device_id in ids:
+            self.device(device_id)
+
+    def device(self, device_id: str) -> SentinelaVerde:
+        """Retorna (criando, se necessário) o backend do dispositivo."""
+        with self._lock:
+            sentinela = self._devices.get(device_id)
+            if sentinela is None:
+                sentinela = SentinelaVerde(device_config(self.config, device_id), device_id, self.executor)
+                self._devices[device_id] = sentinela
+                logger.info(f"Dispositivo '{device_id}' registrado.")
+            return sentinela
+
+    @property
+    def primary(self) -> SentinelaVerde:
+        """Dispositivo exibido pela interface gráfica."""
+        return self.device(self.default_device)
+
+    def devices(self) -> Dict[str, SentinelaVerde]:
+        with self._lock:
+            return dict(self._devices)
+
+    def commit_batch(self, rows_by_topic: Dict[str, List[Dict[str, Any]]]):
+        """Grava os lotes de cada dispositivo em paralelo e espera todos terminarem."""
+        por_dispositivo: Dict[str, List[Dict[str, Any]]] = {}
+        for topic, rows in rows_by_topic.items():
+            device_id = device_id_from_topic(self.topic, topic)
+            if device_id is None:
+                logger.error(f"Tópico MQTT sem ID de dispositivo válido ignorado: '{topic}'")
+                continue
+            por_dispositivo.setdefault(device_id, []).extend(rows)
+        futuros = [self.executor.submit(self.device(device_id).save_data_batch, rows)
+                   for device_id, rows in por_dispositivo.items()]
+        # Esperar aqui mantém a ordem dos lotes de um mesmo dispositivo
+        for futuro in futuros:
+            futuro.result()
+
+    def start_api_scheduler(self):
+        """Consulta em paralelo, uma vez por ciclo, as cidades dos dispositivos e replica os dados."""
+        def run_scheduler():
+            interval = self.config['api']['interval_seconds']
+            while True:
+                try:
+                    devices = self.devices()
+                    cidade_padrao = self.config['api']['city']
+                    cidades = {device_id: self.cities.get(device_id, cidade_padrao) for device_id in devices}
+                    dados_por_cidade = self.api_client.fetch_many(cidades.values())
+                    for device_id, sentinela in devices.items():
+                        api_data = dados_por_cidade.get(cidades[device_id])
+                        if api_data:
+                            sentinela.save_api_data(dict(api_data))
+                except Exception as e:
+                    logger.error(f"Erro no agendador da API: {e}")
+                time.sleep(interval)
+
+        threading.Thread(target=run_scheduler, daemon=True, name="APIScheduler").start()
+
+    def shutdown(self):
+        for sentinela in self.devices().values():
+            sentinela.shutdown()
+        self.executor.shutdown(wait=False)
+        self.api_client.close()
+        self.metrics.stop()
+
+
 class MQTTClient:
-    def __init__(self, config: dict, sentinela: SentinelaVerde):
+    def __init__(self, config: dict, hub: DeviceHub):
+        import paho.mqtt.client as mqtt
         mqtt_conf = config['mqtt']
-        self.sentinela = sentinela
+        self.hub = hub
         self.topic = mqtt_conf['topic']
+        self.qos = mqtt_conf.get('qos', 0)
+        # O callback do paho apenas enfileira; o consumidor grava em lotes por dispositivo
+        self.ingestion = IngestionWorker(config.get('ingestion', {}), hub.commit_batch)
         self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1)
         self.client.on_connect = self.on_connect
         self.client.on_message = self.on_message
@@ -273,17 +900,23 @@ class MQTTClient:
 
     def on_connect(self, client, userdata, flags, rc):
         if rc == 0:
-            client.subscribe(self.topic)
-            logger.info(f"Conectado ao MQTT e assinando o tópico: '{self.topic}'")
+            client.subscribe(self.topic, qos=self.qos)
+            logger.info(f"Conectado ao MQTT e assinando o tópico: '{self.topic}' (QoS {self.qos})")
         else:
             logger.error(f"Falha ao conectar ao MQTT, código: {rc}")
 
     def on_message(self, client, userdata, msg):
-        self.sentinela.process_mqtt_message(msg.topic, msg.payload.decode())
+        self.ingestion.submit(msg.topic, msg.payload)
 
     def start(self):
+        self.ingestion.start()
         try:
             self.client.connect(self.broker, self.port, 60)
             self.client.loop_start()
         except Exception as e:
             logger.error(f"Não foi possível iniciar o cliente MQTT: {e}")
+
+    def stop(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+        self.ingestion.stop()
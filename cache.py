@@ -0,0 +1,41 @@
+# cache.py (cache de resultados derivados de uma versão dos dados)
+# -*- coding: utf-8 -*-
+
+import threading
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+class VersionedCache:
+    """
+    Memoiza valores calculados a partir de uma versão dos dados.
+
+    Cada chave guarda apenas o valor da versão mais recente; quando a versão muda,
+    o próximo acesso recalcula o valor. Os contadores de acertos e falhas ficam
+    disponíveis em `stats()`.
+    """
+    def __init__(self):
+        # Reentrante: um valor derivado pode depender de outra chave do mesmo cache
+        # (ex.: o gráfico é calculado a partir da previsão em cache).
+        self._lock = threading.RLock()
+        self._entries: Dict[Hashable, Tuple[Any, Any]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, version: Any, compute: Callable[[], Any]) -> Any:
+        with self._lock:
+            entrada = self._entries.get(key)
+            if entrada is not None and entrada[0] == version:
+                self.hits += 1
+                return entrada[1]
+            self.misses += 1
+            valor = compute()
+            self._entries[key] = (version, valor)
+            return valor
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
@@ -0,0 +1,118 @@
+# changefeed.py (publicação de snapshots imutáveis do estado para a interface)
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+import time
+from types import MappingProxyType
+from typing import Any, Callable, List, Mapping, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ForecastQuality(NamedTuple):
+    """Qualidade do ar prevista para o horizonte da previsão."""
+    label: str                                # 'Bom', 'Ruim' ou 'Insuficiente'
+    worst_hour: Optional[Any] = None          # Hora com o maior valor em relação ao limite
+    worst_ratio: Optional[float] = None       # Valor / limite nessa hora (> 1: acima do limite)
+    first_exceedance: Optional[Any] = None    # Primeira hora classificada como 'Ruim'
+    hours_exceeding: int = 0
+
+
+class DashboardSnapshot(NamedTuple):
+    """Estado exibido pelo painel em um instante; nunca é alterado depois de publicado."""
+    version: int
+    timestamp: Optional[str]
+    leituras: Mapping[str, float]
+    qualidade_ar: Optional[str]
+    qualidade_previsao: Optional[str]
+    forecast_version: int
+    analysis_version: int
+    previsao: Optional[ForecastQuality] = None
+
+
+def freeze(valores: dict) -> Mapping[str, Any]:
+    """Cópia somente-leitura de um dicionário."""
+    return MappingProxyType(dict(valores))
+
+
+class Subscription:
+    """
+    Entrega os snapshots a um assinante em uma thread própria, no máximo
+    `max_fps` vezes por segundo. Publicações feitas no intervalo são agrupadas:
+    o assinante recebe apenas o snapshot mais recente.
+    """
+    def __init__(self, feed: 'ChangeFeed', callback: Callable[[DashboardSnapshot], None], max_fps: float):
+        self.feed = feed
+        self.callback = callback
+        self.min_interval = 1.0 / max_fps if max_fps > 0 else 0.0
+        self.delivered_version = -1
+        self.delivered = 0
+        self._active = True
+        self._thread = threading.Thread(target=self._run, daemon=True, name="AtualizacaoUI")
+        self._thread.start()
+
+    def cancel(self):
+        self._active = False
+        self.feed._wake_all()
+
+    def _run(self):
+        ultimo_envio = 0.0
+        while True:
+            snapshot = self.feed._wait_newer(self.delivered_version, lambda: not self._active)
+            if not self._active:
+                return
+            espera = ultimo_envio + self.min_interval - time.monotonic()
+            if espera > 0:
+                time.sleep(espera)
+                # Durante a espera podem ter chegado versões mais novas
+                snapshot = self.feed.latest() or snapshot
+            ultimo_envio = time.monotonic()
+            self.delivered_version = snapshot.version
+            try:
+                self.callback(snapshot)
+                self.delivered += 1
+            except Exception as e:
+                logger.error(f"Erro ao entregar atualização ao assinante: {e}")
+
+
+class ChangeFeed:
+    """Canal publica/assina com o snapshot mais recente do estado."""
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._latest: Optional[DashboardSnapshot] = None
+        self._version = 0
+        self._subscriptions: List[Subscription] = []
+
+    def next_version(self) -> int:
+        with self._cond:
+            self._version += 1
+            return self._version
+
+    def publish(self, snapshot: DashboardSnapshot):
+        with self._cond:
+            # Snapshots montados em paralelo podem chegar fora de ordem; mantém o mais novo
+            if self._latest is not None and snapshot.version <= self._latest.version:
+                return
+            self._latest = snapshot
+            self._cond.notify_all()
+
+    def latest(self) -> Optional[DashboardSnapshot]:
+        with self._cond:
+            return self._latest
+
+    def subscribe(self, callback: Callable[[DashboardSnapshot], None], max_fps: float = 4.0) -> Subscription:
+        subscription = Subscription(self, callback, max_fps)
+        with self._cond:
+            self._subscriptions.append(subscription)
+        return subscription
+
+    def _wait_newer(self, version: int, cancelled: Callable[[], bool]) -> Optional[DashboardSnapshot]:
+        with self._cond:
+            while not cancelled() and (self._latest is None or self._latest.version <= version):
+                self._cond.wait()
+            return self._latest
+
+    def _wake_all(self):
+        with self._cond:
+            self._cond.notify_all()
@@ -0,0 +1,89 @@
+# checkpoint.py (persistência dos modelos e das séries para inicialização rápida)
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import shutil
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+
+
+class Checkpoint:
+    """
+    Checkpoint versionado em disco: um `manifest.json` com os metadados e um
+    arquivo `.npy` por array, carregados na inicialização (os maiores, com memory-map).
+
+    A gravação é feita em um diretório temporário que substitui o anterior ao
+    final, de modo que um checkpoint parcial nunca é lido.
+    """
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+
+    def save(self, sections: Dict[str, Any]):
+        """
+        Grava as seções informadas. Cada seção é um dicionário `{'arrays': {...}, 'meta': {...}}`
+        ou `None` (seção ausente).
+        """
+        temporario = self.directory.with_name(self.directory.name + '.tmp')
+        shutil.rmtree(temporario, ignore_errors=True)
+        temporario.mkdir(parents=True)
+
+        manifest = {'format_version': FORMAT_VERSION, 'created_at': time.time(), 'sections': {}}
+        for secao, conteudo in sections.items():
+            if conteudo is None:
+                continue
+            arquivos = {}
+            for nome, array in conteudo.get('arrays', {}).items():
+                arquivo = f'{secao}.{nome}.npy'
+                np.save(temporario / arquivo, np.asarray(array), allow_pickle=False)
+                arquivos[nome] = arquivo
+            manifest['sections'][secao] = {'arrays': arquivos, 'meta': conteudo.get('meta', {})}
+        (temporario / MANIFEST_NAME).write_text(json.dumps(manifest, indent=1), encoding='utf-8')
+
+        antigo = self.directory.with_name(self.directory.name + '.old')
+        shutil.rmtree(antigo, ignore_errors=True)
+        if self.directory.exists():
+            self.directory.rename(antigo)
+        temporario.rename(self.directory)
+        shutil.rmtree(antigo, ignore_errors=True)
+
+    def load(self, mmap_sections: Iterable[str] = ()) -> Optional[Dict[str, Any]]:
+        """
+        Carrega o checkpoint; None se ausente ou incompatível.
+
+        Somente as seções em `mmap_sections` são abertas com memory-map, e quem as
+        recebe deve copiar o que guardar: o próximo `save` remove este diretório.
+        As demais são lidas para a memória. Se a gravação anterior foi interrompida
+        entre as duas renomeações, o checkpoint anterior é lido de `<dir>.old`.
+        """
+        directory = self.directory
+        if not (directory / MANIFEST_NAME).exists():
+            directory = self.directory.with_name(self.directory.name + '.old')
+            if not (directory / MANIFEST_NAME).exists():
+                return None
+            logger.warning(f"Checkpoint ausente em {self.directory}; usando a cópia anterior em {directory}.")
+        mmap_sections = set(mmap_sections)
+        try:
+            manifest = json.loads((directory / MANIFEST_NAME).read_text(encoding='utf-8'))
+            if manifest.get('format_version') != FORMAT_VERSION:
+                logger.warning(f"Checkpoint em formato {manifest.get('format_version')} ignorado "
+                               f"(esperado {FORMAT_VERSION}).")
+                return None
+            sections = {}
+            for secao, conteudo in manifest['sections'].items():
+                mmap_mode = 'r' if secao in mmap_sections else None
+                arrays = {nome: np.load(directory / arquivo, mmap_mode=mmap_mode, allow_pickle=False)
+                          for nome, arquivo in conteudo['arrays'].items()}
+                sections[secao] = {'arrays': arrays, 'meta': conteudo['meta']}
+            return sections
+        except Exception as e:
+            logger.error(f"Falha ao ler o checkpoint em {directory}: {e}")
+            return None
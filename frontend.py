@@ -7,9 +7,6 @@ import matplotlib
 import io
 import base64
 import threading
-import requests
-import os
-import time
 from typing import Optional, Dict, Any
 
 matplotlib.use('Agg')
@@ -17,10 +14,10 @@ from matplotlib.figure import Figure
 
 # Importa o backend apenas para anotação de tipo, evitando importação circular.
 from backend import SentinelaVerde
-
-# --- Configurações Globais e Chave de API ---
-WAQI_API_TOKEN = os.getenv("WAQI_API_TOKEN",
-                           "845535b9a4be3918e97e326f4c550afad64b21d5")
+from changefeed import DashboardSnapshot
+# Cliente compartilhado do WAQI (sessão com pool de conexões, cache por cidade e novas tentativas)
+import api_client
+import metrics
 
 # --- Referências Globais a Controles Flet ---
 # Controles do Frontend2 (base)
@@ -41,7 +38,6 @@ texto_qualidade_previsao = ft.Text("Previsão (24h): ...", weight=ft.FontWeight.
 area_texto_relatorio = ft.Text("", expand=True, selectable=True, font_family="Consolas")
 area_imagem_relatorio = ft.Image(visible=False, fit=ft.ImageFit.CONTAIN, expand=True)
 switch_atualizacao_automatica = ft.Switch(label="Atualização em tempo real", value=False)
-parar_thread_atualizacao = threading.Event()
 
 dropdown_sensores_externos = ft.Dropdown(
     options=[ft.dropdown.Option(key="rio claro", text="Rio Claro")],
@@ -53,101 +49,195 @@ indicador_carregamento_externo = ft.ProgressRing(visible=False, width=16, height
 container_sensores_externos = ft.Container()
 
 
-def gerar_imagem_grafico_base64(df_forecast: Optional[pd.DataFrame], page_theme_mode: ft.ThemeMode) -> str:
-    """Cria um gráfico de previsão e o retorna como uma string base64."""
-    figura_matplotlib = Figure(figsize=(7, 3.8), dpi=100)
-    eixos = figura_matplotlib.add_subplot(111)
-    cor_texto = 'white' if page_theme_mode == ft.ThemeMode.DARK else 'black'
-    figura_matplotlib.set_facecolor('none')
-    eixos.set_facecolor('none')
-
-    tem_dados = False
-    # AQUI ESTÁ A CORREÇÃO: Ele agora usa a variável 'df_forecast' que foi passada como argumento
-    if df_forecast is not None and not df_forecast.empty:
-        for col in df_forecast.columns:
-            if pd.api.types.is_numeric_dtype(df_forecast[col]):
-                tem_dados = True
+class GraficoPrevisao:
+    """
+    Gráfico de previsão com Figure e artistas reaproveitados entre renderizações.
+
+    A cada nova previsão apenas os dados das linhas são trocados (`set_data`);
+    legenda, cores do tema e layout só são refeitos quando as séries exibidas,
+    o tema ou a largura dos rótulos do eixo Y mudam.
+    """
+    def __init__(self):
+        self.figura = Figure(figsize=(7, 3.8), dpi=100)
+        self.figura.set_facecolor('none')
+        self.eixos = self.figura.add_subplot(111)
+        self.eixos.set_facecolor('none')
+        self.eixos.tick_params(axis='x', rotation=30, labelsize=8)
+        self.eixos.tick_params(axis='y', labelsize=8)
+        self.titulo = self.eixos.set_title("Previsão (Próximas 24h)", size=10)
+        self.aviso = self.eixos.text(0.5, 0.5, "Dados insuficientes para previsão", ha='center', va='center',
+                                     transform=self.eixos.transAxes)
+        self.linhas: Dict[str, Any] = {}
+        self._tema: Optional[ft.ThemeMode] = None
+        self._assinatura_layout: Optional[tuple] = None
+        self._lock = threading.Lock()
+
+    def render(self, df_forecast: Optional[pd.DataFrame], page_theme_mode: ft.ThemeMode) -> str:
+        """Atualiza o gráfico com a previsão e o retorna como uma string base64 (PNG)."""
+        with self._lock, metrics.span('render', chart='previsao'):
+            return self._render(df_forecast, page_theme_mode)
+
+    def _render(self, df_forecast: Optional[pd.DataFrame], page_theme_mode: ft.ThemeMode) -> str:
+        colunas = []
+        if df_forecast is not None and not df_forecast.empty:
+            colunas = [col for col in df_forecast.columns if pd.api.types.is_numeric_dtype(df_forecast[col])]
+
+        series_mudaram = list(self.linhas) != colunas
+        if series_mudaram:
+            for linha in self.linhas.values():
+                linha.remove()
+            self.linhas = {}
+            self.eixos.set_prop_cycle(None)
+            for col in colunas:
                 label = col.replace('_PPM', ' PPM').replace('_ug_m3', ' µg/m³')
-                eixos.plot(df_forecast.index, df_forecast[col], label=label)
+                self.linhas[col], = self.eixos.plot(df_forecast.index, df_forecast[col], label=label)
+        else:
+            for col, linha in self.linhas.items():
+                linha.set_data(df_forecast.index, df_forecast[col].to_numpy())
+
+        tem_dados = bool(colunas)
+        self.titulo.set_visible(tem_dados)
+        self.aviso.set_visible(not tem_dados)
+        if tem_dados:
+            self.eixos.relim()
+            self.eixos.autoscale_view()
+
+        cor_texto = 'white' if page_theme_mode == ft.ThemeMode.DARK else 'black'
+        if series_mudaram or page_theme_mode != self._tema:
+            self._aplicar_tema(cor_texto, tem_dados)
+            self._tema = page_theme_mode
+
+        # O tight_layout (que exige um desenho extra) só roda quando o layout pode ter mudado
+        largura_rotulos = max((len(f"{v:g}") for v in self.eixos.get_yticks()), default=0)
+        assinatura = (tuple(colunas), page_theme_mode, largura_rotulos)
+        if assinatura != self._assinatura_layout:
+            self.figura.tight_layout(pad=1.5)
+            self._assinatura_layout = assinatura
+
+        buf = io.BytesIO()
+        self.figura.savefig(buf, format="png", transparent=True)
+        return base64.b64encode(buf.getvalue()).decode("utf-8")
+
+    def _aplicar_tema(self, cor_texto: str, tem_dados: bool):
+        legenda = self.eixos.get_legend()
+        if legenda is not None:
+            legenda.remove()
+        if tem_dados:
+            self.eixos.legend(prop={'size': 8}, labelcolor=cor_texto)
+        self.titulo.set_color(cor_texto)
+        self.aviso.set_color(cor_texto)
+        self.eixos.tick_params(axis='both', colors=cor_texto)
+        for spine in self.eixos.spines.values():
+            spine.set_edgecolor(cor_texto)
+
+
+grafico_previsao = GraficoPrevisao()
 
-    if tem_dados:
-        eixos.legend(prop={'size': 8}, labelcolor=cor_texto)
-        eixos.set_title("Previsão (Próximas 24h)", color=cor_texto, size=10)
-    else:
-        eixos.text(0.5, 0.5, "Dados insuficientes para previsão", ha='center', va='center', color=cor_texto)
 
-    eixos.tick_params(axis='x', colors=cor_texto, rotation=30, labelsize=8)
-    eixos.tick_params(axis='y', colors=cor_texto, labelsize=8)
-    for spine in eixos.spines.values():
-        spine.set_edgecolor(cor_texto)
+def gerar_imagem_grafico_base64(df_forecast: Optional[pd.DataFrame], page_theme_mode: ft.ThemeMode) -> str:
+    """Renderiza o gráfico de previsão compartilhado e o retorna como uma string base64."""
+    return grafico_previsao.render(df_forecast, page_theme_mode)
+
+
+MAPA_FEEDBACK = {
+    'Excelente': (ft.Icons.SENTIMENT_VERY_SATISFIED, ft.Colors.GREEN_400),
+    'Bom': (ft.Icons.SENTIMENT_SATISFIED, ft.Colors.LIGHT_GREEN_600),
+    'Ruim': (ft.Icons.SENTIMENT_DISSATISFIED, ft.Colors.ORANGE_700),
+    'IA não treinada': (ft.Icons.COMPUTER, ft.Colors.BLUE_GREY_500),
+    'Analisando...': (ft.Icons.HOURGLASS_EMPTY, ft.Colors.BLUE_GREY_500),
+    'Aguardando...': (ft.Icons.HOURGLASS_EMPTY, ft.Colors.BLUE_GREY_500)
+}
+
+MAPA_FEEDBACK_PREVISAO = {
+    'Bom': (ft.Icons.THUMB_UP_OFF_ALT, ft.Colors.GREEN),
+    'Ruim': (ft.Icons.THUMB_DOWN_OFF_ALT, ft.Colors.ORANGE_800),
+    'Insuficiente': (ft.Icons.HOURGLASS_EMPTY, ft.Colors.BLUE_GREY),
+}
+
+# Serializa a aplicação de snapshots (assinatura em tempo real e botão "Atualizar Dados")
+_lock_ui = threading.Lock()
+_ultima_analise_exibida = -1
+
+
+def _alterar(alterados: list, controle: ft.Control, **propriedades):
+    """Atribui as propriedades que mudaram e registra o controle para `update()`."""
+    mudou = False
+    for nome, valor in propriedades.items():
+        if getattr(controle, nome) != valor:
+            setattr(controle, nome, valor)
+            mudou = True
+    if mudou and controle not in alterados:
+        alterados.append(controle)
+
+
+def _formatar(valor: Optional[float], formato: str, vazio: str) -> str:
+    return formato.format(valor) if valor is not None else vazio
+
+
+def aplicar_snapshot(page: ft.Page, sentinela_instance: 'SentinelaVerde', snapshot: 'DashboardSnapshot'):
+    """Aplica um snapshot do backend à UI, atualizando apenas os controles cujo valor mudou."""
+    global _ultima_analise_exibida
+    alterados: list = []
+    leituras = snapshot.leituras
+
+    if leituras:
+        _alterar(alterados, texto_concentracao_geral,
+                 value=_formatar(leituras.get('Concentracao_Geral_PPM'), "{:.2f} ppm", "-- ppm"))
+        _alterar(alterados, texto_pm25, value=_formatar(leituras.get('PM2.5_ug_m3'), "{:.1f} µg/m³", "-- µg/m³"))
+        _alterar(alterados, texto_pm10, value=_formatar(leituras.get('PM10_ug_m3'), "{:.1f} µg/m³", "-- µg/m³"))
+        _alterar(alterados, texto_umidade,
+                 value=_formatar(leituras.get('Umidade_Relativa_percent'), "Umidade: {:.1f}%", "Umidade: --"))
+        _alterar(alterados, texto_temperatura,
+                 value=_formatar(leituras.get('Temperatura_C'), "Temperatura: {:.1f}°C", "Temperatura: --"))
+
+        qualidade = snapshot.qualidade_ar or "Indisponível"
+        icone, cor = MAPA_FEEDBACK.get(qualidade, (ft.Icons.HELP_OUTLINE, ft.Colors.GREY))
+        _alterar(alterados, texto_qualidade_ar, value=qualidade.upper())
+        _alterar(alterados, icone_qualidade_ar, name=icone)
+        _alterar(alterados, container_qualidade_ar, bgcolor=cor)
+
+        qualidade_prevista = snapshot.qualidade_previsao or 'Indisponível'
+        icone, cor = MAPA_FEEDBACK_PREVISAO.get(qualidade_prevista, (ft.Icons.HELP_OUTLINE, ft.Colors.GREY))
+        previsao = snapshot.previsao
+        texto = f"Previsão (24h): {qualidade_prevista}"
+        dica = None
+        if previsao is not None and previsao.first_exceedance is not None:
+            texto += f" a partir de {previsao.first_exceedance:%H:%M}"
+        if previsao is not None and previsao.worst_hour is not None:
+            dica = (f"Pior hora prevista: {previsao.worst_hour:%d/%m %H:%M} "
+                    f"({previsao.worst_ratio:.0%} do limite); {previsao.hours_exceeding} hora(s) 'Ruim'")
+        _alterar(alterados, texto_qualidade_previsao, value=texto, color=cor, tooltip=dica)
+        _alterar(alterados, icone_qualidade_previsao, name=icone, color=cor)
+
+    # O gráfico só é regerado quando a versão da previsão (ou o tema) muda; sem mudança,
+    # a imagem não é reatribuída e nada é reenviado ao cliente Flet.
+    imagem = sentinela_instance.get_forecast_derived(
+        ('grafico', page.theme_mode),
+        lambda: gerar_imagem_grafico_base64(sentinela_instance.future_forecast, page.theme_mode)
+    )
+    _alterar(alterados, controle_imagem_plot, src_base64=imagem)
+    _ultima_analise_exibida = snapshot.analysis_version
 
-    figura_matplotlib.tight_layout(pad=1.5)
-    buf = io.BytesIO()
-    figura_matplotlib.savefig(buf, format="png", transparent=True)
-    return base64.b64encode(buf.getvalue()).decode("utf-8")
+    if alterados:
+        page.update(*alterados)
 
 
-def atualizar_elementos_ui(page: ft.Page, sentinela_instance: 'SentinelaVerde'):
-    """Função central que ATUALIZA a UI com os dados mais recentes do backend."""
-    indicador_carregamento.visible = True
-    page.update()
+def receber_snapshot(page: ft.Page, sentinela_instance: 'SentinelaVerde', snapshot: 'DashboardSnapshot'):
+    """
+    Assinante do feed de alterações. Com a atualização em tempo real desligada,
+    apenas snapshots de uma nova análise são exibidos.
+    """
+    with _lock_ui:
+        if not switch_atualizacao_automatica.value and snapshot.analysis_version == _ultima_analise_exibida:
+            return
+        with metrics.span('ui_update'):
+            aplicar_snapshot(page, sentinela_instance, snapshot)
 
-    summary = sentinela_instance.get_latest_data_summary()
-
-    if summary:
-        conc_geral = summary.get('Concentracao_Geral_PPM')
-        texto_concentracao_geral.value = f"{conc_geral:.2f} ppm" if conc_geral is not None else "-- ppm"
-
-        pm25 = summary.get('PM2.5_ug_m3')
-        texto_pm25.value = f"{pm25:.1f} µg/m³" if pm25 is not None else "-- µg/m³"
-
-        pm10 = summary.get('PM10_ug_m3')
-        texto_pm10.value = f"{pm10:.1f} µg/m³" if pm10 is not None else "-- µg/m³"
-
-        umid = summary.get('Umidade_Relativa_percent')
-        texto_umidade.value = f"Umidade: {umid:.1f}%" if umid is not None else "Umidade: --"
-
-        temp = summary.get('Temperatura_C')
-        texto_temperatura.value = f"Temperatura: {temp:.1f}°C" if temp is not None else "Temperatura: --"
-
-        qualidade = summary.get('qualidade_ar', "Indisponível")
-        texto_qualidade_ar.value = qualidade.upper()
-
-        mapa_feedback = {
-            'Excelente': (ft.Icons.SENTIMENT_VERY_SATISFIED, ft.Colors.GREEN_400),
-            'Bom': (ft.Icons.SENTIMENT_SATISFIED, ft.Colors.LIGHT_GREEN_600),
-            'Ruim': (ft.Icons.SENTIMENT_DISSATISFIED, ft.Colors.ORANGE_700),
-            'IA não treinada': (ft.Icons.COMPUTER, ft.Colors.BLUE_GREY_500),
-            'Analisando...': (ft.Icons.HOURGLASS_EMPTY, ft.Colors.BLUE_GREY_500),
-            'Aguardando...': (ft.Icons.HOURGLASS_EMPTY, ft.Colors.BLUE_GREY_500)
-        }
-        icone, cor = mapa_feedback.get(qualidade, (ft.Icons.HELP_OUTLINE, ft.Colors.GREY))
-        icone_qualidade_ar.name = icone
-        container_qualidade_ar.bgcolor = cor
-
-        # A referência a 'sentinela' foi trocada por 'sentinela_instance' para consistência
-        summary_para_previsao = sentinela_instance.get_latest_data_summary()
-        qualidade_prevista = summary_para_previsao.get('qualidade_previsao', 'Indisponível')
-        texto_qualidade_previsao.value = f"Previsão (24h): {qualidade_prevista}"
-
-        mapa_feedback_previsao = {
-            'Bom': (ft.Icons.THUMB_UP_OFF_ALT, ft.Colors.GREEN),
-            'Ruim': (ft.Icons.THUMB_DOWN_OFF_ALT, ft.Colors.ORANGE_800),
-            'Insuficiente': (ft.Icons.HOURGLASS_EMPTY, ft.Colors.BLUE_GREY),
-        }
-
-        icone, cor = mapa_feedback_previsao.get(qualidade_prevista, (ft.Icons.HELP_OUTLINE, ft.Colors.GREY))
-        icone_qualidade_previsao.name = icone
-        icone_qualidade_previsao.color = cor
-        texto_qualidade_previsao.color = cor
-
-    # ***** LINHA CORRIGIDA AQUI *****
-    # Agora passamos o DataFrame da previsão (acessado via sentinela_instance.df_forecast)
-    # para a função que gera o gráfico.
-    controle_imagem_plot.src_base64 = gerar_imagem_grafico_base64(sentinela_instance.future_forecast, page.theme_mode)
-
-    indicador_carregamento.visible = False
-    page.update()
+
+def atualizar_elementos_ui(page: ft.Page, sentinela_instance: 'SentinelaVerde'):
+    """Exibe imediatamente o estado mais recente do backend (botão "Atualizar Dados")."""
+    with _lock_ui:
+        aplicar_snapshot(page, sentinela_instance, sentinela_instance.snapshot())
 
 
 # --- Funções Restauradas do Frontend1 ---
@@ -161,14 +251,15 @@ def fetch_and_update_waqi_data(e):
     indicador_carregamento_externo.visible = True
     if container_sensores_externos.page: container_sensores_externos.update()
 
-    try:
-        url = f"https://api.waqi.info/feed/{cidade}/?token={WAQI_API_TOKEN}"
-        response = requests.get(url, timeout=15)
-        response.raise_for_status()
-        data = response.json()
+    # A consulta roda no pool do cliente; a UI é atualizada quando o resultado chega
+    api_client.get_client().fetch_feed_async(cidade).add_done_callback(exibir_resultado_waqi)
 
-        if data.get("status") == "ok":
-            aqi = data["data"]["aqi"]
+
+def exibir_resultado_waqi(futuro):
+    try:
+        feed = futuro.result()
+        aqi = feed["aqi"]
+        if isinstance(aqi, (int, float)):
             if aqi <= 50:
                 qualidade, cor = "Boa", ft.Colors.LIGHT_GREEN_700
             elif aqi <= 100:
@@ -181,10 +272,13 @@ def fetch_and_update_waqi_data(e):
                 qualidade, cor = "Perigosa", ft.Colors.PURPLE_800
             texto_qualidade_sensor_externo.value = f"AQI: {aqi} ({qualidade})"
         else:
-            texto_qualidade_sensor_externo.value = f"Erro: {data.get('data', 'Não encontrado')}"
+            texto_qualidade_sensor_externo.value = "AQI indisponível para esta estação."
             cor = ft.Colors.ERROR
         texto_qualidade_sensor_externo.color = cor
-    except requests.exceptions.RequestException:
+    except api_client.WAQIError as erro:
+        texto_qualidade_sensor_externo.value = f"Erro: {erro}"
+        texto_qualidade_sensor_externo.color = ft.Colors.ERROR
+    except Exception:
         texto_qualidade_sensor_externo.value = "Erro de conexão com a API."
         texto_qualidade_sensor_externo.color = ft.Colors.ERROR
     finally:
@@ -192,17 +286,116 @@ def fetch_and_update_waqi_data(e):
         if container_sensores_externos.page: container_sensores_externos.update()
 
 
-def consultar_sensor_externo_thread(e):
-    threading.Thread(target=fetch_and_update_waqi_data, args=(e,), daemon=True).start()
-
-
 def exibir_resumo(page: ft.Page, sentinela_instance: 'SentinelaVerde'):
     area_texto_relatorio.value = sentinela_instance.get_formatted_summary()  # Usa a instância
     area_texto_relatorio.visible = True
     area_imagem_relatorio.visible = False
+    controles_historico.visible = False
+    page.update()
+
+
+# --- Histórico (consultas de intervalo reamostradas pelo backend) ---
+
+PIXELS_HISTORICO = 700
+JANELAS_HISTORICO = {'24h': pd.Timedelta(hours=24), '7d': pd.Timedelta(days=7),
+                     '30d': pd.Timedelta(days=30), '1 ano': pd.Timedelta(days=365)}
+
+dropdown_coluna_historico = ft.Dropdown(
+    options=[ft.dropdown.Option(key=col, text=col.replace('_', ' ')) for col in (
+        'Concentracao_Geral_PPM', 'PM2.5_ug_m3', 'PM10_ug_m3', 'Temperatura_C', 'Umidade_Relativa_percent')],
+    value='Concentracao_Geral_PPM', width=260
+)
+texto_intervalo_historico = ft.Text("", size=12)
+controles_historico = ft.Row(visible=False, wrap=True)
+estado_historico: Dict[str, Any] = {'fim': None, 'janela': JANELAS_HISTORICO['24h']}
+
+
+class GraficoHistorico:
+    """Faixa mínimo-máximo e média de uma coluna no intervalo consultado, com Figure reaproveitada."""
+    def __init__(self):
+        self.figura = Figure(figsize=(8, 3.6), dpi=100)
+        self.figura.set_facecolor('none')
+        self.eixos = self.figura.add_subplot(111)
+        self._lock = threading.Lock()
+
+    def render(self, df: pd.DataFrame, coluna: str, page_theme_mode: ft.ThemeMode) -> str:
+        with self._lock, metrics.span('render', chart='historico'):
+            cor_texto = 'white' if page_theme_mode == ft.ThemeMode.DARK else 'black'
+            eixos = self.eixos
+            eixos.clear()
+            eixos.set_facecolor('none')
+            if df.empty or df[coluna].isna().all():
+                eixos.text(0.5, 0.5, "Sem dados no intervalo", ha='center', va='center', color=cor_texto,
+                           transform=eixos.transAxes)
+            else:
+                eixos.fill_between(df.index, df[f'{coluna}_min'], df[f'{coluna}_max'], alpha=0.3, step='post',
+                                   label='mín–máx')
+                eixos.plot(df.index, df[coluna], linewidth=1.2, label='média')
+                eixos.legend(prop={'size': 8}, labelcolor=cor_texto)
+            eixos.set_title(f"{coluna.replace('_', ' ')} (agregação: {df.attrs.get('nivel', '-')})",
+                            color=cor_texto, size=10)
+            eixos.tick_params(axis='x', colors=cor_texto, rotation=30, labelsize=8)
+            eixos.tick_params(axis='y', colors=cor_texto, labelsize=8)
+            for spine in eixos.spines.values():
+                spine.set_edgecolor(cor_texto)
+            self.figura.tight_layout(pad=1.5)
+            buf = io.BytesIO()
+            self.figura.savefig(buf, format="png", transparent=True)
+            return base64.b64encode(buf.getvalue()).decode("utf-8")
+
+
+grafico_historico = GraficoHistorico()
+
+
+def atualizar_historico(page: ft.Page, sentinela_instance: 'SentinelaVerde'):
+    """Consulta a janela atual do histórico e redesenha o gráfico."""
+    fim = estado_historico['fim'] or pd.Timestamp.now()
+    inicio = fim - estado_historico['janela']
+    coluna = dropdown_coluna_historico.value
+    df = sentinela_instance.query_range(inicio, fim, pixels=PIXELS_HISTORICO, columns=[coluna], mode='minmax')
+    area_imagem_relatorio.src_base64 = grafico_historico.render(df, coluna, page.theme_mode)
+    texto_intervalo_historico.value = f"{inicio:%d/%m/%Y %H:%M} – {fim:%d/%m/%Y %H:%M}"
     page.update()
 
 
+def navegar_historico(page: ft.Page, sentinela_instance: 'SentinelaVerde', zoom: float = 1.0,
+                      deslocamento: float = 0.0, janela: Optional[str] = None):
+    """Aproxima/afasta (`zoom`), desloca (fração da janela) ou escolhe uma janela predefinida."""
+    fim = estado_historico['fim'] or pd.Timestamp.now()
+    if janela is not None:
+        estado_historico['janela'], fim = JANELAS_HISTORICO[janela], None
+    else:
+        atual = estado_historico['janela']
+        nova = max(atual * zoom, pd.Timedelta(minutes=30))
+        # O zoom mantém o centro da janela; o deslocamento move o fim
+        fim = fim - (atual - nova) / 2 + atual * deslocamento
+        estado_historico['janela'] = nova
+        if fim >= pd.Timestamp.now():
+            fim = None
+    estado_historico['fim'] = fim
+    atualizar_historico(page, sentinela_instance)
+
+
+def exibir_historico(page: ft.Page, sentinela_instance: 'SentinelaVerde'):
+    if not controles_historico.controls:
+        def navegar(**kwargs):
+            return lambda e: navegar_historico(page, sentinela_instance, **kwargs)
+        dropdown_coluna_historico.on_change = lambda e: atualizar_historico(page, sentinela_instance)
+        controles_historico.controls = [
+            dropdown_coluna_historico,
+            *[ft.OutlinedButton(nome, on_click=navegar(janela=nome)) for nome in JANELAS_HISTORICO],
+            ft.IconButton(ft.Icons.ZOOM_IN, tooltip="Aproximar", on_click=navegar(zoom=0.5)),
+            ft.IconButton(ft.Icons.ZOOM_OUT, tooltip="Afastar", on_click=navegar(zoom=2.0)),
+            ft.IconButton(ft.Icons.CHEVRON_LEFT, tooltip="Anterior", on_click=navegar(deslocamento=-0.5)),
+            ft.IconButton(ft.Icons.CHEVRON_RIGHT, tooltip="Próximo", on_click=navegar(deslocamento=0.5)),
+            texto_intervalo_historico,
+        ]
+    controles_historico.visible = True
+    area_texto_relatorio.visible = False
+    area_imagem_relatorio.visible = True
+    atualizar_historico(page, sentinela_instance)
+
+
 def exibir_recomendacoes(page: ft.Page):
     qualidade_atual = texto_qualidade_ar.value
     mapa_recomendacoes = {
@@ -216,21 +409,10 @@ def exibir_recomendacoes(page: ft.Page):
     area_texto_relatorio.value = f"--- Recomendações para Qualidade do Ar: {qualidade_atual} ---\n\n{texto_recomendacao}"
     area_texto_relatorio.visible = True
     area_imagem_relatorio.visible = False
+    controles_historico.visible = False
     page.update()
 
 
-def realtime_update_loop(page: ft.Page, sentinela_instance: 'SentinelaVerde'):
-    while not parar_thread_atualizacao.is_set():
-        if switch_atualizacao_automatica.value:
-            try:
-                # Chama a função de atualização passando a instância
-                atualizar_elementos_ui(page, sentinela_instance)
-            except Exception as e:
-                print(f"Erro na atualização automática: {e}")
-
-        time.sleep(5)
-
-
 def main(page: ft.Page, sentinela_instance: 'SentinelaVerde'):
     """Constrói a interface gráfica completa, mesclando as duas versões."""
     page.title = "Sentinela Verde Ambiental"
@@ -238,12 +420,12 @@ def main(page: ft.Page, sentinela_instance: 'SentinelaVerde'):
     page.vertical_alignment = ft.MainAxisAlignment.START
     page.fonts = {"Consolas": "Consolas, 'Courier New', monospace"}
 
-    # --- Configura o callback e inicia a thread de atualização ---
-    sentinela_instance.page_update_callback = lambda: atualizar_elementos_ui(page, sentinela_instance)
-
-    update_thread = threading.Thread(target=realtime_update_loop, args=(page, sentinela_instance), daemon=True)
-    update_thread.start()
-    page.on_disconnect = lambda e: parar_thread_atualizacao.set()
+    # --- Assina o feed de alterações do backend (atualizações agrupadas em até `max_fps` por segundo) ---
+    max_fps = sentinela_instance.config.get('ui', {}).get('max_fps', 4)
+    assinatura = sentinela_instance.changes.subscribe(
+        lambda snapshot: receber_snapshot(page, sentinela_instance, snapshot), max_fps=max_fps
+    )
+    page.on_disconnect = lambda e: assinatura.cancel()
 
     # --- Definição dos Componentes da UI ---
     card_concentracao = ft.Card(content=ft.Container(
@@ -264,7 +446,7 @@ def main(page: ft.Page, sentinela_instance: 'SentinelaVerde'):
     container_qualidade_ar.border_radius = 10
 
     # Container de sensores externos (ligado à função real)
-    dropdown_sensores_externos.on_change = consultar_sensor_externo_thread
+    dropdown_sensores_externos.on_change = fetch_and_update_waqi_data
     container_sensores_externos.content = ft.Column([
         ft.Row([ft.Icon(ft.Icons.TRAVEL_EXPLORE), ft.Text("Consulta Externa (WAQI)")]),
         dropdown_sensores_externos,
@@ -311,7 +493,10 @@ def main(page: ft.Page, sentinela_instance: 'SentinelaVerde'):
         ft.Row([
             ft.ElevatedButton("Resumo", on_click=lambda e: exibir_resumo(page, sentinela_instance)),
             ft.ElevatedButton("Recomendações", icon=ft.Icons.RECOMMEND, on_click=lambda e: exibir_recomendacoes(page)),
+            ft.ElevatedButton("Histórico", icon=ft.Icons.TIMELINE,
+                              on_click=lambda e: exibir_historico(page, sentinela_instance)),
         ]),
+        controles_historico,
         ft.Container(
             content=ft.Column([area_texto_relatorio, area_imagem_relatorio], scroll=ft.ScrollMode.ADAPTIVE,
                               expand=True),
@@ -331,5 +516,7 @@ def main(page: ft.Page, sentinela_instance: 'SentinelaVerde'):
 
     page.add(abas)
 
-    # Inicia a primeira análise e atualização da UI
-    sentinela_instance.run_analysis()
+    # Exibe imediatamente o estado restaurado do checkpoint (se houver) e agenda
+    # a primeira análise em segundo plano; o feed de alterações atualiza a UI ao concluir.
+    atualizar_elementos_ui(page, sentinela_instance)
+    sentinela_instance.analysis_scheduler.request_run()
@@ -0,0 +1,296 @@
+# holtwinters.py (Holt-Winters: atualização incremental e ajuste vetorizado)
+# -*- coding: utf-8 -*-
+
+import logging
+import math
+import multiprocessing
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+def _param(params: dict, name: str, default: float) -> float:
+    valor = params.get(name)
+    if valor is None or (isinstance(valor, float) and math.isnan(valor)):
+        return default
+    return float(valor)
+
+
+def boxcox(y, lam: float):
+    """Transformação de Box-Cox (logaritmo quando `lam` é 0)."""
+    if lam == 0:
+        return np.log(y)
+    return (np.power(y, lam) - 1) / lam
+
+
+def inv_boxcox(x, lam: float):
+    """Inversa de `boxcox`; valores fora do domínio da inversa resultam em 0."""
+    if lam == 0:
+        return np.exp(x)
+    return np.power(np.maximum(lam * np.asarray(x, dtype=np.float64) + 1, 0.0), 1 / lam)
+
+
+class OnlineHoltWinters:
+    """
+    Estado de um modelo Holt-Winters (nível, tendência e sazonalidade).
+
+    Após um ajuste completo, cada nova observação horária atualiza o estado pelas
+    recursões de Holt-Winters em O(1), no mesmo formato usado pelo statsmodels.
+    A tendência é aditiva (amortecida quando `phi` < 1) e a sazonalidade pode ser
+    aditiva ou multiplicativa (`seasonal`). Com `boxcox_lambda`, o estado fica na
+    escala transformada e as previsões voltam à escala original.
+    O erro quadrático das previsões de um passo é acompanhado por uma média móvel
+    exponencial para sinalizar quando o ajuste completo deve ser refeito.
+    """
+    def __init__(self, alpha: float, beta: float, gamma: float, phi: float,
+                 level: float, trend: float, season: np.ndarray,
+                 last_timestamp: pd.Timestamp, fit_mse: float, n_obs: int,
+                 seasonal: str = 'add', boxcox_lambda: Optional[float] = None):
+        self.alpha = alpha
+        self.beta = beta
+        self.gamma = gamma
+        self.phi = phi
+        self.level = level
+        self.trend = trend
+        # season[(self._pos + k) % m] é o componente sazonal de k+1 passos à frente
+        self.season = np.asarray(season, dtype=np.float64).copy()
+        self.seasonal = seasonal
+        self.boxcox_lambda = boxcox_lambda
+        self._pos = 0
+        self.last_timestamp = pd.Timestamp(last_timestamp)
+        self.fit_mse = fit_mse
+        self.residual_mse = fit_mse
+        self.n_obs = n_obs
+        self.updates_since_fit = 0
+
+    @property
+    def seasonal_periods(self) -> int:
+        return len(self.season)
+
+    @classmethod
+    def from_results(cls, results: Any) -> 'OnlineHoltWinters':
+        """Extrai o estado final de um `HoltWintersResults` do statsmodels."""
+        params = results.params
+        has_trend = results.model.trend is not None
+        has_season = results.model.seasonal is not None
+        m = results.model.seasonal_periods if has_season else 1
+        season = np.asarray(results.season)[-m:] if has_season else np.zeros(1)
+        level = pd.Series(results.level)
+        n_obs = len(level)
+        return cls(
+            alpha=_param(params, 'smoothing_level', 0.0),
+            beta=_param(params, 'smoothing_trend', 0.0) if has_trend else 0.0,
+            gamma=_param(params, 'smoothing_seasonal', 0.0) if has_season else 0.0,
+            phi=_param(params, 'damping_trend', 1.0),
+            level=float(level.iloc[-1]),
+            trend=float(np.asarray(results.trend)[-1]) if has_trend else 0.0,
+            season=season,
+            last_timestamp=level.index[-1],
+            fit_mse=float(results.sse) / max(n_obs, 1),
+            n_obs=n_obs,
+            seasonal=results.model.seasonal if has_season else 'add',
+            boxcox_lambda=_param(params, 'lamda', 0.0) if params.get('use_boxcox') else None,
+        )
+
+    def to_state(self) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+        """Retorna (arrays, metadados) para persistência em checkpoint."""
+        meta = {
+            'alpha': self.alpha, 'beta': self.beta, 'gamma': self.gamma, 'phi': self.phi,
+            'level': self.level, 'trend': self.trend, 'pos': self._pos,
+            'last_timestamp': self.last_timestamp.isoformat(), 'fit_mse': self.fit_mse,
+            'residual_mse': self.residual_mse, 'n_obs': self.n_obs, 'updates_since_fit': self.updates_since_fit,
+            'seasonal': self.seasonal, 'boxcox_lambda': self.boxcox_lambda,
+        }
+        return {'season': self.season}, meta
+
+    @classmethod
+    def from_state(cls, arrays: Dict[str, np.ndarray], meta: Dict[str, Any]) -> 'OnlineHoltWinters':
+        state = cls(meta['alpha'], meta['beta'], meta['gamma'], meta['phi'], meta['level'], meta['trend'],
+                    arrays['season'], pd.Timestamp(meta['last_timestamp']), meta['fit_mse'], meta['n_obs'],
+                    seasonal=meta.get('seasonal', 'add'), boxcox_lambda=meta.get('boxcox_lambda'))
+        state._pos = meta['pos']
+        state.residual_mse = meta['residual_mse']
+        state.updates_since_fit = meta['updates_since_fit']
+        return state
+
+    def update(self, y: float, timestamp: pd.Timestamp, residual_halflife: float = 24.0):
+        """Aplica as recursões de Holt-Winters para uma nova observação."""
+        if math.isnan(y):
+            return
+        # A transformação de Box-Cox só é definida para valores positivos
+        if self.boxcox_lambda is not None and y <= 0:
+            return
+        x = boxcox(y, self.boxcox_lambda) if self.boxcox_lambda is not None else y
+        m = self.seasonal_periods
+        sazonal = self.season[self._pos]
+        tendencia_amortecida = self.phi * self.trend
+        base = self.level + tendencia_amortecida
+
+        nivel_anterior = self.level
+        if self.seasonal == 'mul':
+            previsto = base * sazonal
+            self.level = self.alpha * (x / sazonal) + (1 - self.alpha) * base
+            self.season[self._pos] = self.gamma * (x / base) + (1 - self.gamma) * sazonal
+        else:
+            previsto = base + sazonal
+            self.level = self.alpha * (x - sazonal) + (1 - self.alpha) * base
+            self.season[self._pos] = self.gamma * (x - base) + (1 - self.gamma) * sazonal
+        self.trend = self.beta * (self.level - nivel_anterior) + (1 - self.beta) * tendencia_amortecida
+        self._pos = (self._pos + 1) % m
+
+        if self.boxcox_lambda is not None:
+            previsto = float(inv_boxcox(previsto, self.boxcox_lambda))
+        peso = 1 - 0.5 ** (1 / residual_halflife)
+        self.residual_mse += peso * ((y - previsto) ** 2 - self.residual_mse)
+        self.last_timestamp = pd.Timestamp(timestamp)
+        self.n_obs += 1
+        self.updates_since_fit += 1
+
+    def forecast(self, horizon: int) -> np.ndarray:
+        passos = np.arange(1, horizon + 1)
+        if self.phi == 1.0:
+            fator = passos.astype(np.float64)
+        else:
+            fator = np.cumsum(self.phi ** passos)
+        indices = (self._pos + passos - 1) % self.seasonal_periods
+        base = self.level + fator * self.trend
+        previsto = base * self.season[indices] if self.seasonal == 'mul' else base + self.season[indices]
+        if self.boxcox_lambda is not None:
+            return inv_boxcox(previsto, self.boxcox_lambda)
+        return previsto
+
+    def is_drifting(self, factor: float) -> bool:
+        """Indica se o erro recente superou `factor` vezes o erro do ajuste."""
+        if self.fit_mse <= 0:
+            return False
+        return self.residual_mse > factor * self.fit_mse
+
+
+def forecast_frame(states: Dict[str, OnlineHoltWinters], horizon: int) -> pd.DataFrame:
+    """Monta o DataFrame de previsão (uma coluna por série, índice horário após o último dado)."""
+    last_known_timestamp = states[next(iter(states))].last_timestamp
+    forecast_index = pd.date_range(start=last_known_timestamp, periods=horizon + 1, freq='h')[1:]
+    return pd.DataFrame({col: state.forecast(horizon) for col, state in states.items()}, index=forecast_index)
+
+
+def _initial_state(y: np.ndarray, m: int, seasonal: bool):
+    """Estado inicial heurístico: médias das duas primeiras estações (ou dos dois primeiros pontos)."""
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        if seasonal:
+            primeira = np.nanmean(y[:, :m], axis=1)
+            segunda = np.nanmean(y[:, m:2 * m], axis=1)
+            level = primeira
+            trend = (segunda - primeira) / m
+            season = np.nan_to_num(y[:, :m] - primeira[:, None])
+        else:
+            level = np.nan_to_num(y[:, 0])
+            trend = np.nan_to_num(y[:, 1] - y[:, 0])
+            season = np.zeros((y.shape[0], 1))
+    return np.nan_to_num(level), np.nan_to_num(trend), season
+
+
+def _run_recursions(y: np.ndarray, alpha: np.ndarray, beta: np.ndarray, gamma: np.ndarray,
+                    m: int, seasonal: bool):
+    """
+    Executa as recursões aditivas para S séries e P combinações de parâmetros de uma vez.
+
+    `y` tem formato (S, T); `alpha`, `beta` e `gamma` são transmissíveis para (S, P).
+    Observações ausentes (NaN) são substituídas pela previsão de um passo.
+    Retorna (sse, level, trend, season) com formatos (S, P) e (S, P, m).
+    """
+    n_series, n_obs = y.shape
+    shape = np.broadcast_shapes(np.shape(alpha), np.shape(beta), np.shape(gamma), (n_series, 1))
+    level0, trend0, season0 = _initial_state(y, m, seasonal)
+    level = np.broadcast_to(level0[:, None], shape).copy()
+    trend = np.broadcast_to(trend0[:, None], shape).copy()
+    season = np.broadcast_to(season0[:, None, :], shape + (season0.shape[1],)).copy()
+    sse = np.zeros(shape)
+    periodo = season.shape[-1]
+
+    for t in range(n_obs):
+        pos = t % periodo
+        sazonal = season[..., pos]
+        previsto = level + trend + sazonal
+        observado = y[:, t:t + 1]
+        observado = np.where(np.isnan(observado), previsto, observado)
+        sse += (observado - previsto) ** 2
+        nivel = alpha * (observado - sazonal) + (1 - alpha) * (level + trend)
+        season[..., pos] = gamma * (observado - level - trend) + (1 - gamma) * sazonal
+        trend = beta * (nivel - level) + (1 - beta) * trend
+        level = nivel
+    return sse, level, trend, season
+
+
+def _grid_sse(y: np.ndarray, grid: np.ndarray, m: int, seasonal: bool) -> np.ndarray:
+    """SSE (S, P) de uma fatia da grade; executado também nos processos auxiliares."""
+    sse, _, _, _ = _run_recursions(y, grid[None, :, 0], grid[None, :, 1], grid[None, :, 2], m, seasonal)
+    return sse
+
+
+class BatchHoltWinters:
+    """
+    Ajusta Holt-Winters aditivo para muitas séries ao mesmo tempo.
+
+    As séries formam um array 2-D (S, T) com o mesmo índice horário. Os parâmetros
+    de suavização são escolhidos por busca em grade, avaliada de forma vetorizada
+    para todas as séries e combinações a cada passo de tempo. A grade pode ser
+    dividida entre processos (`n_jobs > 1`), iniciados com `spawn`. Séries curtas demais para duas
+    estações completas usam suavização exponencial com tendência, sem sazonalidade.
+    """
+    def __init__(self, seasonal_periods: int = 12, grid_size: int = 8, n_jobs: int = 1):
+        self.seasonal_periods = seasonal_periods
+        self.grid_size = grid_size
+        self.n_jobs = n_jobs
+
+    def _grid(self, seasonal: bool) -> np.ndarray:
+        valores = np.linspace(0.05, 0.95, self.grid_size)
+        gammas = valores if seasonal else np.zeros(1)
+        a, b, g = np.meshgrid(valores, valores, gammas, indexing='ij')
+        return np.column_stack([a.ravel(), b.ravel(), g.ravel()])
+
+    def _search(self, y: np.ndarray, grid: np.ndarray, m: int, seasonal: bool) -> np.ndarray:
+        if self.n_jobs <= 1 or len(grid) < 2 * self.n_jobs:
+            return _grid_sse(y, grid, m, seasonal)
+        fatias = np.array_split(grid, self.n_jobs)
+        # 'spawn': o serviço chama o ajuste com outras threads ativas, e um fork herdaria as suas travas
+        with ProcessPoolExecutor(max_workers=self.n_jobs, mp_context=multiprocessing.get_context('spawn')) as executor:
+            partes = executor.map(_grid_sse, [y] * len(fatias), fatias,
+                                  [m] * len(fatias), [seasonal] * len(fatias))
+            return np.concatenate(list(partes), axis=1)
+
+    def fit(self, df: pd.DataFrame) -> Dict[str, OnlineHoltWinters]:
+        """Ajusta todas as colunas de `df` (índice horário) e retorna o estado de cada uma."""
+        y = df.to_numpy(dtype=np.float64).T
+        n_obs = y.shape[1]
+        seasonal = n_obs >= 2 * self.seasonal_periods
+        m = self.seasonal_periods if seasonal else 1
+        if not seasonal:
+            logger.warning("IA - Previsão: Séries curtas para o modelo sazonal; usando suavização sem sazonalidade.")
+
+        grid = self._grid(seasonal)
+        sse = self._search(y, grid, m, seasonal)
+        melhores = grid[np.argmin(sse, axis=1)]
+
+        # Reexecuta com os melhores parâmetros de cada série para obter o estado final
+        sse_final, level, trend, season = _run_recursions(
+            y, melhores[:, 0:1], melhores[:, 1:2], melhores[:, 2:3], m, seasonal)
+        proxima = n_obs % season.shape[-1]
+        states = {}
+        for i, col in enumerate(df.columns):
+            states[col] = OnlineHoltWinters(
+                alpha=float(melhores[i, 0]), beta=float(melhores[i, 1]), gamma=float(melhores[i, 2]), phi=1.0,
+                level=float(level[i, 0]), trend=float(trend[i, 0]),
+                season=np.roll(season[i, 0], -proxima),
+                last_timestamp=df.index[-1], fit_mse=float(sse_final[i, 0]) / n_obs, n_obs=n_obs,
+            )
+        return states
+
+    def forecast(self, df: pd.DataFrame, horizon: int) -> pd.DataFrame:
+        """Ajusta e prevê em uma única chamada, no mesmo formato de `Forecaster.forecast`."""
+        return forecast_frame(self.fit(df), horizon)
@@ -0,0 +1,474 @@
+# ingestion.py (fila de ingestão das mensagens MQTT e consumidor em lotes)
+# -*- coding: utf-8 -*-
+
+import heapq
+import itertools
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SENSOR_COLUMNS = ('Temperatura_C', 'Umidade_Relativa_percent', 'Concentracao_Geral_PPM')
+
+# --- Formato binário ------------------------------------------------------------
+# Quadro (little-endian): cabeçalho de 8 bytes seguido de `count` amostras.
+#   cabeçalho: magic "SV" | versão (u8) | count (u8) | device_id (u32)
+#   amostra v2 (24 bytes): seq (u32) | timestamp do dispositivo em ms desde 1970,
+#              0 = desconhecido (u64) | temperatura (f32) | umidade (f32) | gás em PPM (f32)
+#   amostra v1 (20 bytes): igual, mas com o timestamp em segundos (u32)
+# Um quadro pode levar até 255 amostras, o que permite reenviar o acumulado após uma queda.
+FRAME_MAGIC = b'SV'
+FRAME_VERSION = 2
+FRAME_HEADER_DTYPE = np.dtype([('magic', 'S2'), ('version', 'u1'), ('count', 'u1'), ('device_id', '<u4')])
+FRAME_SAMPLE_DTYPES = {
+    1: np.dtype([('seq', '<u4'), ('timestamp', '<u4'), ('temperatura', '<f4'),
+                 ('umidade', '<f4'), ('gas', '<f4')]),
+    2: np.dtype([('seq', '<u4'), ('timestamp_ms', '<u8'), ('temperatura', '<f4'),
+                 ('umidade', '<f4'), ('gas', '<f4')]),
+}
+FRAME_SAMPLE_DTYPE = FRAME_SAMPLE_DTYPES[FRAME_VERSION]
+FRAME_MAX_SAMPLES = 255
+# Janela de números de sequência considerados repetidos (reentregas do QoS 1)
+SEQ_WINDOW = 1024
+
+
+def parse_sensor_payload(payload: str) -> Optional[Dict[str, Any]]:
+    """
+    Converte o payload `temp,umid,gas[,timestamp]` do ESP32 em um dicionário; None se
+    inválido. O 4º campo opcional é o horário do dispositivo em segundos desde 1970
+    (com fração); quando presente e não nulo, vira o `Timestamp` da leitura.
+    """
+    parts = payload.split(',')
+    if len(parts) not in (len(SENSOR_COLUMNS), len(SENSOR_COLUMNS) + 1):
+        return None
+    try:
+        dados: Dict[str, Any] = {col: float(valor) for col, valor in zip(SENSOR_COLUMNS, parts)}
+        if len(parts) > len(SENSOR_COLUMNS) and float(parts[-1]) > 0:
+            dados['Timestamp'] = datetime.fromtimestamp(float(parts[-1]))
+    except (ValueError, OverflowError, OSError):
+        return None
+    return dados
+
+
+def is_binary_frame(payload: bytes) -> bool:
+    return payload[:len(FRAME_MAGIC)] == FRAME_MAGIC
+
+
+def decode_sensor_frame(payload: bytes) -> Tuple[int, np.ndarray]:
+    """
+    Decodifica um quadro binário e retorna (device_id, amostras). As amostras são
+    um array estruturado (`FRAME_SAMPLE_DTYPE`) que aponta para o próprio payload,
+    sem cópia. Lança ValueError para quadros malformados.
+    """
+    if len(payload) < FRAME_HEADER_DTYPE.itemsize:
+        raise ValueError("quadro binário menor que o cabeçalho")
+    header = np.frombuffer(payload, dtype=FRAME_HEADER_DTYPE, count=1)[0]
+    sample_dtype = FRAME_SAMPLE_DTYPES.get(int(header['version']))
+    if header['magic'] != FRAME_MAGIC or sample_dtype is None:
+        raise ValueError(f"cabeçalho binário inválido (versão {header['version']})")
+    count = int(header['count'])
+    esperado = FRAME_HEADER_DTYPE.itemsize + count * sample_dtype.itemsize
+    if len(payload) != esperado:
+        raise ValueError(f"quadro com {len(payload)} bytes, esperado {esperado} para {count} amostra(s)")
+    amostras = np.frombuffer(payload, dtype=sample_dtype, count=count,
+                             offset=FRAME_HEADER_DTYPE.itemsize)
+    return int(header['device_id']), amostras
+
+
+def encode_sensor_frame(device_id: int, samples: List[Tuple[int, int, float, float, float]],
+                        version: int = FRAME_VERSION) -> bytes:
+    """
+    Monta um quadro binário a partir de tuplas (seq, timestamp, temperatura, umidade, gás);
+    o timestamp é em ms na versão 2 e em segundos na versão 1.
+    """
+    if len(samples) > FRAME_MAX_SAMPLES:
+        raise ValueError(f"no máximo {FRAME_MAX_SAMPLES} amostras por quadro")
+    header = np.array([(FRAME_MAGIC, version, len(samples), device_id)], dtype=FRAME_HEADER_DTYPE)
+    return header.tobytes() + np.array(samples, dtype=FRAME_SAMPLE_DTYPES[version]).tobytes()
+
+
+def device_instants(amostras: np.ndarray) -> np.ndarray:
+    """Epoch em ms do relógio do dispositivo para cada amostra; 0 quando ele não estava válido."""
+    if 'timestamp_ms' in amostras.dtype.names:
+        return amostras['timestamp_ms'].astype(np.int64)
+    return amostras['timestamp'].astype(np.int64) * 1000
+
+
+def frame_to_rows(amostras: np.ndarray, recebido_em: float) -> Tuple[List[Dict[str, Any]], np.ndarray]:
+    """
+    Converte as amostras de um quadro em linhas no formato do armazenamento, com o
+    `Timestamp` em milissegundos. Amostras sem timestamp do dispositivo usam o
+    horário de chegada do quadro. Retorna também os números de sequência, na mesma
+    ordem das linhas.
+    """
+    instantes = device_instants(amostras)
+    instantes = np.where(instantes > 0, instantes, int(recebido_em * 1000))
+    # Cada instante é convertido com o fuso local da sua própria data: um lote
+    # acumulado que atravessa a troca do horário de verão não fica deslocado
+    horarios = [datetime.fromtimestamp(ms / 1000) for ms in instantes.tolist()]
+    colunas = [np.round(amostras[campo].astype(np.float64), 3).tolist()
+               for campo in ('temperatura', 'umidade', 'gas')]
+    linhas = [
+        {'Timestamp': horario, SENSOR_COLUMNS[0]: temp, SENSOR_COLUMNS[1]: umid, SENSOR_COLUMNS[2]: gas}
+        for horario, temp, umid, gas in zip(horarios, *colunas)
+    ]
+    return linhas, amostras['seq']
+
+
+class IngestionQueue:
+    """
+    Fila limitada entre o callback do MQTT e o consumidor.
+
+    `put` nunca executa trabalho pesado: quando a fila está cheia, a política
+    `overflow` decide se a mensagem nova é descartada (`drop_newest`), se a mais
+    antiga dá lugar a ela (`drop_oldest`) ou se o produtor espera até
+    `block_timeout` segundos (`block`, aplicando contrapressão ao broker).
+    """
+    OVERFLOW_POLICIES = ('drop_newest', 'drop_oldest', 'block')
+
+    def __init__(self, maxsize: int = 10000, overflow: str = 'drop_oldest', block_timeout: float = 1.0):
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"Política de estouro da fila desconhecida: '{overflow}'")
+        self._queue: queue.Queue = queue.Queue(maxsize=maxsize)
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self._lock = threading.Lock()
+        self.enqueued = 0
+        self.dropped = 0
+        self.backlog_max = 0
+
+    def put(self, item: Any) -> bool:
+        """Enfileira o item; retorna False se ele (ou o mais antigo) foi descartado."""
+        aceito = True
+        try:
+            if self.overflow == 'block':
+                self._queue.put(item, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(item)
+        except queue.Full:
+            if self.overflow == 'drop_oldest':
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    pass
+                try:
+                    self._queue.put_nowait(item)
+                except queue.Full:
+                    pass
+            aceito = False
+        with self._lock:
+            if aceito:
+                self.enqueued += 1
+            else:
+                self.dropped += 1
+                if self.overflow == 'drop_oldest':
+                    self.enqueued += 1
+            self.backlog_max = max(self.backlog_max, self._queue.qsize())
+        return aceito
+
+    def get_batch(self, max_items: int, timeout: float) -> List[Any]:
+        """Espera até `timeout` pelo primeiro item e retorna todos os disponíveis (até `max_items`)."""
+        try:
+            itens = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while len(itens) < max_items:
+            try:
+                itens.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return itens
+
+    @property
+    def backlog(self) -> int:
+        return self._queue.qsize()
+
+
+class IngestionWorker:
+    """
+    Consumidor da fila de ingestão.
+
+    Retira as mensagens em lotes de até `batch_size`, converte os payloads e
+    entrega as leituras válidas a `commit_batch` agrupadas em um dicionário
+    `{tópico: [linhas]}`; cada tópico resulta em uma única gravação no
+    armazenamento por lote.
+    """
+    def __init__(self, config: dict, commit_batch: Callable[[Dict[str, List[Dict[str, Any]]]], None]):
+        self.queue = IngestionQueue(
+            maxsize=config.get('queue_size', 10000),
+            overflow=config.get('overflow', 'drop_oldest'),
+            block_timeout=config.get('block_timeout_seconds', 1.0),
+        )
+        self.batch_size = config.get('batch_size', 500)
+        self.poll_timeout = config.get('poll_timeout_seconds', 0.5)
+        self.stats_interval = config.get('stats_log_interval_seconds', 60)
+        self.commit_batch = commit_batch
+
+        self.processed = 0
+        self.invalid = 0
+        self.duplicates = 0
+        self.binary_frames = 0
+        # Tópico -> (último seq aceito, instante em ms do relógio do dispositivo, 0 se ausente)
+        self._last_seq: Dict[str, Tuple[int, int]] = {}
+        self.batches = 0
+        self.last_batch_size = 0
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        metrics.gauge('ingestion_backlog', lambda: self.queue.backlog)
+        metrics.gauge('ingestion_backlog_max', lambda: self.queue.backlog_max)
+        metrics.gauge('ingestion_dropped', lambda: self.queue.dropped)
+        metrics.gauge('ingestion_invalid', lambda: self.invalid)
+
+    def submit(self, topic: str, payload: Any) -> bool:
+        """Chamado pelo callback do MQTT: apenas registra o horário de chegada e enfileira."""
+        return self.queue.put((time.time(), topic, payload))
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="Ingestao")
+        self._thread.start()
+
+    def stop(self):
+        """Interrompe o consumidor depois de gravar o que ainda estiver na fila."""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        ultimo_log = time.monotonic()
+        while True:
+            parar = self._stop_event.is_set()
+            itens = self.queue.get_batch(self.batch_size, 0 if parar else self.poll_timeout)
+            if itens:
+                try:
+                    self._process(itens)
+                except Exception as e:
+                    logger.error(f"Erro ao gravar lote de ingestão com {len(itens)} mensagem(ns): {e}")
+            elif parar:
+                break
+            agora = time.monotonic()
+            if self.stats_interval and agora - ultimo_log >= self.stats_interval:
+                ultimo_log = agora
+                logger.info(f"Ingestão: {self.stats()}")
+
+    def _process(self, itens: List[Tuple[float, str, Any]]):
+        # Tempo que a mensagem mais antiga do lote esperou na fila
+        metrics.observe('queue_wait', max(time.time() - itens[0][0], 0.0))
+        with metrics.span('ingest'):
+            por_topico = self._decode_batch(itens)
+        if por_topico:
+            self.commit_batch(por_topico)
+        processadas = sum(len(linhas) for linhas in por_topico.values())
+        metrics.incr('ingested_rows', processadas)
+        self.processed += processadas
+        self.batches += 1
+        self.last_batch_size = len(itens)
+
+    def _decode_batch(self, itens: List[Tuple[float, str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+        """Converte as mensagens do lote em linhas agrupadas por tópico."""
+        por_topico: Dict[str, List[Dict[str, Any]]] = {}
+        for recebido_em, topic, payload in itens:
+            if isinstance(payload, (bytes, bytearray)):
+                if is_binary_frame(payload):
+                    por_topico.setdefault(topic, []).extend(self._decode_frame(topic, payload, recebido_em))
+                    continue
+                payload = payload.decode(errors='replace')
+            dados = parse_sensor_payload(payload)
+            if dados is None:
+                self.invalid += 1
+                logger.error(f"Payload MQTT inválido no tópico '{topic}': '{payload}'")
+                continue
+            # Sem horário do dispositivo, vale o instante de chegada (com fração de segundo)
+            dados.setdefault('Timestamp', datetime.fromtimestamp(recebido_em))
+            por_topico.setdefault(topic, []).append(dados)
+        return por_topico
+
+    def _decode_frame(self, topic: str, payload: bytes, recebido_em: float) -> List[Dict[str, Any]]:
+        """Decodifica um quadro binário, descartando amostras já recebidas (mesmo `seq`)."""
+        try:
+            _, amostras = decode_sensor_frame(payload)
+        except ValueError as e:
+            self.invalid += 1
+            logger.error(f"Quadro binário inválido no tópico '{topic}': {e}")
+            return []
+        self.binary_frames += 1
+        linhas, seqs = frame_to_rows(amostras, recebido_em)
+        aceitas = []
+        ultimo, ultimo_ms = self._last_seq.get(topic, (None, 0))
+        for linha, seq, ms in zip(linhas, seqs.tolist(), device_instants(amostras).tolist()):
+            # Reentregas caem na janela logo abaixo do último seq. O dispositivo zera a
+            # contagem a cada boot: um seq na janela com relógio posterior ao da última
+            # amostra aceita (ou, sem relógio, o seq 1) indica reinício e é aceito.
+            if ultimo is not None and ultimo - SEQ_WINDOW < seq <= ultimo:
+                reinicio = ms > ultimo_ms if ms > 0 and ultimo_ms > 0 else seq == 1
+                if not reinicio:
+                    self.duplicates += 1
+                    continue
+            ultimo = seq
+            if ms > 0:
+                ultimo_ms = ms
+            aceitas.append(linha)
+        if ultimo is not None:
+            self._last_seq[topic] = (ultimo, ultimo_ms)
+        return aceitas
+
+    def stats(self) -> Dict[str, int]:
+        """Contadores da ingestão; `backlog` é o número atual de mensagens na fila."""
+        return {
+            'enfileiradas': self.queue.enqueued,
+            'descartadas': self.queue.dropped,
+            'processadas': self.processed,
+            'invalidas': self.invalid,
+            'duplicadas': self.duplicates,
+            'quadros_binarios': self.binary_frames,
+            'lotes': self.batches,
+            'ultimo_lote': self.last_batch_size,
+            'backlog': self.queue.backlog,
+            'backlog_max': self.queue.backlog_max,
+        }
+
+
+class ReorderBuffer:
+    """
+    Buffer de reordenação limitado das leituras de um dispositivo.
+
+    Cada leitura fica retida por até `delay` segundos (contados da chegada) em um
+    heap ordenado pelo `Timestamp`; as que chegam fora de ordem dentro desse prazo
+    são intercaladas na posição certa, sem ordenar o histórico. Quando o prazo de
+    uma leitura vence, ela e todas as anteriores a ela são liberadas em ordem. Com
+    mais de `max_rows` leituras retidas, as mais antigas são liberadas na hora.
+
+    Uma leitura anterior à última já liberada (`watermark`) é tardia: ela é
+    devolvida à parte por `pop_ready`, para ser gravada sem passar pelas séries
+    em memória, que só aceitam amostras em ordem.
+
+    Os campos de enriquecimento (PM2.5/PM10 do WAQI) aguardam até `merge_window`
+    segundos e são mesclados à primeira leitura liberada a menos de `merge_window`
+    segundos do seu Timestamp; sem leitura nesse intervalo, viram uma linha própria.
+    Essa linha nunca é tardia: se o seu Timestamp já ficou atrás do `watermark`, ela
+    é datada no `watermark`, para que os valores cheguem às séries em memória.
+    """
+    def __init__(self, delay: float = 0.2, merge_window: float = 60.0, max_rows: int = 10000):
+        self.delay = delay
+        self.merge_window = merge_window
+        self.max_rows = max_rows
+        self._janela = timedelta(seconds=merge_window)
+        self._heap: List[Tuple[datetime, int, Dict[str, Any]]] = []
+        # (prazo, Timestamp) na ordem de chegada: os prazos são crescentes. Entradas de
+        # leituras já liberadas pela capacidade apenas expiram, sem efeito.
+        self._prazos: Deque[Tuple[float, datetime]] = deque()
+        # [Timestamp, prazo, campos] dos enriquecimentos ainda não mesclados
+        self._enriquecimentos: List[List[Any]] = []
+        self._tardias: List[Dict[str, Any]] = []
+        self._ordem = itertools.count()
+        self._maior: Optional[datetime] = None
+        self._lock = threading.Lock()
+        self.watermark: Optional[datetime] = None
+        self.reordered = 0
+        self.late = 0
+        self.merged = 0
+
+    def push(self, rows: List[Dict[str, Any]], now: Optional[float] = None):
+        """Retém as leituras (cada uma com `Timestamp` datetime) até o prazo de reordenação."""
+        prazo = (time.monotonic() if now is None else now) + self.delay
+        with self._lock:
+            for row in rows:
+                self._reter(row, prazo)
+
+    def push_enrichment(self, timestamp: datetime, campos: Dict[str, Any], now: Optional[float] = None):
+        """Registra campos a mesclar na próxima leitura a até `merge_window` segundos de `timestamp`."""
+        agora = time.monotonic() if now is None else now
+        with self._lock:
+            if self.merge_window <= 0:
+                self._reter({'Timestamp': timestamp, **campos}, agora + self.delay)
+            else:
+                self._enriquecimentos.append([timestamp, agora + self.merge_window, dict(campos)])
+
+    def _reter(self, row: Dict[str, Any], prazo: Optional[float]):
+        """Coloca a leitura no heap; sem `prazo`, quem chama é responsável por liberá-la."""
+        ts = row['Timestamp']
+        if self.watermark is not None and ts < self.watermark:
+            self.late += 1
+            self._tardias.append(row)
+            return
+        if self._maior is not None and ts < self._maior:
+            self.reordered += 1
+        else:
+            self._maior = ts
+        heapq.heappush(self._heap, (ts, next(self._ordem), row))
+        if prazo is not None:
+            self._prazos.append((prazo, ts))
+
+    def pop_ready(self, now: Optional[float] = None,
+                  flush: bool = False) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        Retorna (leituras liberadas em ordem, leituras tardias). Com `flush`,
+        libera tudo o que estiver retido (ex.: no encerramento).
+        """
+        agora = time.monotonic() if now is None else now
+        with self._lock:
+            # Enriquecimentos sem par dentro da janela viram linhas próprias, datadas no
+            # máximo no watermark (os valores do WAQI valem a partir de então). Elas vão
+            # direto ao heap, sem prazo em `_prazos` (que sairia de ordem), e são liberadas já.
+            limite: Optional[datetime] = None
+            restantes = []
+            for entrada in self._enriquecimentos:
+                ts, prazo, campos = entrada
+                vencido = flush or prazo <= agora or \
+                    (self.watermark is not None and self.watermark > ts + self._janela)
+                if vencido:
+                    if self.watermark is not None and ts < self.watermark:
+                        ts = self.watermark
+                    self._reter({'Timestamp': ts, **campos}, None)
+                    limite = ts if limite is None or ts > limite else limite
+                else:
+                    restantes.append(entrada)
+            self._enriquecimentos = restantes
+
+            while self._prazos and (flush or self._prazos[0][0] <= agora):
+                ts = self._prazos.popleft()[1]
+                limite = ts if limite is None or ts > limite else limite
+            prontas = []
+            while self._heap and (flush or len(self._heap) > self.max_rows
+                                  or (limite is not None and self._heap[0][0] <= limite)):
+                ts, _, row = heapq.heappop(self._heap)
+                prontas.append(self._mesclar(row))
+                self.watermark = ts
+            tardias, self._tardias = self._tardias, []
+            return prontas, tardias
+
+    def _mesclar(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        if not self._enriquecimentos:
+            return row
+        ts = row['Timestamp']
+        for i, (ts_enriquecimento, _, campos) in enumerate(self._enriquecimentos):
+            if abs(ts - ts_enriquecimento) <= self._janela:
+                del self._enriquecimentos[i]
+                self.merged += 1
+                # Os valores do sensor prevalecem; o enriquecimento só preenche o que falta
+                return {**campos, **{col: valor for col, valor in row.items() if valor is not None}}
+        return row
+
+    def next_deadline(self) -> Optional[float]:
+        """Próximo instante (time.monotonic) em que algo retido precisa ser liberado."""
+        with self._lock:
+            prazos = [prazo for _, prazo, _ in self._enriquecimentos]
+            if self._prazos:
+                prazos.append(self._prazos[0][0])
+            return min(prazos) if prazos else None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._heap) + len(self._enriquecimentos)
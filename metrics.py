@@ -0,0 +1,347 @@
+# metrics.py (instrumentação das etapas críticas e endpoint de métricas)
+# -*- coding: utf-8 -*-
+
+import bisect
+import json
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Limites superiores (segundos) dos baldes do histograma de duração das etapas
+SPAN_BUCKETS = (0.00001, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+PREFIXO = 'sentinela'
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    if not labels:
+        return ()
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class SpanStats:
+    """Histograma de durações com baldes fixos: registrar custa uma busca binária e somas."""
+    __slots__ = ('counts', 'count', 'sum', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(SPAN_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, segundos: float):
+        self.counts[bisect.bisect_left(SPAN_BUCKETS, segundos)] += 1
+        self.count += 1
+        self.sum += segundos
+        if segundos > self.max:
+            self.max = segundos
+
+    def quantile(self, q: float) -> float:
+        """Estimativa do quantil pelo limite superior do balde (como o histogram_quantile do Prometheus)."""
+        if self.count == 0:
+            return 0.0
+        alvo = q * self.count
+        acumulado = 0
+        for limite, n in zip(SPAN_BUCKETS + (self.max,), self.counts):
+            acumulado += n
+            if acumulado >= alvo:
+                return min(limite, self.max)
+        return self.max
+
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            'count': self.count, 'sum': self.sum, 'max': self.max,
+            'mean': self.sum / self.count if self.count else 0.0,
+            'p50': self.quantile(0.5), 'p99': self.quantile(0.99),
+        }
+
+
+class _Span:
+    __slots__ = ('stats', 'lock', 'inicio')
+
+    def __init__(self, stats: SpanStats, lock: threading.Lock):
+        self.stats = stats
+        self.lock = lock
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        duracao = time.perf_counter() - self.inicio
+        with self.lock:
+            self.stats.observe(duracao)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class MetricsRegistry:
+    """
+    Registro de métricas do processo.
+
+    - `span(etapa, **labels)`: mede a duração de um trecho (histograma por etapa);
+    - `incr(nome, n, **labels)`: contador monotônico;
+    - `gauge(nome, fn, **labels)`: valor instantâneo lido só na exportação
+      (profundidade de filas, idade dos modelos...), sem custo no caminho crítico.
+
+    Com `enabled = False`, os spans viram no-ops.
+    """
+    def __init__(self):
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._spans: Dict[Tuple[str, Labels], SpanStats] = {}
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._gauges: Dict[Tuple[str, Labels], Callable[[], Optional[float]]] = {}
+        self._by_call: Dict[tuple, SpanStats] = {}
+
+    def span(self, stage: str, **labels: Any):
+        if not self.enabled:
+            return _NULL_SPAN
+        # Cache pela chamada (etapa + labels na ordem recebida): evita normalizar os labels a cada span
+        chamada = (stage, *labels.items())
+        stats = self._by_call.get(chamada)
+        if stats is None:
+            stats = self._by_call[chamada] = self._stats((stage, _labels(labels)))
+        return _Span(stats, self._lock)
+
+    def _stats(self, key: Tuple[str, Labels]) -> SpanStats:
+        stats = self._spans.get(key)
+        if stats is None:
+            with self._lock:
+                stats = self._spans.setdefault(key, SpanStats())
+        return stats
+
+    def observe(self, key: Tuple[str, Labels], segundos: float):
+        stats = self._stats(key)
+        with self._lock:
+            stats.observe(segundos)
+
+    def incr(self, name: str, n: float = 1, **labels: Any):
+        if not self.enabled:
+            return
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + n
+
+    def gauge(self, name: str, fn: Callable[[], Optional[float]], **labels: Any):
+        """Registra (ou substitui) a função que fornece o valor do gauge."""
+        with self._lock:
+            self._gauges[(name, _labels(labels))] = fn
+
+    def _collect(self) -> Tuple[Dict, Dict, Dict]:
+        with self._lock:
+            spans = {key: SpanStats.__new__(SpanStats) for key in self._spans}
+            for key, stats in self._spans.items():
+                copia = spans[key]
+                copia.counts, copia.count, copia.sum, copia.max = list(stats.counts), stats.count, stats.sum, stats.max
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+        valores = {}
+        for key, fn in gauges.items():
+            try:
+                valor = fn()
+            except Exception as e:
+                logger.debug(f"Métricas: falha ao ler o gauge {key[0]}: {e}")
+                continue
+            if valor is not None:
+                valores[key] = float(valor)
+        return spans, counters, valores
+
+    @staticmethod
+    def _nome(key: Tuple[str, Labels]) -> str:
+        nome, labels = key
+        return nome + ('{' + ','.join(f'{k}={v}' for k, v in labels) + '}' if labels else '')
+
+    def to_json(self) -> Dict[str, Any]:
+        spans, counters, gauges = self._collect()
+        return {
+            'spans': {self._nome(key): stats.to_dict() for key, stats in spans.items()},
+            'counters': {self._nome(key): valor for key, valor in counters.items()},
+            'gauges': {self._nome(key): valor for key, valor in gauges.items()},
+        }
+
+    def to_prometheus(self) -> str:
+        """Formato de exposição em texto do Prometheus."""
+        spans, counters, gauges = self._collect()
+
+        def rotulos(labels: Labels, extra: Labels = ()) -> str:
+            itens = labels + extra
+            if not itens:
+                return ''
+            return '{' + ','.join(f'{k}="{v}"' for k, v in itens) + '}'
+
+        linhas: List[str] = []
+        if spans:
+            nome = f'{PREFIXO}_stage_seconds'
+            linhas.append(f'# TYPE {nome} histogram')
+            for (etapa, labels), stats in sorted(spans.items()):
+                base = (('stage', etapa),) + labels
+                acumulado = 0
+                for limite, n in zip(SPAN_BUCKETS, stats.counts):
+                    acumulado += n
+                    linhas.append(f'{nome}_bucket{rotulos(base, (("le", repr(limite)),))} {acumulado}')
+                linhas.append(f'{nome}_bucket{rotulos(base, (("le", "+Inf"),))} {stats.count}')
+                linhas.append(f'{nome}_sum{rotulos(base)} {stats.sum}')
+                linhas.append(f'{nome}_count{rotulos(base)} {stats.count}')
+        for tipo, valores, sufixo in (('counter', counters, '_total'), ('gauge', gauges, '')):
+            declarados = set()
+            for (nome, labels), valor in sorted(valores.items()):
+                completo = f'{PREFIXO}_{nome}{sufixo}'
+                if completo not in declarados:
+                    linhas.append(f'# TYPE {completo} {tipo}')
+                    declarados.add(completo)
+                linhas.append(f'{completo}{rotulos(labels)} {valor}')
+        return '\n'.join(linhas) + '\n'
+
+    def summary_lines(self, anterior: Optional[Dict[Tuple[str, Labels], Tuple[int, float]]] = None):
+        """Linhas do resumo periódico (contagem e média no intervalo, p99 e máximo acumulados)."""
+        spans, _, gauges = self._collect()
+        anterior = anterior or {}
+        linhas = []
+        atual = {}
+        for key, stats in sorted(spans.items()):
+            n0, s0 = anterior.get(key, (0, 0.0))
+            atual[key] = (stats.count, stats.sum)
+            n = stats.count - n0
+            media = (stats.sum - s0) / n * 1000 if n else 0.0
+            linhas.append(f"{self._nome(key)}: {n} no intervalo, média {media:.2f} ms, "
+                          f"p99 {stats.quantile(0.99) * 1000:.2f} ms, máx {stats.max * 1000:.2f} ms")
+        for key, valor in sorted(gauges.items()):
+            linhas.append(f"{self._nome(key)} = {valor:g}")
+        return linhas, atual
+
+    def reset(self):
+        with self._lock:
+            self._spans.clear()
+            self._counters.clear()
+            self._by_call.clear()
+
+
+REGISTRY = MetricsRegistry()
+
+
+def span(stage: str, **labels: Any):
+    """Atalho para `REGISTRY.span`: `with metrics.span('persist', device='esp01'): ...`"""
+    return REGISTRY.span(stage, **labels)
+
+
+def observe(stage: str, segundos: float, **labels: Any):
+    """Registra uma duração medida fora de um `span` (ex.: tempo de espera na fila)."""
+    if REGISTRY.enabled:
+        REGISTRY.observe((stage, _labels(labels)), segundos)
+
+
+def incr(name: str, n: float = 1, **labels: Any):
+    REGISTRY.incr(name, n, **labels)
+
+
+def gauge(name: str, fn: Callable[[], Optional[float]], **labels: Any):
+    REGISTRY.gauge(name, fn, **labels)
+
+
+class MetricsServer:
+    """
+    Servidor HTTP local (thread própria) com `/metrics` no formato do Prometheus
+    e `/metrics.json` em JSON. Por padrão escuta apenas em 127.0.0.1.
+    """
+    def __init__(self, registry: MetricsRegistry = REGISTRY, host: str = '127.0.0.1', port: int = 9108):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        registro = registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                caminho = self.path.split('?', 1)[0]
+                if caminho == '/metrics':
+                    corpo = registro.to_prometheus().encode('utf-8')
+                    tipo = 'text/plain; version=0.0.4; charset=utf-8'
+                elif caminho == '/metrics.json':
+                    corpo = json.dumps(registro.to_json(), ensure_ascii=False).encode('utf-8')
+                    tipo = 'application/json; charset=utf-8'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', tipo)
+                self.send_header('Content-Length', str(len(corpo)))
+                self.end_headers()
+                self.wfile.write(corpo)
+
+            def log_message(self, format, *args):
+                logger.debug("Métricas HTTP: " + format % args)
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.address = self.httpd.server_address
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True, name="MetricasHTTP")
+
+    def start(self) -> 'MetricsServer':
+        self._thread.start()
+        logger.info(f"Métricas disponíveis em http://{self.address[0]}:{self.address[1]}/metrics")
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class MetricsLogger:
+    """Registra no log, a cada `interval` segundos, o resumo das etapas e dos gauges."""
+    def __init__(self, registry: MetricsRegistry = REGISTRY, interval: float = 300.0):
+        self.registry = registry
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="MetricasLog")
+
+    def start(self) -> 'MetricsLogger':
+        self._thread.start()
+        return self
+
+    def _run(self):
+        anterior = None
+        while not self._stop_event.wait(self.interval):
+            linhas, anterior = self.registry.summary_lines(anterior)
+            if linhas:
+                logger.info("Métricas:\n  " + "\n  ".join(linhas))
+
+    def stop(self):
+        self._stop_event.set()
+
+
+class MetricsService:
+    """Servidor HTTP e log periódico criados a partir da seção `metrics` do config."""
+    def __init__(self, metrics_conf: dict, registry: MetricsRegistry = REGISTRY):
+        registry.enabled = metrics_conf.get('enabled', True)
+        self.server: Optional[MetricsServer] = None
+        self.logger: Optional[MetricsLogger] = None
+        http_conf = metrics_conf.get('http', {})
+        if registry.enabled and http_conf.get('enabled', False):
+            try:
+                self.server = MetricsServer(registry, http_conf.get('host', '127.0.0.1'),
+                                            http_conf.get('port', 9108)).start()
+            except OSError as e:
+                logger.error(f"Não foi possível iniciar o endpoint de métricas: {e}")
+        intervalo = metrics_conf.get('log_interval_seconds', 0)
+        if registry.enabled and intervalo:
+            self.logger = MetricsLogger(registry, intervalo).start()
+
+    def stop(self):
+        if self.server is not None:
+            self.server.stop()
+        if self.logger is not None:
+            self.logger.stop()
@@ -0,0 +1,241 @@
+# model_selection.py (seleção da configuração do Holt-Winters por validação cruzada)
+# -*- coding: utf-8 -*-
+
+import logging
+import multiprocessing
+import threading
+import time
+import warnings
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class HoltWintersConfig(NamedTuple):
+    """Estrutura de um Holt-Winters; os parâmetros de suavização são estimados no ajuste."""
+    seasonal: Optional[str] = 'add'           # 'add', 'mul' ou None (sem sazonalidade)
+    seasonal_periods: Optional[int] = 12
+    damped_trend: bool = False
+    use_boxcox: bool = False
+
+    @classmethod
+    def from_dict(cls, valores: Dict[str, Any]) -> 'HoltWintersConfig':
+        return cls(**{campo: valores[campo] for campo in cls._fields if campo in valores})
+
+    def describe(self) -> str:
+        partes = [f"sazonal {self.seasonal} ({self.seasonal_periods} h)" if self.seasonal else "sem sazonalidade"]
+        if self.damped_trend:
+            partes.append("tendência amortecida")
+        if self.use_boxcox:
+            partes.append("Box-Cox")
+        return ", ".join(partes)
+
+
+NON_SEASONAL = HoltWintersConfig(seasonal=None, seasonal_periods=None)
+
+
+def fit_holt_winters(series: Any, config: HoltWintersConfig) -> Any:
+    """Ajusta o `ExponentialSmoothing` do statsmodels (tendência aditiva) com a estrutura dada."""
+    from statsmodels.tsa.holtwinters import ExponentialSmoothing
+    return ExponentialSmoothing(
+        series,
+        trend='add',
+        damped_trend=config.damped_trend,
+        seasonal=config.seasonal,
+        seasonal_periods=config.seasonal_periods if config.seasonal else None,
+        use_boxcox=config.use_boxcox,
+    ).fit()
+
+
+def _rolling_origin_rmse(tarefa: Tuple[np.ndarray, HoltWintersConfig, List[int], int]) -> float:
+    """
+    RMSE médio das previsões de `horizon` passos feitas a partir de cada origem,
+    com o modelo ajustado somente nos dados anteriores a ela. Executado também nos
+    processos auxiliares; configurações que falham no ajuste recebem erro infinito.
+    """
+    y, config, origens, horizon = tarefa
+    erros = []
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        for origem in origens:
+            try:
+                previsto = np.asarray(fit_holt_winters(y[:origem], config).forecast(horizon), dtype=np.float64)
+            except Exception:
+                return float('inf')
+            if not np.all(np.isfinite(previsto)):
+                return float('inf')
+            erros.append(np.sqrt(np.mean((previsto - y[origem:origem + horizon]) ** 2)))
+    return float(np.mean(erros))
+
+
+class ModelSelector:
+    """
+    Escolhe, para cada coluna, a estrutura do Holt-Winters com o menor erro de previsão.
+
+    A grade combina os períodos sazonais (`seasonal_periods`), o tipo de sazonalidade
+    (`seasonal`), a tendência amortecida (`damped_trend`) e a transformação de Box-Cox
+    (`use_boxcox`), além do modelo sem sazonalidade. Cada candidato é avaliado por
+    validação cruzada com origem móvel: `folds` origens nas últimas horas da janela
+    de `window_hours`, com o erro medido no horizonte da previsão. As avaliações são
+    distribuídas entre `n_jobs` processos, iniciados com `spawn` para não herdar
+    as threads do serviço; `cancel` interrompe a seleção em andamento (no encerramento).
+
+    A configuração vencedora fica em cache por coluna e a seleção só é refeita a cada
+    `interval_hours` horas ou quando o histórico disponível dobrou desde a anterior.
+    Sazonalidade multiplicativa e Box-Cox só são avaliadas em séries positivas, e
+    períodos sem duas estações completas antes da primeira origem são descartados.
+    """
+    def __init__(self, config: dict, target_columns: List[str], horizon: int):
+        self.enabled = config.get('enabled', True)
+        self.seasonal_periods = config.get('seasonal_periods', [24, 168])
+        self.seasonal = config.get('seasonal', ['add', 'mul'])
+        self.damped_trend = config.get('damped_trend', [False, True])
+        self.use_boxcox = config.get('use_boxcox', [False, True])
+        self.folds = config.get('folds', 3)
+        self.window_hours = config.get('window_hours', 1440)
+        self.interval_hours = config.get('interval_hours', 168)
+        self.n_jobs = config.get('n_jobs', 2)
+        self.target_columns = target_columns
+        self.horizon = horizon
+
+        self.selected: Dict[str, HoltWintersConfig] = {}
+        self.scores: Dict[str, float] = {}
+        self.selected_at: Optional[float] = None
+        # Última tentativa (mesmo sem vencedora) e horas de histórico avaliadas nela
+        self.last_attempt: Optional[float] = None
+        self.selected_hours = 0
+        self.history: deque = deque(maxlen=config.get('history_size', 20))
+        self._cancel = threading.Event()
+
+    @classmethod
+    def from_config(cls, forecast_conf: dict) -> 'ModelSelector':
+        """Cria o seletor a partir de `models.forecasting`; o motor vetorizado não usa a seleção."""
+        selector = cls(forecast_conf.get('selection', {}), forecast_conf['target_columns'],
+                       forecast_conf['prediction_horizon_hours'])
+        if forecast_conf.get('engine', 'statsmodels') == 'vectorized':
+            selector.enabled = False
+        return selector
+
+    def candidates(self, y: np.ndarray, primeira_origem: int) -> List[HoltWintersConfig]:
+        """Grade de configurações viáveis para a série `y`."""
+        positiva = bool(np.all(y > 0))
+        boxcox = [b for b in self.use_boxcox if positiva or not b]
+        candidatos = [NON_SEASONAL._replace(damped_trend=d, use_boxcox=b)
+                      for d, b in product(self.damped_trend, boxcox)]
+        for m, sazonal, d, b in product(self.seasonal_periods, self.seasonal, self.damped_trend, boxcox):
+            if primeira_origem < 2 * m or (sazonal == 'mul' and not positiva):
+                continue
+            candidatos.append(HoltWintersConfig(sazonal, m, d, b))
+        return candidatos
+
+    def is_due(self, n_hours: int) -> bool:
+        """
+        Indica se a seleção deve ser (re)feita para um histórico de `n_hours` horas.
+        Nunca antes de o histórico comportar ao menos uma origem da validação cruzada.
+        """
+        if not self.enabled:
+            return False
+        horas = min(n_hours, self.window_hours)
+        if not self._has_folds(horas):
+            return False
+        if self.last_attempt is None:
+            return True
+        if time.time() - self.last_attempt >= self.interval_hours * 3600:
+            return True
+        return horas >= 2 * self.selected_hours
+
+    def _has_folds(self, n_hours: int) -> bool:
+        return n_hours - self.folds * self.horizon > 10
+
+    def select(self, df: pd.DataFrame) -> Dict[str, HoltWintersConfig]:
+        """Avalia a grade para cada coluna alvo de `df` (índice horário) e guarda as vencedoras."""
+        inicio = time.perf_counter()
+        tentativa_anterior, self.last_attempt = self.last_attempt, time.time()
+        tarefas, donos = [], []
+        horas = 0
+        for col in self.target_columns:
+            y = df[col].dropna().to_numpy(dtype=np.float64)[-self.window_hours:]
+            if not self._has_folds(len(y)):
+                continue
+            origens = [len(y) - k * self.horizon for k in range(self.folds, 0, -1)]
+            horas = max(horas, len(y))
+            for config in self.candidates(y, origens[0]):
+                tarefas.append((y, config, origens, self.horizon))
+                donos.append((col, config))
+        if not tarefas:
+            # Nova tentativa só quando o histórico dobrar ou o intervalo vencer
+            self.selected_hours = min(len(df), self.window_hours)
+            logger.debug("IA - Seleção: histórico curto demais para a validação cruzada.")
+            return self.selected
+
+        erros = self._evaluate(tarefas)
+        if erros is None:
+            # Interrompida (encerramento): não conta como tentativa
+            self.last_attempt = tentativa_anterior
+            logger.info("IA - Seleção: interrompida.")
+            return self.selected
+
+        # Menor erro por coluna; colunas sem candidato válido mantêm a escolha anterior
+        selecionadas, pontuacoes = dict(self.selected), dict(self.scores)
+        melhores: Dict[str, Tuple[float, HoltWintersConfig]] = {}
+        for (col, config), erro in zip(donos, erros):
+            if np.isfinite(erro) and (col not in melhores or erro < melhores[col][0]):
+                melhores[col] = (erro, config)
+        for col, (erro, config) in melhores.items():
+            selecionadas[col] = config
+            pontuacoes[col] = erro
+            logger.info(f"IA - Seleção: '{col}' -> {config.describe()} (RMSE {erro:.3f}).")
+
+        self.selected, self.scores = selecionadas, pontuacoes
+        self.selected_at = time.time()
+        self.selected_hours = horas
+        duracao = time.perf_counter() - inicio
+        self.history.append({'hours': horas, 'candidates': len(tarefas), 'seconds': duracao})
+        logger.info(f"IA - Seleção: {len(tarefas)} candidato(s) avaliado(s) em {duracao:.1f}s.")
+        return self.selected
+
+    def _evaluate(self, tarefas: List[Tuple]) -> Optional[List[float]]:
+        """Erro de cada tarefa, em paralelo se `n_jobs` > 1; None se a seleção foi cancelada."""
+        if self.n_jobs <= 1:
+            erros = []
+            for tarefa in tarefas:
+                if self._cancel.is_set():
+                    return None
+                erros.append(_rolling_origin_rmse(tarefa))
+            return erros
+        executor = ProcessPoolExecutor(max_workers=self.n_jobs, mp_context=multiprocessing.get_context('spawn'))
+        try:
+            futuros = [executor.submit(_rolling_origin_rmse, tarefa) for tarefa in tarefas]
+            erros = []
+            for futuro in futuros:
+                if self._cancel.is_set():
+                    return None
+                erros.append(futuro.result())
+            return erros
+        finally:
+            executor.shutdown(wait=not self._cancel.is_set(), cancel_futures=True)
+
+    def cancel(self):
+        """Interrompe a seleção em andamento e as seguintes; as escolhas anteriores são mantidas."""
+        self._cancel.set()
+
+    def to_state(self) -> Dict[str, Any]:
+        """Metadados para persistência em checkpoint."""
+        return {
+            'selected': {col: config._asdict() for col, config in self.selected.items()},
+            'scores': dict(self.scores), 'selected_at': self.selected_at, 'selected_hours': self.selected_hours,
+            'last_attempt': self.last_attempt,
+        }
+
+    def restore(self, meta: Dict[str, Any]):
+        self.selected = {col: HoltWintersConfig.from_dict(valores) for col, valores in meta.get('selected', {}).items()}
+        self.scores = dict(meta.get('scores', {}))
+        self.selected_at = meta.get('selected_at')
+        self.selected_hours = meta.get('selected_hours', 0)
+        self.last_attempt = meta.get('last_attempt', self.selected_at)
@@ -0,0 +1,133 @@
+# retention.py (níveis de retenção do histórico: bruto, horário e diário)
+# -*- coding: utf-8 -*-
+
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Níveis agregados, do mais fino ao mais grosso: nome -> frequência do pandas
+TIERS = {'hourly': 'h', 'daily': 'D'}
+# Sufixos das colunas de um nível agregado; a média fica na coluna com o nome original
+TIER_SUFFIXES = ('min', 'max', 'count')
+
+
+def tier_columns(columns: List[str]) -> List[str]:
+    """Colunas de um nível agregado: Timestamp e, para cada coluna, média, mínimo, máximo e contagem."""
+    return ['Timestamp'] + [nome for col in columns for nome in (col, *(f'{col}_{s}' for s in TIER_SUFFIXES))]
+
+
+def empty_tier(columns: List[str]) -> pd.DataFrame:
+    return pd.DataFrame(columns=tier_columns(columns))
+
+
+def to_tier(df: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
+    """Converte amostras brutas (Timestamp + colunas) no formato de nível agregado, uma linha por amostra."""
+    dados: Dict[str, object] = {'Timestamp': pd.to_datetime(df['Timestamp'], format='ISO8601')}
+    for col in columns:
+        valores = pd.to_numeric(df[col], errors='coerce') if col in df else pd.Series(np.nan, index=df.index)
+        dados[col] = valores
+        dados[f'{col}_min'] = valores
+        dados[f'{col}_max'] = valores
+        dados[f'{col}_count'] = valores.notna().astype(np.float64)
+    return pd.DataFrame(dados, columns=tier_columns(columns))
+
+
+def aggregate(tier: pd.DataFrame, columns: List[str], freq: str) -> pd.DataFrame:
+    """
+    Reagrupa um nível agregado em baldes de `freq`, combinando as estatísticas:
+    média ponderada pela contagem, mínimo dos mínimos, máximo dos máximos e soma
+    das contagens. Também funde linhas repetidas do mesmo balde.
+    """
+    if tier.empty:
+        return empty_tier(columns)
+    tier = tier.reindex(columns=tier_columns(columns))
+    chave = pd.to_datetime(tier['Timestamp'], format='ISO8601').dt.floor(freq).rename('Timestamp')
+    contagens = tier[[f'{col}_count' for col in columns]].fillna(0.0).to_numpy(dtype=np.float64)
+    somas = np.nan_to_num(tier[columns].to_numpy(dtype=np.float64)) * contagens
+    partes = pd.DataFrame(np.hstack([somas, contagens]), index=tier.index)
+    totais = partes.groupby(chave, sort=True).sum()
+    minimos = tier[[f'{col}_min' for col in columns]].groupby(chave, sort=True).min()
+    maximos = tier[[f'{col}_max' for col in columns]].groupby(chave, sort=True).max()
+
+    n = len(columns)
+    soma, contagem = totais.to_numpy()[:, :n], totais.to_numpy()[:, n:]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        media = np.where(contagem > 0, soma / contagem, np.nan)
+    resultado = {'Timestamp': totais.index}
+    for j, col in enumerate(columns):
+        resultado[col] = media[:, j]
+        resultado[f'{col}_min'] = minimos[f'{col}_min'].to_numpy()
+        resultado[f'{col}_max'] = maximos[f'{col}_max'].to_numpy()
+        resultado[f'{col}_count'] = contagem[:, j]
+    return pd.DataFrame(resultado, columns=tier_columns(columns))
+
+
+def tier_arrays(tier: pd.DataFrame, columns: List[str]) -> Tuple[np.ndarray, ...]:
+    """(inícios em ns, soma, contagem, mínimo, máximo) de um nível agregado, nas colunas dadas."""
+    tier = tier.reindex(columns=tier_columns(columns))
+    inicios = pd.to_datetime(tier['Timestamp'], format='ISO8601').to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    contagem = tier[[f'{col}_count' for col in columns]].fillna(0.0).to_numpy(dtype=np.float64)
+    soma = np.nan_to_num(tier[columns].to_numpy(dtype=np.float64)) * contagem
+    minimo = tier[[f'{col}_min' for col in columns]].to_numpy(dtype=np.float64)
+    maximo = tier[[f'{col}_max' for col in columns]].to_numpy(dtype=np.float64)
+    return inicios, soma, contagem, minimo, maximo
+
+
+class RetentionPolicy:
+    """
+    Por quanto tempo cada nível do histórico é mantido.
+
+    - Amostras brutas: `raw_days` dias (None = para sempre);
+    - Agregados horários: `hourly_months` meses (None = para sempre);
+    - Agregados diários: indefinidamente.
+
+    Os cortes são alinhados ao início do dia (bruto) e do mês (horário), de modo
+    que um segmento diário ou um arquivo mensal sai inteiro de um nível para o
+    seguinte. A verificação roda na compactação, a cada `check_interval` segundos.
+    """
+    def __init__(self, raw_days: Optional[int] = None, hourly_months: Optional[int] = None,
+                 check_interval: float = 3600.0):
+        self.raw_days = raw_days
+        self.hourly_months = hourly_months
+        self.check_interval = check_interval
+
+    @classmethod
+    def from_config(cls, conf: dict) -> Optional['RetentionPolicy']:
+        """Cria a política a partir de `storage.retention`; None se desativada."""
+        if not conf or not conf.get('enabled', True):
+            return None
+        return cls(
+            raw_days=conf.get('raw_days'),
+            hourly_months=conf.get('hourly_months'),
+            check_interval=conf.get('check_interval_seconds', 3600.0),
+        )
+
+    def raw_cutoff(self, agora: Optional[pd.Timestamp] = None) -> Optional[pd.Timestamp]:
+        """Amostras brutas anteriores a este instante passam ao nível horário."""
+        if self.raw_days is None:
+            return None
+        agora = agora if agora is not None else pd.Timestamp.now()
+        return agora.normalize() - pd.Timedelta(days=self.raw_days)
+
+    def hourly_cutoff(self, agora: Optional[pd.Timestamp] = None) -> Optional[pd.Timestamp]:
+        """Agregados horários anteriores a este instante passam ao nível diário."""
+        if self.hourly_months is None:
+            return None
+        agora = agora if agora is not None else pd.Timestamp.now()
+        return agora.normalize().replace(day=1) - pd.DateOffset(months=self.hourly_months)
+
+    def tier_of(self, timestamps: pd.Series, agora: Optional[pd.Timestamp] = None) -> np.ndarray:
+        """Nível de destino ('raw', 'hourly' ou 'daily') de cada Timestamp."""
+        destino = np.full(len(timestamps), 'raw', dtype=object)
+        corte_bruto, corte_horario = self.raw_cutoff(agora), self.hourly_cutoff(agora)
+        if corte_bruto is None:
+            return destino
+        expiradas = (timestamps < corte_bruto).to_numpy()
+        destino[expiradas] = 'hourly'
+        if corte_horario is not None:
+            destino[expiradas & (timestamps < corte_horario).to_numpy()] = 'daily'
+        return destino
@@ -0,0 +1,130 @@
+# scheduler.py (agendamento do retreinamento dos modelos em segundo plano)
+# -*- coding: utf-8 -*-
+
+import logging
+import math
+import threading
+import time
+from concurrent.futures import Executor
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisScheduler:
+    """
+    Agrupa as amostras recebidas e dispara o retreinamento em uma thread própria.
+
+    O retreinamento ocorre quando uma das condições é satisfeita:
+    - `min_new_rows` novas amostras chegaram desde o último treino;
+    - passaram `interval_seconds` desde o último treino e há amostras novas;
+    - uma amostra se desviou mais de `drift_zscore` desvios-padrão da referência.
+    Treinos consecutivos respeitam o intervalo mínimo `min_interval_seconds`.
+
+    Com um `executor` (pool compartilhado entre vários agendadores), o treino é
+    executado no pool, limitando quantos retreinamentos rodam ao mesmo tempo.
+    """
+    def __init__(self, config: dict, retrain_fn: Callable[[], None], executor: Optional[Executor] = None,
+                 name: str = "AnalysisWorker"):
+        self.retrain_fn = retrain_fn
+        self.executor = executor
+        self.name = name
+        self.interval_seconds = config.get('interval_seconds', 300)
+        self.min_new_rows = config.get('min_new_rows', 30)
+        self.min_interval_seconds = config.get('min_interval_seconds', 10)
+        self.drift_zscore = config.get('drift_zscore', 3.0)
+
+        self._cond = threading.Condition()
+        self._pending_rows = 0
+        self._drift_detected = False
+        self._force = False
+        self._last_run = 0.0
+        self._reference: Dict[str, tuple] = {}
+        self._stop = False
+        self._thread: Optional[threading.Thread] = None
+        self.runs = 0
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, daemon=True, name=self.name)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    @property
+    def pending_rows(self) -> int:
+        """Amostras recebidas desde o último retreinamento."""
+        with self._cond:
+            return self._pending_rows
+
+    def set_reference(self, stats: Dict[str, tuple]):
+        """Define (média, desvio-padrão) por coluna usados na detecção de desvio."""
+        with self._cond:
+            self._reference = dict(stats)
+
+    def notify(self, data: Dict[str, Any], n_rows: int = 1):
+        """Registra novas amostras; não bloqueia a thread de ingestão."""
+        with self._cond:
+            self._pending_rows += n_rows
+            if not self._drift_detected and self._is_drift(data):
+                self._drift_detected = True
+                logger.info("Agendador: desvio detectado nos dados, retreinamento antecipado.")
+            self._cond.notify()
+
+    def request_run(self):
+        """Solicita um retreinamento imediato (ex.: na inicialização)."""
+        with self._cond:
+            self._force = True
+            self._cond.notify()
+
+    def _is_drift(self, data: Dict[str, Any]) -> bool:
+        for col, (media, desvio) in self._reference.items():
+            valor = data.get(col)
+            if valor is None or not desvio or math.isnan(desvio):
+                continue
+            if abs(valor - media) > self.drift_zscore * desvio:
+                return True
+        return False
+
+    def _due(self, now: float) -> bool:
+        if self._force:
+            return True
+        if self._pending_rows == 0:
+            return False
+        if now - self._last_run < self.min_interval_seconds:
+            return False
+        return (self._drift_detected
+                or self._pending_rows >= self.min_new_rows
+                or now - self._last_run >= self.interval_seconds)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stop and not self._due(time.monotonic()):
+                    self._cond.wait(timeout=1.0)
+                if self._stop:
+                    return
+                coalesced = self._pending_rows
+                self._pending_rows = 0
+                self._drift_detected = False
+                self._force = False
+            inicio = time.monotonic()
+            try:
+                if self.executor is not None:
+                    self.executor.submit(self.retrain_fn).result()
+                else:
+                    self.retrain_fn()
+            except Exception as e:
+                logger.error(f"Agendador: erro durante o retreinamento: {e}")
+            finally:
+                self._last_run = time.monotonic()
+                self.runs += 1
+            logger.info(f"Agendador: retreinamento com {coalesced} nova(s) amostra(s) "
+                        f"concluído em {self._last_run - inicio:.2f}s.")
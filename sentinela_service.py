@@ -0,0 +1,85 @@
+# sentinela_service.py (modo serviço: ingestão e análise sem a interface gráfica)
+# -*- coding: utf-8 -*-
+#
+# Uso: python -m sentinela_service [--config config.yaml] [--sem-api]
+
+import argparse
+import logging
+import sys
+import threading
+import time
+from typing import List, Tuple
+
+from app_config import load_config, setup_logging
+
+logger = logging.getLogger('sentinela_service')
+
+# Bibliotecas pesadas que só devem ser carregadas quando um modelo é treinado
+IMPORTS_SOB_DEMANDA = ('sklearn', 'statsmodels', 'matplotlib', 'flet')
+
+
+class StartupTimer:
+    """Mede a duração de cada etapa da inicialização."""
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self._ultimo = self.inicio
+        self.etapas: List[Tuple[str, float]] = []
+
+    def mark(self, etapa: str):
+        agora = time.perf_counter()
+        self.etapas.append((etapa, agora - self._ultimo))
+        self._ultimo = agora
+
+    def report(self) -> str:
+        linhas = [f"  {etapa:<28} {duracao * 1000:8.1f} ms" for etapa, duracao in self.etapas]
+        linhas.append(f"  {'total':<28} {(self._ultimo - self.inicio) * 1000:8.1f} ms")
+        return "\n".join(linhas)
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Sentinela Verde em modo serviço (sem interface gráfica).")
+    parser.add_argument('--config', default='config.yaml', help="Caminho do arquivo de configuração.")
+    parser.add_argument('--sem-api', action='store_true', help="Não consulta a API do WAQI.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    timer = StartupTimer()
+
+    config = load_config(args.config)
+    timer.mark('configuração')
+    setup_logging(config)
+    timer.mark('logging')
+
+    import backend
+    timer.mark('importação do backend')
+
+    hub = backend.DeviceHub(config)
+    timer.mark('dispositivos')
+
+    mqtt_client = backend.MQTTClient(config, hub)
+    mqtt_client.start()
+    timer.mark('cliente MQTT')
+
+    if not args.sem_api:
+        hub.start_api_scheduler()
+    timer.mark('agendador da API')
+
+    carregados = [nome for nome in IMPORTS_SOB_DEMANDA if nome in sys.modules]
+    logger.info("Serviço Sentinela Verde iniciado. Tempo de inicialização:\n" + timer.report())
+    logger.info(f"Bibliotecas pesadas já carregadas: {', '.join(carregados) or 'nenhuma'}.")
+
+    parar = threading.Event()
+    try:
+        while not parar.wait(1.0):
+            pass
+    except KeyboardInterrupt:
+        logger.info("Encerrando o serviço...")
+    finally:
+        mqtt_client.stop()
+        hub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,429 @@
+# storage.py (backends de armazenamento do histórico de leituras)
+# -*- coding: utf-8 -*-
+
+import csv
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from retention import TIERS, RetentionPolicy, aggregate, empty_tier, to_tier
+
+logger = logging.getLogger(__name__)
+
+# Resolução de microssegundos: leituras do mesmo segundo não colidem no Timestamp
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+
+def _pyarrow_disponivel() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _escrever_atomicamente(df: pd.DataFrame, destino: Path, formato: str):
+    """Grava o DataFrame em um arquivo temporário e o move para o destino final."""
+    temporario = destino.with_name(destino.name + '.tmp')
+    if formato == 'parquet':
+        df.to_parquet(temporario, index=False)
+    else:
+        df.to_csv(temporario, index=False, date_format=TIMESTAMP_FORMAT)
+    os.replace(temporario, destino)
+
+
+def _normalizar(df: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
+    """
+    Converte o Timestamp, mescla as linhas com o mesmo Timestamp e ordena.
+
+    Linhas repetidas (reentregas, ou sensor e API no mesmo instante) são fundidas
+    coluna a coluna: vale o último valor não nulo de cada coluna.
+    """
+    if df.empty:
+        return pd.DataFrame(columns=columns)
+    # ISO8601 aceita tanto as linhas antigas (segundos) quanto as com fração de segundo
+    df['Timestamp'] = pd.to_datetime(df['Timestamp'], format='ISO8601')
+    df = df.reindex(columns=columns)
+    if df['Timestamp'].duplicated().any():
+        df = df.groupby('Timestamp', sort=True).last().reset_index()
+    else:
+        df = df.sort_values(by='Timestamp', kind='stable')
+    return df.reindex(columns=columns).reset_index(drop=True)
+
+
+class StorageBackend:
+    """Interface comum dos backends que persistem as leituras unificadas."""
+    def __init__(self, columns: List[str]):
+        self.columns = columns
+
+    def start(self):
+        """Inicia tarefas de manutenção em segundo plano (se houver)."""
+
+    def close(self):
+        """Finaliza o backend, persistindo o que estiver pendente."""
+
+    def append(self, rows: List[Dict[str, Any]]):
+        raise NotImplementedError
+
+    def read_frame(self) -> pd.DataFrame:
+        """Retorna as amostras brutas ordenadas, com as linhas de mesmo Timestamp mescladas."""
+        raise NotImplementedError
+
+    def read_tier(self, tier: str, since: Any = None) -> pd.DataFrame:
+        """Agregados de um nível de retenção ('hourly' ou 'daily'); vazio se o backend não tiver níveis."""
+        return empty_tier(self.columns[1:])
+
+    def read_since(self, timestamp: Any) -> pd.DataFrame:
+        """Retorna apenas as linhas posteriores a `timestamp`."""
+        df = self.read_frame()
+        return df[df['Timestamp'] > pd.Timestamp(timestamp)].reset_index(drop=True)
+
+    def export_csv(self, filepath: Path) -> Path:
+        """Exporta o histórico completo no formato CSV unificado."""
+        df = self.read_frame()
+        filepath = Path(filepath)
+        _escrever_atomicamente(df, filepath, 'csv')
+        return filepath
+
+
+class CSVStorage(StorageBackend):
+    """Backend legado: reescreve o CSV unificado inteiro a cada gravação."""
+    def __init__(self, columns: List[str], filepath: Path):
+        super().__init__(columns)
+        self.filepath = Path(filepath)
+
+    def _read_raw(self) -> pd.DataFrame:
+        if self.filepath.exists() and self.filepath.stat().st_size > 0:
+            return pd.read_csv(self.filepath)
+        return pd.DataFrame()
+
+    def append(self, rows: List[Dict[str, Any]]):
+        df_final = pd.concat([self._read_raw(), pd.DataFrame(rows)], ignore_index=True)
+        _escrever_atomicamente(_normalizar(df_final, self.columns), self.filepath, 'csv')
+
+    def read_frame(self) -> pd.DataFrame:
+        return _normalizar(self._read_raw(), self.columns)
+
+
+class SegmentedLogStorage(StorageBackend):
+    """
+    Log segmentado somente-anexação.
+
+    Cada gravação acrescenta linhas ao WAL (`wal.csv`), com custo O(1). Uma thread
+    de compactação rotaciona o WAL periodicamente, funde as linhas em segmentos
+    diários (`AAAA-MM-DD.parquet` ou `.csv`), mescla as linhas repetidas e exporta o CSV
+    unificado para compatibilidade.
+
+    Com uma `RetentionPolicy`, a mesma thread rebaixa o histórico antigo: segmentos
+    diários vencidos viram agregados horários (`horario/AAAA-MM`) e estes, ao
+    vencer, agregados diários (`diario/AAAA`), mantidos indefinidamente. As
+    gravações só disputam a trava do WAL, nunca a da compactação.
+    """
+    WAL_NAME = 'wal.csv'
+    PENDING_SUFFIX = '.pending'
+    # Nível -> (subdiretório, formato do nome do arquivo)
+    TIER_FILES = {'hourly': ('horario', '%Y-%m'), 'daily': ('diario', '%Y')}
+
+    def __init__(self, columns: List[str], directory: Path, export_path: Optional[Path] = None,
+                 compaction_interval: float = 60.0, segment_format: str = 'auto',
+                 retention: Optional[RetentionPolicy] = None):
+        super().__init__(columns)
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.export_path = Path(export_path) if export_path else None
+        self.compaction_interval = compaction_interval
+        if segment_format == 'auto':
+            segment_format = 'parquet' if _pyarrow_disponivel() else 'csv'
+        self.segment_format = segment_format
+        self.retention = retention
+        self._last_retention: Optional[float] = None
+
+        self._wal_lock = threading.Lock()
+        # Protege a troca "arquivo pendente -> segmento" contra leituras concorrentes.
+        self._compaction_lock = threading.RLock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._dirty = False
+
+        self._import_legacy_csv()
+        self._wal_file = open(self.directory / self.WAL_NAME, 'a', newline='', encoding='utf-8')
+        self._wal_writer = csv.writer(self._wal_file)
+
+    # --- Escrita -----------------------------------------------------------------
+
+    def append(self, rows: List[Dict[str, Any]]):
+        """Acrescenta as linhas ao WAL sem ler o histórico existente."""
+        linhas = [[self._format_value(row.get(col)) for col in self.columns] for row in rows]
+        with self._wal_lock:
+            self._wal_writer.writerows(linhas)
+            self._wal_file.flush()
+            self._dirty = True
+
+    @staticmethod
+    def _format_value(value: Any) -> Any:
+        if value is None:
+            return ''
+        if hasattr(value, 'strftime'):
+            return value.strftime(TIMESTAMP_FORMAT)
+        return value
+
+    # --- Leitura -----------------------------------------------------------------
+
+    def _segment_files(self) -> List[Path]:
+        return sorted(self.directory.glob(f'????-??-??.{self.segment_format}'))
+
+    def _pending_files(self) -> List[Path]:
+        return sorted(self.directory.glob(f'wal-*{self.PENDING_SUFFIX}'))
+
+    def _read_segment(self, path: Path) -> pd.DataFrame:
+        if path.suffix == '.parquet':
+            return pd.read_parquet(path)
+        return pd.read_csv(path)
+
+    def _read_log(self, path: Path) -> pd.DataFrame:
+        if not path.exists() or path.stat().st_size == 0:
+            return pd.DataFrame(columns=self.columns)
+        return pd.read_csv(path, header=None, names=self.columns)
+
+    def read_frame(self, since: Optional[pd.Timestamp] = None) -> pd.DataFrame:
+        with self._compaction_lock:
+            segmentos = self._segment_files()
+            if since is not None:
+                # Segmentos diários anteriores ao dia de `since` não precisam ser lidos
+                segmentos = [p for p in segmentos if p.stem >= since.date().isoformat()]
+            partes = [self._read_segment(p) for p in segmentos]
+            partes += [self._read_log(p) for p in self._pending_files()]
+            with self._wal_lock:
+                self._wal_file.flush()
+                partes.append(self._read_log(self.directory / self.WAL_NAME))
+        partes = [p for p in partes if not p.empty]
+        if not partes:
+            return pd.DataFrame(columns=self.columns)
+        df = _normalizar(pd.concat(partes, ignore_index=True), self.columns)
+        if since is not None:
+            df = df[df['Timestamp'] > since].reset_index(drop=True)
+        return df
+
+    def read_since(self, timestamp: Any) -> pd.DataFrame:
+        return self.read_frame(since=pd.Timestamp(timestamp))
+
+    def _tier_path(self, tier: str, chave: str) -> Path:
+        return self.directory / self.TIER_FILES[tier][0] / f'{chave}.{self.segment_format}'
+
+    def _tier_files(self, tier: str) -> List[Path]:
+        subdiretorio, formato = self.TIER_FILES[tier]
+        padrao = '????-??' if formato == '%Y-%m' else '????'
+        return sorted((self.directory / subdiretorio).glob(f'{padrao}.{self.segment_format}'))
+
+    def _read_tier_file(self, path: Path) -> pd.DataFrame:
+        df = self._read_segment(path)
+        df['Timestamp'] = pd.to_datetime(df['Timestamp'], format='ISO8601')
+        return df
+
+    def read_tier(self, tier: str, since: Any = None) -> pd.DataFrame:
+        """Agregados do nível ('hourly' ou 'daily'), em ordem; com `since`, só os posteriores."""
+        if since is not None:
+            since = pd.Timestamp(since)
+        # A retenção reescreve e remove arquivos de nível sob a trava da compactação
+        with self._compaction_lock:
+            arquivos = self._tier_files(tier)
+            if since is not None:
+                primeiro = since.strftime(self.TIER_FILES[tier][1])
+                arquivos = [p for p in arquivos if p.stem >= primeiro]
+            partes = [self._read_tier_file(p) for p in arquivos]
+        partes = [p for p in partes if not p.empty]
+        if not partes:
+            return empty_tier(self.columns[1:])
+        df = pd.concat(partes, ignore_index=True).sort_values('Timestamp', kind='stable')
+        if since is not None:
+            df = df[df['Timestamp'] > since]
+        return df.reset_index(drop=True)
+
+    # --- Compactação -------------------------------------------------------------
+
+    def _rotate_wal(self) -> bool:
+        """Fecha o WAL atual e o renomeia como pendente de compactação."""
+        with self._wal_lock:
+            wal_path = self.directory / self.WAL_NAME
+            if wal_path.stat().st_size == 0:
+                return False
+            self._wal_file.close()
+            os.replace(wal_path, self.directory / f'wal-{time.time_ns()}{self.PENDING_SUFFIX}')
+            self._wal_file = open(wal_path, 'a', newline='', encoding='utf-8')
+            self._wal_writer = csv.writer(self._wal_file)
+            return True
+
+    def _merge_into_segments(self, df_novo: pd.DataFrame):
+        df_novo = _normalizar(df_novo, self.columns)
+        if self.retention is not None and not df_novo.empty:
+            # Linhas tardias de períodos já rebaixados vão direto para o nível agregado
+            destino = self._retention_target(df_novo['Timestamp'])
+            for tier in TIERS:
+                antigas = df_novo[destino == tier]
+                if not antigas.empty:
+                    self._merge_into_tier(tier, aggregate(to_tier(antigas, self.columns[1:]),
+                                                          self.columns[1:], TIERS[tier]))
+            df_novo = df_novo[destino == 'raw']
+        for dia, df_dia in df_novo.groupby(df_novo['Timestamp'].dt.date):
+            destino = self.directory / f'{dia.isoformat()}.{self.segment_format}'
+            if destino.exists():
+                df_dia = pd.concat([self._read_segment(destino), df_dia], ignore_index=True)
+            _escrever_atomicamente(_normalizar(df_dia, self.columns), destino, self.segment_format)
+
+    def _retention_target(self, timestamps: pd.Series) -> np.ndarray:
+        """
+        Nível de destino de cada linha. Enquanto o segmento diário (ou o arquivo
+        horário) do período ainda existe, a linha vai para ele: o rebaixamento o
+        substitui por inteiro no nível seguinte.
+        """
+        destino = self.retention.tier_of(timestamps)
+        dias = {p.stem for p in self._segment_files()}
+        destino[(destino != 'raw') & timestamps.dt.strftime('%Y-%m-%d').isin(dias).to_numpy()] = 'raw'
+        meses = {p.stem for p in self._tier_files('hourly')}
+        destino[(destino == 'daily') & timestamps.dt.strftime('%Y-%m').isin(meses).to_numpy()] = 'hourly'
+        return destino
+
+    def _merge_into_tier(self, tier: str, df_tier: pd.DataFrame,
+                         substituir: Optional[Tuple[pd.Timestamp, pd.Timestamp]] = None):
+        """
+        Funde agregados no nível, combinando as estatísticas dos baldes repetidos.
+        Com `substituir` (início, fim), os baldes existentes nesse intervalo são
+        trocados pelos novos em vez de combinados: refazer o rebaixamento de um
+        segmento após uma interrupção não conta as amostras duas vezes.
+        """
+        valores = self.columns[1:]
+        formato = self.TIER_FILES[tier][1]
+        for chave, df_arquivo in df_tier.groupby(df_tier['Timestamp'].dt.strftime(formato)):
+            destino = self._tier_path(tier, chave)
+            destino.parent.mkdir(parents=True, exist_ok=True)
+            if destino.exists():
+                existente = self._read_tier_file(destino)
+                if substituir is not None:
+                    inicio, fim = substituir
+                    existente = existente[(existente['Timestamp'] < inicio) | (existente['Timestamp'] >= fim)]
+                df_arquivo = pd.concat([existente, df_arquivo], ignore_index=True)
+            _escrever_atomicamente(aggregate(df_arquivo, valores, TIERS[tier]), destino, self.segment_format)
+
+    def apply_retention(self) -> int:
+        """Rebaixa os segmentos e agregados vencidos; retorna o número de arquivos rebaixados."""
+        if self.retention is None:
+            return 0
+        valores = self.columns[1:]
+        rebaixados = 0
+        with self._compaction_lock:
+            corte_bruto = self.retention.raw_cutoff()
+            if corte_bruto is not None:
+                for segmento in self._segment_files():
+                    dia = pd.Timestamp(segmento.stem)
+                    if dia >= corte_bruto:
+                        break
+                    horario = aggregate(to_tier(self._read_segment(segmento), valores), valores, 'h')
+                    if not horario.empty:
+                        self._merge_into_tier('hourly', horario, substituir=(dia, dia + pd.Timedelta(days=1)))
+                    segmento.unlink()
+                    rebaixados += 1
+            corte_horario = self.retention.hourly_cutoff()
+            if corte_horario is not None:
+                for arquivo in self._tier_files('hourly'):
+                    mes = pd.Timestamp(f'{arquivo.stem}-01')
+                    if mes >= corte_horario:
+                        break
+                    diario = aggregate(self._read_tier_file(arquivo), valores, 'D')
+                    if not diario.empty:
+                        self._merge_into_tier('daily', diario, substituir=(mes, mes + pd.DateOffset(months=1)))
+                    arquivo.unlink()
+                    rebaixados += 1
+            self._last_retention = time.monotonic()
+            if rebaixados:
+                self._dirty = True
+        if rebaixados:
+            logger.info(f"Retenção: {rebaixados} arquivo(s) rebaixado(s) para os níveis agregados.")
+        return rebaixados
+
+    def _retention_due(self) -> bool:
+        return self.retention is not None and (
+            self._last_retention is None
+            or time.monotonic() - self._last_retention >= self.retention.check_interval)
+
+    def compact(self):
+        """Funde o WAL nos segmentos diários, aplica a retenção e atualiza o CSV de exportação."""
+        self._rotate_wal()
+        if self._retention_due():
+            self.apply_retention()
+        pendentes = self._pending_files()
+        if not pendentes and not self._dirty:
+            return
+        with self._compaction_lock:
+            for pendente in pendentes:
+                df_pendente = self._read_log(pendente)
+                if not df_pendente.empty:
+                    self._merge_into_segments(df_pendente)
+                pendente.unlink()
+            self._dirty = False
+            if self.export_path:
+                self.export_csv(self.export_path)
+        logger.info(f"Armazenamento: {len(pendentes)} arquivo(s) de WAL compactado(s) em {self.directory}.")
+
+    def _import_legacy_csv(self):
+        """Na primeira execução, importa o CSV unificado existente para os segmentos."""
+        if self._segment_files() or not self.export_path:
+            return
+        if not self.export_path.exists() or self.export_path.stat().st_size == 0:
+            return
+        df_legado = pd.read_csv(self.export_path)
+        if df_legado.empty:
+            return
+        with self._compaction_lock:
+            self._merge_into_segments(df_legado)
+        logger.info(f"Armazenamento: {len(df_legado)} linha(s) importada(s) de {self.export_path}.")
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+
+        def run_compactor():
+            while not self._stop_event.wait(self.compaction_interval):
+                try:
+                    self.compact()
+                except Exception as e:
+                    logger.error(f"Erro na compactação do armazenamento: {e}")
+
+        self._thread = threading.Thread(target=run_compactor, daemon=True, name="Compactador")
+        self._thread.start()
+
+    def close(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self.compact()
+        with self._wal_lock:
+            self._wal_file.close()
+
+
+def create_storage(config: dict) -> StorageBackend:
+    """Cria o backend de armazenamento descrito na seção `storage` do config."""
+    columns = ['Timestamp'] + config['models']['decision_tree']['feature_columns']
+    csv_path = Path(config['files']['unified_csv'])
+    storage_conf = config.get('storage', {})
+    backend = storage_conf.get('backend', 'segmented')
+
+    if backend == 'csv':
+        if storage_conf.get('retention', {}).get('enabled'):
+            logger.warning("Armazenamento: a retenção só é aplicada pelo backend 'segmented'.")
+        return CSVStorage(columns, csv_path)
+    if backend == 'segmented':
+        return SegmentedLogStorage(
+            columns,
+            directory=Path(storage_conf.get('directory', 'dados_segmentos')),
+            export_path=csv_path if storage_conf.get('export_csv', True) else None,
+            compaction_interval=storage_conf.get('compaction_interval_seconds', 60),
+            segment_format=storage_conf.get('segment_format', 'auto'),
+            retention=RetentionPolicy.from_config(storage_conf.get('retention', {})),
+        )
+    raise ValueError(f"Backend de armazenamento desconhecido: '{backend}'")
@@ -0,0 +1,302 @@
+# summary.py (estatísticas móveis para o resumo da aba Relatórios)
+# -*- coding: utf-8 -*-
+
+import threading
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Janelas do resumo em segundos
+SUMMARY_WINDOWS = {'1h': 3600, '24h': 24 * 3600, '7d': 7 * 24 * 3600}
+
+ROTULOS_JANELAS = {'1h': 'Última hora', '24h': 'Últimas 24 horas', '7d': 'Últimos 7 dias'}
+
+
+def _merge(total: Tuple[np.ndarray, ...], parte: Tuple[np.ndarray, ...]) -> Tuple[np.ndarray, ...]:
+    """Combina (n, média, M2) de dois conjuntos de amostras (fórmula de Chan)."""
+    n_t, media_t, m2_t = total
+    n_p, media_p, m2_p = parte
+    n = n_t + n_p
+    delta = media_p - media_t
+    # Onde n == 0 também n_p == 0, e o peso fica 0
+    peso = n_p / np.maximum(n, 1.0)
+    media = media_t + delta * peso
+    m2 = m2_t + m2_p + delta ** 2 * n_t * peso
+    return n, media, m2
+
+
+def _unmerge(total: Tuple[np.ndarray, ...], parte: Tuple[np.ndarray, ...]) -> Tuple[np.ndarray, ...]:
+    """Remove de (n, média, M2) as amostras de `parte` (inverso de `_merge`)."""
+    n_t, media_t, m2_t = total
+    n_p, media_p, m2_p = parte
+    n = n_t - n_p
+    restam = n > 0
+    media = np.where(restam, (n_t * media_t - n_p * media_p) / np.maximum(n, 1.0), 0.0)
+    delta = media_p - media
+    m2 = m2_t - m2_p - delta ** 2 * n * n_p / np.maximum(n_t, 1.0)
+    return n, media, np.where(restam, np.maximum(m2, 0.0), 0.0)
+
+
+class RollingWindow:
+    """
+    Estatísticas de uma janela móvel sobre baldes fechados.
+
+    Cada balde entra uma vez nos totais (n, média, M2 e excedências) e sai uma
+    vez quando fica mais velho que a janela, ambos em O(1). Mínimo e máximo usam
+    filas monotônicas por coluna (O(1) amortizado). Os totais são recalculados
+    a partir dos baldes retidos a cada volta completa da janela, para que erros
+    de arredondamento das remoções não se acumulem.
+    """
+    def __init__(self, window_ns: int, bucket_ns: int, width: int):
+        self.window_ns = window_ns
+        self.bucket_ns = bucket_ns
+        self.width = width
+        self._baldes: deque = deque()
+        self._minimos = [deque() for _ in range(width)]
+        self._maximos = [deque() for _ in range(width)]
+        self._zerar_totais()
+
+    def _zerar_totais(self):
+        self._total = (np.zeros(self.width), np.zeros(self.width), np.zeros(self.width))
+        self._excedencias = np.zeros(self.width)
+        self._remocoes = 0
+
+    def push(self, inicio: int, balde: Tuple[np.ndarray, ...]):
+        n, media, m2, minimo, maximo, excedencias = balde
+        self._baldes.append((inicio, n, media, m2, excedencias))
+        self._total = _merge(self._total, (n, media, m2))
+        self._excedencias = self._excedencias + excedencias
+        for j in np.flatnonzero(n > 0):
+            fila_min, fila_max = self._minimos[j], self._maximos[j]
+            while fila_min and fila_min[-1][1] >= minimo[j]:
+                fila_min.pop()
+            fila_min.append((inicio, minimo[j]))
+            while fila_max and fila_max[-1][1] <= maximo[j]:
+                fila_max.pop()
+            fila_max.append((inicio, maximo[j]))
+
+    def load(self, inicios: np.ndarray, baldes: Tuple[np.ndarray, ...], inicio_aberto: int):
+        """Substitui o conteúdo pelos baldes fechados dados (um por linha), calculando os totais de uma vez."""
+        corte = inicio_aberto - self.window_ns + self.bucket_ns
+        manter = inicios >= corte
+        inicios = inicios[manter]
+        n, media, m2, minimo, maximo, excedencias = (arr[manter] for arr in baldes)
+        self._baldes = deque(zip(inicios.tolist(), n, media, m2, excedencias))
+        n_total = n.sum(axis=0)
+        media_total = (n * media).sum(axis=0) / np.maximum(n_total, 1.0)
+        m2_total = (m2 + n * (media - media_total) ** 2).sum(axis=0)
+        self._total = (n_total, media_total, m2_total)
+        self._excedencias = excedencias.sum(axis=0)
+        self._remocoes = 0
+        for j in range(self.width):
+            fila_min, fila_max = deque(), deque()
+            com_amostras = n[:, j] > 0
+            for inicio, menor, maior in zip(inicios[com_amostras].tolist(), minimo[com_amostras, j].tolist(),
+                                            maximo[com_amostras, j].tolist()):
+                while fila_min and fila_min[-1][1] >= menor:
+                    fila_min.pop()
+                fila_min.append((inicio, menor))
+                while fila_max and fila_max[-1][1] <= maior:
+                    fila_max.pop()
+                fila_max.append((inicio, maior))
+            self._minimos[j], self._maximos[j] = fila_min, fila_max
+
+    def evict(self, inicio_aberto: int):
+        """Descarta os baldes que já não cabem na janela terminada no balde aberto."""
+        corte = inicio_aberto - self.window_ns + self.bucket_ns
+        while self._baldes and self._baldes[0][0] < corte:
+            _, n, media, m2, excedencias = self._baldes.popleft()
+            self._total = _unmerge(self._total, (n, media, m2))
+            self._excedencias = self._excedencias - excedencias
+            self._remocoes += 1
+        for fila in (*self._minimos, *self._maximos):
+            while fila and fila[0][0] < corte:
+                fila.popleft()
+        if self._remocoes >= max(len(self._baldes), 1):
+            self._recalcular()
+
+    def _recalcular(self):
+        baldes = self._baldes
+        self._zerar_totais()
+        for _, n, media, m2, excedencias in baldes:
+            self._total = _merge(self._total, (n, media, m2))
+            self._excedencias = self._excedencias + excedencias
+
+    def stats(self, aberto: Tuple[np.ndarray, ...]) -> Dict[str, np.ndarray]:
+        """Estatísticas da janela incluindo o balde aberto (sem alterá-la)."""
+        n_a, media_a, m2_a, min_a, max_a, exc_a = aberto
+        n, media, m2 = _merge(self._total, (n_a, media_a, m2_a))
+        minimo = np.array([fila[0][1] if fila else np.inf for fila in self._minimos])
+        maximo = np.array([fila[0][1] if fila else -np.inf for fila in self._maximos])
+        minimo, maximo = np.fmin(minimo, min_a), np.fmax(maximo, max_a)
+        com_amostras = n > 0
+        variancia = np.divide(m2, n - 1, out=np.zeros_like(n), where=n > 1)
+        return {
+            'count': n,
+            'mean': np.where(com_amostras, media, np.nan),
+            'std': np.where(com_amostras, np.sqrt(variancia), np.nan),
+            'min': np.where(com_amostras, minimo, np.nan),
+            'max': np.where(com_amostras, maximo, np.nan),
+            'exceedances': self._excedencias + exc_a,
+        }
+
+
+class RollingSummary:
+    """
+    Resumo móvel (1 h, 24 h e 7 dias) das colunas do histórico.
+
+    Cada amostra atualiza, pelo algoritmo de Welford, apenas o balde aberto
+    (`bucket_seconds`, padrão 1 minuto); quando o balde fecha, ele é repassado a
+    cada janela. Consultar o resumo não depende do tamanho do histórico. As
+    janelas terminam na leitura mais recente e têm a resolução de um balde.
+    """
+    def __init__(self, columns: List[str], limits: Optional[Dict[str, float]] = None,
+                 windows: Optional[Dict[str, int]] = None, bucket_seconds: int = 60):
+        self.columns = columns
+        self.width = len(columns)
+        self.bucket_ns = int(bucket_seconds * 1e9)
+        limits = limits or {}
+        # Colunas sem limite configurado (NaN) nunca contam excedências
+        self.limits = np.array([limits.get(col, np.nan) for col in columns], dtype=np.float64)
+        self.window_seconds = dict(windows or SUMMARY_WINDOWS)
+        self.windows = {nome: RollingWindow(int(segundos * 1e9), self.bucket_ns, self.width)
+                        for nome, segundos in self.window_seconds.items()}
+        self.lock = threading.Lock()
+        self._aberto: Optional[int] = None
+        self._ultimo_ts: Optional[int] = None
+        self._zerar_balde()
+
+    def _zerar_balde(self):
+        self._n = np.zeros(self.width)
+        self._media = np.zeros(self.width)
+        self._m2 = np.zeros(self.width)
+        self._min = np.full(self.width, np.inf)
+        self._max = np.full(self.width, -np.inf)
+        self._exc = np.zeros(self.width)
+
+    def _balde_aberto(self) -> Tuple[np.ndarray, ...]:
+        return self._n, self._media, self._m2, self._min, self._max, self._exc
+
+    def _avancar(self, inicio: int):
+        """Fecha o balde aberto (se houver) e abre o balde que começa em `inicio`."""
+        if self._aberto is not None:
+            balde = self._balde_aberto()
+            for janela in self.windows.values():
+                janela.push(self._aberto, balde)
+        self._aberto = inicio
+        self._zerar_balde()
+        for janela in self.windows.values():
+            janela.evict(inicio)
+
+    def add(self, ts: int, row: np.ndarray):
+        """Acrescenta uma amostra (timestamp em ns); amostras de baldes já fechados são ignoradas."""
+        with self.lock:
+            inicio = ts - ts % self.bucket_ns
+            if self._aberto is not None and inicio < self._aberto:
+                return
+            if inicio != self._aberto:
+                self._avancar(inicio)
+            self._ultimo_ts = ts if self._ultimo_ts is None else max(self._ultimo_ts, ts)
+            presentes = ~np.isnan(row)
+            if presentes.all():
+                # Caso comum (leitura completa): atualização sem indexação por máscara
+                self._n += 1
+                delta = row - self._media
+                self._media += delta / self._n
+                self._m2 += delta * (row - self._media)
+                np.minimum(self._min, row, out=self._min)
+                np.maximum(self._max, row, out=self._max)
+                self._exc += row > self.limits
+                return
+            valores = row[presentes]
+            self._n[presentes] += 1
+            delta = valores - self._media[presentes]
+            self._media[presentes] += delta / self._n[presentes]
+            self._m2[presentes] += delta * (valores - self._media[presentes])
+            self._min[presentes] = np.minimum(self._min[presentes], valores)
+            self._max[presentes] = np.maximum(self._max[presentes], valores)
+            self._exc[presentes] += valores > self.limits[presentes]
+
+    def load(self, timestamps: np.ndarray, valores: np.ndarray):
+        """
+        Recria o resumo a partir de amostras ordenadas (ex.: o anel de amostras
+        brutas na inicialização). Os baldes são calculados de forma vetorizada e
+        só as amostras da maior janela são consideradas.
+        """
+        with self.lock:
+            self.windows = {nome: RollingWindow(int(segundos * 1e9), self.bucket_ns, self.width)
+                            for nome, segundos in self.window_seconds.items()}
+            self._aberto = None
+            self._ultimo_ts = None
+            self._zerar_balde()
+            if len(timestamps) == 0:
+                return
+            maior = max(janela.window_ns for janela in self.windows.values())
+            inicio_ultimo = timestamps[-1] - timestamps[-1] % self.bucket_ns
+            manter = timestamps >= inicio_ultimo - maior
+            timestamps, valores = timestamps[manter], valores[manter]
+
+            inicios = timestamps - timestamps % self.bucket_ns
+            cortes = np.flatnonzero(np.r_[True, inicios[1:] != inicios[:-1]])
+            tamanhos = np.diff(np.r_[cortes, len(inicios)])
+            presentes = ~np.isnan(valores)
+            n = np.add.reduceat(presentes.astype(np.float64), cortes)
+            soma = np.add.reduceat(np.where(presentes, valores, 0.0), cortes)
+            media = np.divide(soma, n, out=np.zeros_like(soma), where=n > 0)
+            desvio = np.where(presentes, valores - np.repeat(media, tamanhos, axis=0), 0.0)
+            m2 = np.add.reduceat(desvio ** 2, cortes)
+            minimo = np.fmin.reduceat(valores, cortes)
+            maximo = np.fmax.reduceat(valores, cortes)
+            with np.errstate(invalid='ignore'):
+                excedencias = np.add.reduceat((valores > self.limits).astype(np.float64), cortes)
+            minimo = np.where(n > 0, minimo, np.inf)
+            maximo = np.where(n > 0, maximo, -np.inf)
+
+            # O último balde continua aberto; os demais vão direto para as janelas
+            inicios = inicios[cortes]
+            self._aberto = int(inicios[-1])
+            baldes = (n, media, m2, minimo, maximo, excedencias)
+            for janela in self.windows.values():
+                janela.load(inicios[:-1], tuple(arr[:-1] for arr in baldes), self._aberto)
+            self._n, self._media, self._m2, self._min, self._max, self._exc = (arr[-1].copy() for arr in baldes)
+            self._ultimo_ts = int(timestamps[-1])
+
+    @property
+    def latest_timestamp(self) -> Optional[pd.Timestamp]:
+        return pd.Timestamp(self._ultimo_ts) if self._ultimo_ts is not None else None
+
+    def stats(self, window: str) -> Dict[str, Dict[str, float]]:
+        """{coluna: {count, mean, std, min, max, exceedances, limit}} da janela pedida."""
+        with self.lock:
+            valores = self.windows[window].stats(self._balde_aberto())
+        return {
+            col: {**{nome: float(arr[j]) for nome, arr in valores.items()}, 'limit': float(self.limits[j])}
+            for j, col in enumerate(self.columns)
+        }
+
+    def report(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        return {nome: self.stats(nome) for nome in self.windows}
+
+
+def format_summary(summary: RollingSummary, titulo: str = "Resumo dos Dados") -> str:
+    """Texto do resumo exibido na aba Relatórios."""
+    ultimo = summary.latest_timestamp
+    if ultimo is None:
+        return f"--- {titulo} ---\n\nAinda não há leituras registradas."
+    linhas = [f"--- {titulo} (até {ultimo:%d/%m/%Y %H:%M}) ---"]
+    for nome, por_coluna in summary.report().items():
+        linhas.append(f"\n[{ROTULOS_JANELAS.get(nome, nome)}]")
+        for col, s in por_coluna.items():
+            rotulo = col.replace('_', ' ')
+            if s['count'] == 0:
+                linhas.append(f"{rotulo}: sem leituras")
+                continue
+            texto = (f"{rotulo}: média {s['mean']:.2f} ± {s['std']:.2f} | mín {s['min']:.2f} | "
+                     f"máx {s['max']:.2f} | {int(s['count'])} leitura(s)")
+            if not np.isnan(s['limit']):
+                percentual = 100.0 * s['exceedances'] / s['count']
+                texto += f" | acima do limite ({s['limit']:g}): {int(s['exceedances'])} ({percentual:.1f}%)"
+            linhas.append(texto)
+    return "\n".join(linhas)
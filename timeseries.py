@@ -0,0 +1,742 @@
+# timeseries.py (armazenamento residente em memória das séries temporais)
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from retention import tier_arrays
+
+logger = logging.getLogger(__name__)
+
+MINUTE_NS = 60_000_000_000
+HOUR_NS = 60 * MINUTE_NS
+DAY_NS = 24 * HOUR_NS
+
+
+class RingBuffer:
+    """
+    Buffer circular pré-alocado de linhas com largura fixa.
+
+    Cada linha é gravada duas vezes (nas posições `i` e `i + capacity`), de modo que
+    as `size` linhas mais recentes sempre formam uma fatia contígua do array e
+    podem ser expostas como view, sem cópia.
+    """
+    def __init__(self, capacity: int, width: int, dtype=np.float64, fill=np.nan):
+        self.capacity = capacity
+        self._data = np.full((2 * capacity, width), fill, dtype=dtype)
+        self._pos = 0
+        self.size = 0
+
+    def append(self, row: np.ndarray):
+        self._data[self._pos] = row
+        self._data[self._pos + self.capacity] = row
+        self._pos = (self._pos + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def view(self) -> np.ndarray:
+        """
+        Retorna as linhas em ordem cronológica como view somente-leitura. Com o anel
+        cheio, a view começa na posição do próximo `append`: cada gravação posterior
+        sobrescreve a linha mais antiga da view. Quem a guarda além da trava do dono
+        deve copiá-la.
+        """
+        end = self._pos + self.capacity
+        view = self._data[end - self.size:end]
+        view.flags.writeable = False
+        return view
+
+    def last(self) -> Optional[np.ndarray]:
+        if self.size == 0:
+            return None
+        return self._data[self._pos + self.capacity - 1]
+
+    def load(self, rows: np.ndarray):
+        """Substitui o conteúdo pelas linhas dadas (as mais recentes, se excederem a capacidade)."""
+        rows = np.asarray(rows)[-self.capacity:]
+        n = len(rows)
+        self._data[:n] = rows
+        self._data[self.capacity:self.capacity + n] = rows
+        self._pos = n % self.capacity
+        self.size = n
+
+
+class HourlyAggregator:
+    """
+    Agrega as amostras em baldes horários com média, mínimo, máximo e contagem por coluna.
+
+    Cada amostra atualiza apenas o balde aberto, em O(1). Quando chega uma amostra de
+    uma hora posterior, o balde é fechado: colunas sem amostras na hora repetem o
+    último valor fechado e as horas inteiras sem amostras entre dois baldes são
+    preenchidas por interpolação linear das médias.
+    """
+    STATS = ('mean', 'min', 'max', 'count')
+
+    def __init__(self, width: int, capacity: int):
+        self.width = width
+        self._ts = RingBuffer(capacity, 1, dtype=np.int64, fill=0)
+        self._rings = {stat: RingBuffer(capacity, width) for stat in self.STATS}
+        self._open_hour: Optional[int] = None
+        # Horas vazias entre o último balde fechado e o balde aberto
+        self._gap_hours = 0
+        self._reset_bucket()
+        self.version = 0
+
+    def _reset_bucket(self):
+        self._sum = np.zeros(self.width)
+        self._count = np.zeros(self.width)
+        self._min = np.full(self.width, np.inf)
+        self._max = np.full(self.width, -np.inf)
+
+    def __len__(self) -> int:
+        pendentes = self._gap_hours + 1 if self._open_hour is not None else 0
+        return self._ts.size + pendentes
+
+    def add(self, ts: int, row: np.ndarray) -> bool:
+        """Incorpora uma amostra; retorna True se alguma hora foi fechada."""
+        hora = ts - ts % HOUR_NS
+        fechou = False
+        if self._open_hour is None:
+            self._open_hour = hora
+        elif hora < self._open_hour:
+            logger.debug("Agregador horário: amostra de uma hora já fechada ignorada.")
+            return False
+        elif hora > self._open_hour:
+            self._close_bucket()
+            self._gap_hours = (hora - self._open_hour) // HOUR_NS - 1
+            self._open_hour = hora
+            self._reset_bucket()
+            fechou = True
+        presentes = ~np.isnan(row)
+        valores = row[presentes]
+        self._sum[presentes] += valores
+        self._count[presentes] += 1
+        self._min[presentes] = np.minimum(self._min[presentes], valores)
+        self._max[presentes] = np.maximum(self._max[presentes], valores)
+        return fechou
+
+    def _bucket_stats(self) -> Dict[str, np.ndarray]:
+        """Estatísticas do balde aberto, com as colunas vazias carregadas para frente."""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            stats = {
+                'mean': self._sum / self._count,
+                'min': np.where(self._count > 0, self._min, np.nan),
+                'max': np.where(self._count > 0, self._max, np.nan),
+                'count': self._count.copy(),
+            }
+        for stat in ('mean', 'min', 'max'):
+            ultima = self._rings[stat].last()
+            if ultima is not None:
+                faltantes = np.isnan(stats[stat])
+                stats[stat][faltantes] = ultima[faltantes]
+        return stats
+
+    def _gap_rows(self, direita: np.ndarray) -> np.ndarray:
+        """Médias interpoladas das horas vazias anteriores ao balde aberto."""
+        esquerda = self._rings['mean'].last()
+        if esquerda is None:
+            esquerda = direita
+        esquerda = np.where(np.isnan(esquerda), direita, esquerda)
+        pesos = np.arange(1, self._gap_hours + 1)[:, None] / (self._gap_hours + 1)
+        return esquerda + (direita - esquerda) * pesos
+
+    def _close_bucket(self):
+        stats = self._bucket_stats()
+        if self._gap_hours:
+            vazias = self._gap_rows(stats['mean'])
+            for k, linha in enumerate(vazias, start=1):
+                self._ts.append(self._open_hour - (self._gap_hours + 1 - k) * HOUR_NS)
+                self._rings['mean'].append(linha)
+                self._rings['min'].append(linha)
+                self._rings['max'].append(linha)
+                self._rings['count'].append(np.zeros(self.width))
+            self._gap_hours = 0
+        self._ts.append(self._open_hour)
+        for stat in self.STATS:
+            self._rings[stat].append(stats[stat])
+        self.version += 1
+
+    def snapshot(self) -> Dict[str, np.ndarray]:
+        """Arrays que reconstroem o agregador (horas fechadas e balde aberto)."""
+        estado = {f'hourly_{stat}': self._rings[stat].view() for stat in self.STATS}
+        estado.update({
+            'hourly_ts': self._ts.view()[:, 0],
+            'open_sum': self._sum, 'open_count': self._count, 'open_min': self._min, 'open_max': self._max,
+            'open_meta': np.array([
+                self._open_hour if self._open_hour is not None else -1, self._gap_hours, self.version
+            ], dtype=np.int64),
+        })
+        return estado
+
+    def restore(self, estado: Dict[str, np.ndarray]):
+        self._ts.load(np.asarray(estado['hourly_ts'])[:, None])
+        for stat in self.STATS:
+            self._rings[stat].load(estado[f'hourly_{stat}'])
+        self._sum = np.array(estado['open_sum'])
+        self._count = np.array(estado['open_count'])
+        self._min = np.array(estado['open_min'])
+        self._max = np.array(estado['open_max'])
+        open_hour, gap_hours, version = (int(v) for v in estado['open_meta'])
+        self._open_hour = open_hour if open_hour >= 0 else None
+        self._gap_hours = gap_hours
+        self.version = version
+
+    def load(self, inicios: np.ndarray, soma: np.ndarray, contagem: np.ndarray,
+             minimo: np.ndarray, maximo: np.ndarray):
+        """
+        Substitui o conteúdo por horas já agregadas (ex.: o nível horário da retenção),
+        com o mesmo preenchimento de `add`: colunas sem amostras repetem o último
+        valor e horas inteiras vazias recebem a interpolação linear das médias.
+        A última hora fica aberta para receber as amostras seguintes.
+        """
+        self._reset_bucket()
+        self._open_hour = None
+        self._gap_hours = 0
+        if len(inicios) == 0:
+            self._ts.load(np.empty((0, 1), dtype=np.int64))
+            for ring in self._rings.values():
+                ring.load(np.empty((0, self.width)))
+            return
+        grade = np.arange(inicios[0], inicios[-1] + HOUR_NS, HOUR_NS)
+        posicoes = (inicios - inicios[0]) // HOUR_NS
+        with np.errstate(invalid='ignore', divide='ignore'):
+            medias = np.where(contagem > 0, soma / contagem, np.nan)
+        stats = {}
+        for stat, valores in (('mean', medias), ('min', minimo), ('max', maximo)):
+            cheio = np.full((len(grade), self.width), np.nan)
+            cheio[posicoes] = pd.DataFrame(valores).ffill().to_numpy()
+            stats[stat] = cheio
+        stats['count'] = np.zeros((len(grade), self.width))
+        stats['count'][posicoes] = contagem
+        vazias = np.ones(len(grade), dtype=bool)
+        vazias[posicoes] = False
+        if vazias.any():
+            stats['mean'] = pd.DataFrame(stats['mean']).interpolate(limit_area='inside').to_numpy()
+            stats['min'][vazias] = stats['mean'][vazias]
+            stats['max'][vazias] = stats['mean'][vazias]
+        self._ts.load(grade[:-1, None])
+        for stat in self.STATS:
+            self._rings[stat].load(stats[stat][:-1])
+        self._open_hour = int(grade[-1])
+        self._sum, self._count = soma[-1].copy(), contagem[-1].copy()
+        self._min = np.where(contagem[-1] > 0, minimo[-1], np.inf)
+        self._max = np.where(contagem[-1] > 0, maximo[-1], -np.inf)
+        self.version += 1
+
+    def last_closed(self, stat: str = 'mean') -> Optional[np.ndarray]:
+        return self._rings[stat].last()
+
+    def frame_arrays(self, include_open: bool = True, stat: str = 'mean'):
+        """
+        Retorna (índice em ns, valores). Sem a hora aberta, ambos são views do anel;
+        com ela, a hora aberta e as horas vazias que a precedem são acrescentadas.
+        """
+        valores = self._rings[stat].view()
+        indice = self._ts.view()[:, 0]
+        if include_open and self._open_hour is not None:
+            stats = self._bucket_stats()
+            extras = [stats[stat]]
+            horas = [self._open_hour]
+            if self._gap_hours:
+                vazias = self._gap_rows(stats['mean'])
+                if stat == 'count':
+                    vazias = np.zeros_like(vazias)
+                extras = list(vazias) + extras
+                horas = [self._open_hour - (self._gap_hours + 1 - k) * HOUR_NS
+                         for k in range(1, self._gap_hours + 1)] + horas
+            valores = np.vstack([valores] + [np.atleast_2d(e) for e in extras])
+            indice = np.append(indice, horas)
+        return indice, valores
+
+
+# Níveis dos agregados do histórico: nome -> (largura do balde em ns, capacidade padrão em baldes)
+ROLLUP_LEVELS = {
+    'minute': (MINUTE_NS, 7 * 24 * 60),      # 7 dias
+    'hour': (HOUR_NS, 2 * 365 * 24),         # 2 anos
+    'day': (DAY_NS, 20 * 365),               # 20 anos
+}
+
+
+class RollupLevel:
+    """
+    Baldes de largura fixa com soma, contagem, mínimo e máximo por coluna.
+
+    Como no HourlyAggregator, a amostra atualiza só o balde aberto em O(1); ao
+    chegar uma amostra de um balde posterior, o aberto é gravado nos anéis.
+    Baldes sem amostras não são gravados (não há interpolação nesta visão).
+    """
+    STATS = ('sum', 'count', 'min', 'max')
+
+    def __init__(self, bucket_ns: int, capacity: int, width: int):
+        self.bucket_ns = bucket_ns
+        self.width = width
+        self._ts = RingBuffer(capacity, 1, dtype=np.int64, fill=0)
+        self._rings = {stat: RingBuffer(capacity, width) for stat in self.STATS}
+        self._open: Optional[int] = None
+        self._reset_bucket()
+
+    def _reset_bucket(self):
+        self._sum = np.zeros(self.width)
+        self._count = np.zeros(self.width)
+        self._min = np.full(self.width, np.inf)
+        self._max = np.full(self.width, -np.inf)
+
+    def add(self, ts: int, row: np.ndarray, presentes: np.ndarray):
+        inicio = ts - ts % self.bucket_ns
+        if self._open is None:
+            self._open = inicio
+        elif inicio < self._open:
+            return
+        elif inicio > self._open:
+            self._close_bucket()
+            self._open = inicio
+        valores = row[presentes]
+        self._sum[presentes] += valores
+        self._count[presentes] += 1
+        self._min[presentes] = np.minimum(self._min[presentes], valores)
+        self._max[presentes] = np.maximum(self._max[presentes], valores)
+
+    def _close_bucket(self):
+        self._ts.append(self._open)
+        for stat, valores in zip(self.STATS, self._bucket_arrays()):
+            self._rings[stat].append(valores)
+        self._reset_bucket()
+
+    def _bucket_arrays(self) -> Tuple[np.ndarray, ...]:
+        vazio = self._count == 0
+        return (self._sum, self._count, np.where(vazio, np.nan, self._min), np.where(vazio, np.nan, self._max))
+
+    @property
+    def oldest(self) -> Optional[int]:
+        """Início do balde mais antigo ainda retido (o anel descarta os mais velhos)."""
+        if self._ts.size:
+            return int(self._ts.view()[0, 0])
+        return self._open
+
+    def arrays(self, start: int, end: int) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """Baldes com início em [start, end), incluindo o balde aberto; views sempre que possível."""
+        indice = self._ts.view()[:, 0]
+        i0, i1 = np.searchsorted(indice, [start, end])
+        stats = {stat: self._rings[stat].view()[i0:i1] for stat in self.STATS}
+        indice = indice[i0:i1]
+        if self._open is not None and start <= self._open < end and self._count.any():
+            indice = np.append(indice, self._open)
+            for stat, valores in zip(self.STATS, self._bucket_arrays()):
+                stats[stat] = np.vstack([stats[stat], valores[None, :]])
+        return indice, stats
+
+    def snapshot(self, prefixo: str) -> Dict[str, np.ndarray]:
+        estado = {f'{prefixo}_{stat}': self._rings[stat].view() for stat in self.STATS}
+        estado[f'{prefixo}_ts'] = self._ts.view()[:, 0]
+        estado[f'{prefixo}_open'] = np.vstack([self._sum, self._count, self._min, self._max])
+        estado[f'{prefixo}_open_start'] = np.array([self._open if self._open is not None else -1], dtype=np.int64)
+        return estado
+
+    def load(self, timestamps: np.ndarray, valores: np.ndarray,
+             base: Optional[List[Tuple[np.ndarray, ...]]] = None):
+        """
+        Substitui o conteúdo pelos agregados de amostras ordenadas (carga vetorizada do
+        histórico). `base` são baldes já agregados (inícios, soma, contagem, mínimo,
+        máximo), de largura até a deste nível e anteriores às amostras, como os
+        níveis horário e diário da retenção.
+        """
+        self._reset_bucket()
+        self._open = None
+        partes = [_rebucket(*agregados, self.bucket_ns) for agregados in (base or []) if len(agregados[0])]
+        if len(timestamps):
+            presentes = ~np.isnan(valores)
+            partes.append((timestamps - timestamps % self.bucket_ns, np.where(presentes, valores, 0.0),
+                           presentes.astype(np.float64), valores, valores))
+        if not partes:
+            self._ts.load(np.empty((0, 1), dtype=np.int64))
+            for ring in self._rings.values():
+                ring.load(np.empty((0, self.width)))
+            return
+        inicios, soma, contagem, minimo, maximo = (np.concatenate(arrays) for arrays in zip(*partes))
+        if len(partes) > 1:
+            ordem = np.argsort(inicios, kind='stable')
+            inicios, soma, contagem, minimo, maximo = (a[ordem] for a in (inicios, soma, contagem, minimo, maximo))
+        inicios, soma, contagem, minimo, maximo = _rebucket(inicios, soma, contagem, minimo, maximo, self.bucket_ns)
+        # O último balde continua aberto para receber as próximas amostras
+        self._ts.load(inicios[:-1, None])
+        for stat, arr in zip(self.STATS, (soma, contagem, minimo, maximo)):
+            self._rings[stat].load(arr[:-1])
+        self._open = int(inicios[-1])
+        self._sum, self._count = soma[-1].copy(), contagem[-1].copy()
+        self._min = np.where(contagem[-1] > 0, minimo[-1], np.inf)
+        self._max = np.where(contagem[-1] > 0, maximo[-1], -np.inf)
+
+    def restore(self, estado: Dict[str, np.ndarray], prefixo: str):
+        self._ts.load(np.asarray(estado[f'{prefixo}_ts'])[:, None])
+        for stat in self.STATS:
+            self._rings[stat].load(estado[f'{prefixo}_{stat}'])
+        self._sum, self._count, self._min, self._max = (np.array(v) for v in estado[f'{prefixo}_open'])
+        inicio = int(estado[f'{prefixo}_open_start'][0])
+        self._open = inicio if inicio >= 0 else None
+
+
+def _rebucket(inicios: np.ndarray, soma: np.ndarray, contagem: np.ndarray, minimo: np.ndarray,
+              maximo: np.ndarray, bucket_ns: int) -> Tuple[np.ndarray, ...]:
+    """Reagrupa baldes ordenados em baldes de `bucket_ns`, combinando os de mesmo início."""
+    inicios = inicios - inicios % bucket_ns
+    cortes = np.flatnonzero(np.r_[True, inicios[1:] != inicios[:-1]])
+    return (inicios[cortes], np.add.reduceat(soma, cortes), np.add.reduceat(contagem, cortes),
+            np.fmin.reduceat(minimo, cortes), np.fmax.reduceat(maximo, cortes))
+
+
+class MultiResolutionRollup:
+    """
+    Agregados por minuto, hora e dia mantidos incrementalmente, usados pelas
+    consultas de intervalo do histórico. Cada consulta escolhe o nível mais fino
+    que ainda cobre a janela pedida sem exceder `max_buckets_per_pixel` baldes por
+    pixel, de modo que o custo depende da largura do gráfico e não do histórico.
+    """
+    def __init__(self, width: int, levels: Optional[Dict[str, Tuple[int, int]]] = None,
+                 max_buckets_per_pixel: int = 4):
+        self.width = width
+        self.max_buckets_per_pixel = max_buckets_per_pixel
+        self.levels = {nome: RollupLevel(bucket_ns, capacidade, width)
+                       for nome, (bucket_ns, capacidade) in (levels or ROLLUP_LEVELS).items()}
+
+    def add(self, ts: int, row: np.ndarray):
+        presentes = ~np.isnan(row)
+        for level in self.levels.values():
+            level.add(ts, row, presentes)
+
+    def load(self, timestamps: np.ndarray, valores: np.ndarray,
+             agregados: Optional[List[Tuple[int, Tuple[np.ndarray, ...]]]] = None):
+        """
+        Recarrega todos os níveis a partir de amostras ordenadas. `agregados` são
+        pares (largura do balde em ns, arrays de `retention.tier_arrays`) anteriores
+        às amostras; cada nível usa os que não são mais grossos que ele.
+        """
+        for level in self.levels.values():
+            base = [arrays for bucket_ns, arrays in (agregados or []) if bucket_ns <= level.bucket_ns]
+            level.load(timestamps, valores, base)
+
+    def choose_level(self, start: int, end: int, pixels: int) -> str:
+        nomes = sorted(self.levels, key=lambda nome: self.levels[nome].bucket_ns)
+        for nome in nomes:
+            level = self.levels[nome]
+            cobre = level.oldest is not None and level.oldest <= start
+            if cobre and (end - start) // level.bucket_ns <= pixels * self.max_buckets_per_pixel:
+                return nome
+        return nomes[-1]
+
+    def query(self, start: int, end: int, pixels: int, columns: List[int], mode: str = 'minmax'):
+        """
+        Retorna (nível, índice em ns, {estatística: valores}) para a janela [start, end).
+
+        - `minmax`: até `pixels` pontos com média, mínimo e máximo de cada faixa de tempo;
+        - `mean`: até `pixels` médias por faixa.
+        """
+        if mode not in ('minmax', 'mean'):
+            raise ValueError(f"Modo de consulta desconhecido: '{mode}'")
+        nome = self.choose_level(start, end, pixels)
+        indice, stats = self.levels[nome].arrays(start, end)
+        soma, contagem = stats['sum'][:, columns], stats['count'][:, columns]
+        minimos, maximos = stats['min'][:, columns], stats['max'][:, columns]
+
+        if len(indice) > pixels:
+            # Agrupa os baldes em `pixels` faixas de tempo iguais
+            grupos = np.searchsorted(indice, np.linspace(start, end, pixels + 1)[:-1])
+            grupos = np.unique(grupos[grupos < len(indice)])
+            indice = indice[grupos]
+            soma = np.add.reduceat(soma, grupos)
+            contagem = np.add.reduceat(contagem, grupos)
+            minimos = np.fmin.reduceat(minimos, grupos)
+            maximos = np.fmax.reduceat(maximos, grupos)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            resultado = {'mean': soma / contagem}
+        if mode == 'minmax':
+            resultado['min'], resultado['max'] = minimos, maximos
+        return nome, indice, resultado
+
+    def query_lttb(self, start: int, end: int, pixels: int, column: int):
+        """
+        Retorna (nível, índice em ns, médias) com até `pixels` pontos da série de
+        médias de uma coluna, escolhidos por LTTB a partir do nível mais fino disponível.
+        """
+        nome = self.choose_level(start, end, pixels)
+        indice, stats = self.levels[nome].arrays(start, end)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            medias = stats['sum'][:, column] / stats['count'][:, column]
+        selecionados = lttb(indice, medias, pixels)
+        return nome, indice[selecionados], medias[selecionados]
+
+    def snapshot(self) -> Dict[str, np.ndarray]:
+        estado = {}
+        for nome, level in self.levels.items():
+            estado.update(level.snapshot(f'rollup_{nome}'))
+        return estado
+
+    def restore(self, estado: Dict[str, np.ndarray]) -> bool:
+        """Recarrega os níveis; False se o estado não contém os agregados (checkpoint antigo)."""
+        if not all(f'rollup_{nome}_ts' in estado for nome in self.levels):
+            return False
+        for nome, level in self.levels.items():
+            level.restore(estado, f'rollup_{nome}')
+        return True
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: escolhe `n_out` índices que preservam a forma
+    visual da série. Valores NaN são ignorados.
+    """
+    validos = np.flatnonzero(~np.isnan(y))
+    n = len(validos)
+    if n_out >= n or n_out < 3:
+        return validos
+    xs = x[validos].astype(np.float64)
+    ys = y[validos]
+    selecionados = np.empty(n_out, dtype=np.intp)
+    selecionados[0], selecionados[-1] = 0, n - 1
+    limites = np.linspace(1, n - 1, n_out - 1).astype(np.intp)
+    a = 0
+    for i in range(n_out - 2):
+        inicio, fim = limites[i], limites[i + 1]
+        # Média do próximo balde (o último usa o ponto final)
+        prox_inicio, prox_fim = fim, (limites[i + 2] if i + 2 < len(limites) else n)
+        media_x = xs[prox_inicio:prox_fim].mean()
+        media_y = ys[prox_inicio:prox_fim].mean()
+        areas = np.abs((xs[a] - media_x) * (ys[inicio:fim] - ys[a])
+                       - (xs[a] - xs[inicio:fim]) * (media_y - ys[a]))
+        a = inicio + int(np.argmax(areas))
+        selecionados[i + 1] = a
+    return validos[selecionados]
+
+
+class TimeSeriesStore:
+    """
+    Séries residentes em memória, compartilhadas pela análise, pelo dashboard e pelos modelos.
+
+    Mantém um anel com as amostras brutas e a visão horária produzida pelo
+    HourlyAggregator, atualizada incrementalmente a cada amostra. Depois de carregado na inicialização, o
+    histórico é servido a partir da memória, sem acesso ao disco. Os agregados por
+    minuto/hora/dia (MultiResolutionRollup) atendem às consultas de intervalo do histórico.
+    """
+    def __init__(self, columns: List[str], raw_capacity: int = 200_000, hourly_capacity: int = 24 * 365,
+                 rollup_capacity: Optional[Dict[str, int]] = None):
+        self.columns = list(columns)
+        self._col_index = {col: i for i, col in enumerate(self.columns)}
+        width = len(self.columns)
+        self.lock = threading.RLock()
+
+        self._raw_ts = RingBuffer(raw_capacity, 1, dtype=np.int64, fill=0)
+        self._raw = RingBuffer(raw_capacity, width)
+        self._hourly = HourlyAggregator(width, hourly_capacity)
+        capacidades = rollup_capacity or {}
+        self._rollup_levels = {nome: (bucket_ns, capacidades.get(nome, capacidade))
+                               for nome, (bucket_ns, capacidade) in ROLLUP_LEVELS.items()}
+        self._rollups = MultiResolutionRollup(width, self._rollup_levels)
+
+        # Última observação válida de cada coluna (usada para "carregar para frente")
+        self._latest = np.full(width, np.nan)
+        self._latest_ts: Optional[int] = None
+        self.raw_version = 0
+        # Consumidores com `add(ts, row)` notificados a cada amostra aceita (ex.: o resumo móvel)
+        self._listeners: List[Any] = []
+
+    @property
+    def version(self) -> int:
+        """Incrementado a cada hora fechada na visão horária."""
+        return self._hourly.version
+
+    # --- Escrita -----------------------------------------------------------------
+
+    def _to_row(self, data: Dict[str, Any]) -> np.ndarray:
+        row = np.full(len(self.columns), np.nan)
+        for col, valor in data.items():
+            i = self._col_index.get(col)
+            if i is not None and valor is not None:
+                row[i] = valor
+        return row
+
+    def append(self, timestamp: Any, data: Dict[str, Any]):
+        """Acrescenta uma amostra bruta e atualiza a visão horária."""
+        ts = pd.Timestamp(timestamp).value
+        row = self._to_row(data)
+        with self.lock:
+            self._append_row(ts, row)
+
+    def extend(self, df: pd.DataFrame):
+        """Carrega um histórico ordenado (ex.: lido do armazenamento na inicialização)."""
+        if df.empty:
+            return
+        timestamps = pd.to_datetime(df['Timestamp']).to_numpy(dtype='datetime64[ns]').astype(np.int64)
+        valores = df.reindex(columns=self.columns).to_numpy(dtype=np.float64)
+        with self.lock:
+            for ts, row in zip(timestamps, valores):
+                self._append_row(int(ts), row)
+        logger.info(f"Séries em memória: {len(df)} amostra(s) carregada(s).")
+
+    def _append_row(self, ts: int, row: np.ndarray):
+        if self._latest_ts is not None and ts < self._latest_ts:
+            logger.debug("Séries em memória: amostra fora de ordem ignorada na visão horária.")
+            return
+        self._raw_ts.append(ts)
+        self._raw.append(row)
+        presentes = ~np.isnan(row)
+        self._latest[presentes] = row[presentes]
+        self._latest_ts = ts
+        self.raw_version += 1
+        self._hourly.add(ts, row)
+        self._rollups.add(ts, row)
+        for listener in self._listeners:
+            listener.add(ts, row)
+
+    def add_listener(self, listener: Any):
+        with self.lock:
+            self._listeners.append(listener)
+
+    def snapshot(self) -> Dict[str, np.ndarray]:
+        """Cópia consistente do estado em memória, para checkpoint."""
+        with self.lock:
+            estado = {
+                'raw_ts': self._raw_ts.view()[:, 0], 'raw': self._raw.view(), 'latest': self._latest,
+                'latest_meta': np.array([
+                    self._latest_ts if self._latest_ts is not None else -1, self.raw_version
+                ], dtype=np.int64),
+            }
+            estado.update(self._hourly.snapshot())
+            estado.update(self._rollups.snapshot())
+            return {nome: np.array(valor) for nome, valor in estado.items()}
+
+    def restore(self, estado: Dict[str, np.ndarray]) -> bool:
+        """
+        Recarrega um estado produzido por `snapshot` (ex.: lido de um checkpoint).
+        Retorna False se o estado não trouxe os agregados do histórico (ver `rebuild_rollups`).
+        """
+        with self.lock:
+            self._raw_ts.load(np.asarray(estado['raw_ts'])[:, None])
+            self._raw.load(estado['raw'])
+            self._latest = np.array(estado['latest'])
+            latest_ts, raw_version = (int(v) for v in estado['latest_meta'])
+            self._latest_ts = latest_ts if latest_ts >= 0 else None
+            self.raw_version = raw_version
+            self._hourly.restore(estado)
+            return self._rollups.restore(estado)
+
+    def _tier_buckets(self, hourly: Optional[pd.DataFrame],
+                      daily: Optional[pd.DataFrame]) -> List[Tuple[int, Tuple[np.ndarray, ...]]]:
+        agregados = []
+        for bucket_ns, tier in ((DAY_NS, daily), (HOUR_NS, hourly)):
+            if tier is not None and not tier.empty:
+                agregados.append((bucket_ns, tier_arrays(tier, self.columns)))
+        return agregados
+
+    def load_tiers(self, hourly: Optional[pd.DataFrame], daily: Optional[pd.DataFrame] = None):
+        """
+        Carrega os níveis agregados da retenção (ver retention.py), anteriores às
+        amostras brutas; deve ser chamado antes de `extend`. O nível horário
+        alimenta a visão horária usada pelos modelos; os dois níveis alimentam os
+        agregados do histórico.
+        """
+        agregados = self._tier_buckets(hourly, daily)
+        if not agregados:
+            return
+        with self.lock:
+            if hourly is not None and not hourly.empty:
+                self._hourly.load(*tier_arrays(hourly, self.columns))
+            self._rollups.load(np.empty(0, dtype=np.int64), np.empty((0, len(self.columns))), agregados)
+        logger.info(f"Séries em memória: {len(hourly) if hourly is not None else 0} hora(s) e "
+                    f"{len(daily) if daily is not None else 0} dia(s) carregados dos níveis de retenção.")
+
+    def rebuild_rollups(self, df: pd.DataFrame, hourly: Optional[pd.DataFrame] = None,
+                        daily: Optional[pd.DataFrame] = None):
+        """Recalcula os agregados do histórico a partir de um DataFrame ordenado e dos níveis de retenção."""
+        rollups = MultiResolutionRollup(len(self.columns), self._rollup_levels)
+        timestamps = np.empty(0, dtype=np.int64)
+        valores = np.empty((0, len(self.columns)))
+        if not df.empty:
+            timestamps = pd.to_datetime(df['Timestamp']).to_numpy(dtype='datetime64[ns]').astype(np.int64)
+            valores = df.reindex(columns=self.columns).to_numpy(dtype=np.float64)
+        rollups.load(timestamps, valores, self._tier_buckets(hourly, daily))
+        with self.lock:
+            self._rollups = rollups
+
+    # --- Leitura -----------------------------------------------------------------
+
+    def __len__(self) -> int:
+        return len(self._hourly)
+
+    def latest(self) -> Dict[str, float]:
+        """Última observação válida de cada coluna."""
+        with self.lock:
+            return {col: self._latest[i] for i, col in enumerate(self.columns) if not np.isnan(self._latest[i])}
+
+    def latest_timestamp(self) -> Optional[pd.Timestamp]:
+        with self.lock:
+            return pd.Timestamp(self._latest_ts) if self._latest_ts is not None else None
+
+    def raw_view(self) -> np.ndarray:
+        """View (sem cópia) das amostras brutas, uma coluna por feature."""
+        with self.lock:
+            return self._raw.view()
+
+    def raw_arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Timestamps (ns) e valores das amostras brutas retidas, como views."""
+        with self.lock:
+            return self._raw_ts.view()[:, 0], self._raw.view()
+
+    def range_query(self, start: Any, end: Any, pixels: int, columns: Optional[List[str]] = None,
+                    mode: str = 'minmax') -> pd.DataFrame:
+        """
+        Consulta reamostrada do histórico em [start, end) com até `pixels` pontos por coluna.
+
+        `minmax` retorna, para cada coluna, `<col>` (média), `<col>_min` e `<col>_max`;
+        `mean` retorna só as médias; `lttb` retorna as médias nos pontos escolhidos
+        pelo LTTB (cada coluna com os seus instantes; os demais ficam NaN).
+        O nível usado (minute, hour ou day) fica em `df.attrs['nivel']`.
+        """
+        columns = list(columns or self.columns)
+        posicoes = [self._col_index[col] for col in columns]
+        start_ns, end_ns = pd.Timestamp(start).value, pd.Timestamp(end).value
+        with self.lock:
+            if mode == 'lttb':
+                series = {}
+                nivel = None
+                for col, pos in zip(columns, posicoes):
+                    nivel, indice, valores = self._rollups.query_lttb(start_ns, end_ns, pixels, pos)
+                    series[col] = pd.Series(valores, index=pd.DatetimeIndex(indice.view('datetime64[ns]')))
+                df = pd.DataFrame(series, columns=columns)
+            else:
+                nivel, indice, stats = self._rollups.query(start_ns, end_ns, pixels, posicoes, mode)
+                dados = {col: stats['mean'][:, j] for j, col in enumerate(columns)}
+                if mode == 'minmax':
+                    for j, col in enumerate(columns):
+                        dados[f'{col}_min'] = stats['min'][:, j]
+                        dados[f'{col}_max'] = stats['max'][:, j]
+                df = pd.DataFrame(dados, index=pd.DatetimeIndex(indice.view('datetime64[ns]')))
+        df.index.name = 'Timestamp'
+        df.attrs['nivel'] = nivel
+        return df
+
+    def history_bounds(self) -> Optional[Tuple[pd.Timestamp, pd.Timestamp]]:
+        """Primeiro e último instante cobertos pelos agregados do histórico."""
+        with self.lock:
+            level = max(self._rollups.levels.values(), key=lambda nivel: nivel.bucket_ns)
+            if level.oldest is None or self._latest_ts is None:
+                return None
+            return pd.Timestamp(level.oldest), pd.Timestamp(self._latest_ts)
+
+    def hourly_frame(self, include_open: bool = True, stat: str = 'mean', copy: bool = False) -> pd.DataFrame:
+        """
+        Visão horária (`mean`, `min`, `max` ou `count`) como DataFrame. As horas
+        fechadas são uma view do anel; a hora aberta, quando incluída, é
+        acrescentada como última linha parcial.
+
+        A view só é estável enquanto nenhuma hora é fechada (ver `RingBuffer.view`):
+        quem usa o DataFrame por mais tempo, como o treino e a seleção de modelos,
+        pede `copy=True`.
+        """
+        with self.lock:
+            indice, valores = self._hourly.frame_arrays(include_open, stat)
+            if copy:
+                indice, valores = np.array(indice), np.array(valores)
+        index = pd.DatetimeIndex(indice.view('datetime64[ns]'), name='Timestamp', freq='h')
+        return pd.DataFrame(valores, index=index, columns=self.columns, copy=False)
@@ -0,0 +1,120 @@
+# training.py (política de treinamento do classificador de qualidade do ar)
+# -*- coding: utf-8 -*-
+
+import logging
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class TrainingPolicy:
+    """
+    Decide quando e com quais linhas o classificador é retreinado.
+
+    Políticas de seleção (no máximo `max_rows` linhas):
+    - `sliding_window`: as linhas mais recentes;
+    - `reservoir`: amostra uniforme de todo o histórico, mantida incrementalmente;
+    - `stratified`: as linhas mais recentes de cada classe, em cotas iguais.
+
+    O retreinamento só acontece quando chegaram `min_new_rows` linhas rotuladas
+    desde o último treino ou quando a acurácia nas linhas novas cai abaixo de
+    `min_accuracy`. Cada treino é registrado em `history` (duração e tamanho).
+    """
+    POLICIES = ('sliding_window', 'reservoir', 'stratified')
+
+    def __init__(self, config: dict, feature_columns: List[str], target_column: str):
+        self.policy = config.get('policy', 'sliding_window')
+        if self.policy not in self.POLICIES:
+            raise ValueError(f"Política de treinamento desconhecida: '{self.policy}'")
+        self.max_rows = config.get('max_rows', 5000)
+        self.min_new_rows = config.get('min_new_rows', 24)
+        self.validation_rows = config.get('validation_rows', 48)
+        self.min_accuracy = config.get('min_accuracy', 0.9)
+        self.feature_columns = feature_columns
+        self.target_column = target_column
+
+        self.last_trained_timestamp: Optional[pd.Timestamp] = None
+        self.history: deque = deque(maxlen=config.get('history_size', 100))
+        self._reservoir: List[pd.Series] = []
+        self._reservoir_seen = 0
+        self._reservoir_last: Optional[pd.Timestamp] = None
+        self._rng = np.random.default_rng()
+
+    def _labeled(self, df: pd.DataFrame) -> pd.DataFrame:
+        return df[self.feature_columns + [self.target_column]].dropna()
+
+    def _new_rows(self, df_labeled: pd.DataFrame) -> pd.DataFrame:
+        if self.last_trained_timestamp is None:
+            return df_labeled
+        return df_labeled[df_labeled.index > self.last_trained_timestamp]
+
+    def should_retrain(self, df: pd.DataFrame, pipeline: Any) -> Tuple[bool, str]:
+        """Retorna (retreinar?, motivo)."""
+        if not pipeline.is_trained:
+            return True, 'modelo não treinado'
+        novas = self._new_rows(self._labeled(df))
+        if len(novas) >= self.min_new_rows:
+            return True, f'{len(novas)} novas linhas rotuladas'
+        validacao = novas.tail(self.validation_rows)
+        if len(validacao) > 0:
+            previsto = pipeline.predict_batch(validacao[self.feature_columns].to_numpy(dtype=np.float64))
+            acuracia = float(np.mean(previsto == validacao[self.target_column].to_numpy()))
+            if acuracia < self.min_accuracy:
+                return True, f'acurácia recente de {acuracia:.2f}'
+        return False, ''
+
+    def select(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Seleciona no máximo `max_rows` linhas rotuladas conforme a política."""
+        df_labeled = self._labeled(df)
+        if self.policy == 'sliding_window':
+            return df_labeled.tail(self.max_rows)
+        if self.policy == 'reservoir':
+            return self._update_reservoir(df_labeled)
+        cota = max(self.max_rows // max(df_labeled[self.target_column].nunique(), 1), 1)
+        return df_labeled.groupby(self.target_column, group_keys=False).tail(cota).sort_index()
+
+    def _update_reservoir(self, df_labeled: pd.DataFrame) -> pd.DataFrame:
+        """Algoritmo R aplicado apenas às linhas ainda não vistas."""
+        if self._reservoir_last is not None:
+            df_labeled = df_labeled[df_labeled.index > self._reservoir_last]
+        if not df_labeled.empty:
+            self._reservoir_last = df_labeled.index[-1]
+        for _, row in df_labeled.iterrows():
+            self._reservoir_seen += 1
+            if len(self._reservoir) < self.max_rows:
+                self._reservoir.append(row)
+            else:
+                j = self._rng.integers(0, self._reservoir_seen)
+                if j < self.max_rows:
+                    self._reservoir[j] = row
+        if not self._reservoir:
+            return df_labeled
+        return pd.DataFrame(self._reservoir).infer_objects().sort_index()
+
+    def fit(self, pipeline: Any, df: pd.DataFrame, reason: str) -> bool:
+        """Treina `pipeline` com as linhas selecionadas e registra o tempo e o tamanho."""
+        df_train = self.select(df)
+        inicio = time.perf_counter()
+        treinado = pipeline.train(df_train)
+        duracao = time.perf_counter() - inicio
+        if treinado:
+            self.last_trained_timestamp = self._labeled(df).index[-1]
+        self.history.append({
+            'timestamp': pd.Timestamp.now(),
+            'politica': self.policy,
+            'motivo': reason,
+            'linhas': len(df_train),
+            'duracao_s': duracao,
+            'sucesso': treinado,
+        })
+        logger.info(f"IA - Árvore de Decisão: treino ({reason}) com {len(df_train)} linha(s) "
+                    f"em {duracao * 1000:.1f} ms.")
+        return treinado
+
+    def last_run(self) -> Optional[Dict[str, Any]]:
+        return self.history[-1] if self.history else None
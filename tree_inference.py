@@ -0,0 +1,92 @@
+# tree_inference.py (inferência rápida da Árvore de Decisão treinada)
+# -*- coding: utf-8 -*-
+
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class CompiledTree:
+    """
+    Representação plana de uma árvore de decisão treinada.
+
+    Guarda os arrays `feature`, `threshold`, `left`, `right` e a classe de cada
+    folha, exportados do `tree_` do scikit-learn. A predição percorre os arrays
+    diretamente, sem DataFrames, validação do scikit-learn ou LabelEncoder.
+
+    Valores ausentes (NaN) seguem, em cada nó, o lado de `missing_left`, exportado
+    de `missing_go_to_left` (scikit-learn >= 1.3), como na predição do scikit-learn.
+    """
+    ARRAYS = ('feature', 'threshold', 'left', 'right', 'leaf_class', 'missing_left')
+
+    def __init__(self, feature: np.ndarray, threshold: np.ndarray, left: np.ndarray,
+                 right: np.ndarray, leaf_class: np.ndarray, classes: np.ndarray, max_depth: int,
+                 missing_left: Optional[np.ndarray] = None):
+        self.feature = np.asarray(feature, dtype=np.intp)
+        self.threshold = np.asarray(threshold, dtype=np.float64)
+        self.left = np.asarray(left, dtype=np.intp)
+        self.right = np.asarray(right, dtype=np.intp)
+        self.leaf_class = np.asarray(leaf_class, dtype=np.intp)
+        # Sem a informação (scikit-learn antigo ou checkpoint anterior), NaN segue à direita
+        self.missing_left = np.asarray(missing_left, dtype=bool) if missing_left is not None \
+            else np.zeros(len(self.feature), dtype=bool)
+        self.classes = np.asarray(classes, dtype=object)
+        self.max_depth = int(max_depth)
+        # Cópias em listas para o caminho escalar (acesso por índice mais barato que no NumPy)
+        self._feature_list = self.feature.tolist()
+        self._threshold_list = self.threshold.tolist()
+        self._left_list = self.left.tolist()
+        self._right_list = self.right.tolist()
+        self._missing_left_list = self.missing_left.tolist()
+        self._labels_list = self.classes[self.leaf_class].tolist()
+
+    @classmethod
+    def from_sklearn(cls, model: Any, encoder: Any) -> 'CompiledTree':
+        """Exporta um `DecisionTreeClassifier` treinado e o `LabelEncoder` do alvo."""
+        tree = model.tree_
+        leaf_class = np.argmax(tree.value[:, 0, :], axis=1)
+        # model.classes_ são os códigos do encoder; traduz para os rótulos originais
+        classes = encoder.inverse_transform(model.classes_.astype(int))
+        return cls(tree.feature, tree.threshold, tree.children_left, tree.children_right,
+                   leaf_class, classes, tree.max_depth, getattr(tree, 'missing_go_to_left', None))
+
+    def to_state(self) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+        """Retorna (arrays, metadados) para persistência em checkpoint."""
+        arrays = {nome: getattr(self, nome) for nome in self.ARRAYS}
+        return arrays, {'classes': [str(c) for c in self.classes], 'max_depth': self.max_depth}
+
+    @classmethod
+    def from_state(cls, arrays: Dict[str, np.ndarray], meta: Dict[str, Any]) -> 'CompiledTree':
+        # Cópias: os arrays podem vir de um checkpoint em memory-map
+        missing_left = np.array(arrays['missing_left']) if 'missing_left' in arrays else None
+        return cls(*(np.array(arrays[nome]) for nome in cls.ARRAYS[:-1]), meta['classes'], meta['max_depth'],
+                   missing_left)
+
+    def predict_row(self, row: Sequence[float]) -> str:
+        """Classifica uma única linha de features (lista, tupla ou array 1-D)."""
+        left = self._left_list
+        node = 0
+        while left[node] != -1:
+            valor = row[self._feature_list[node]]
+            if valor <= self._threshold_list[node] or (valor != valor and self._missing_left_list[node]):
+                node = left[node]
+            else:
+                node = self._right_list[node]
+        return self._labels_list[node]
+
+    def predict_batch(self, X: np.ndarray) -> np.ndarray:
+        """Classifica um lote (n, n_features) percorrendo a árvore nível a nível."""
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X[None, :]
+        linhas = np.arange(X.shape[0])
+        node = np.zeros(X.shape[0], dtype=np.intp)
+        for _ in range(self.max_depth):
+            folha = self.left[node] == -1
+            if folha.all():
+                break
+            valores = X[linhas, self.feature[node]]
+            esquerda = np.where(np.isnan(valores), self.missing_left[node], valores <= self.threshold[node])
+            proximo = np.where(esquerda, self.left[node], self.right[node])
+            node = np.where(folha, node, proximo)
+        return self.classes[self.leaf_class[node]]